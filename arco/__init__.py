@@ -8,3 +8,13 @@ __license__ = "Apache"
 __maintainer__ = "Fabian Peter"
 __email__ = "fabian@p3r.link"
 __status__ = "Production"
+
+
+def __getattr__(name):
+    # Imported on first use, `python -m arco.shell` must not pay for it
+    if name in ["ArcoContext", "ArcoError"]:
+        from . import context
+
+        return getattr(context, name)
+
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,216 @@
+import sys
+import json
+import time
+import shlex
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from loguru import logger
+from .metrics import getMetrics
+from .process import Supervisor, timeout_returncode
+
+batch_commands = ["run", "x", "config"]
+
+
+def _normalizeStep(entry) -> dict:
+    if isinstance(entry, str):
+        entry = shlex.split(entry, comments=True)
+
+    if isinstance(entry, dict):
+        args = entry.get("args") or []
+
+        if isinstance(args, str):
+            args = shlex.split(args)
+
+        entry = [entry.get("command")] + list(args)
+
+    argv = [str(arg) for arg in entry]
+
+    # Allow steps copied from a shell script
+    if argv and argv[0] == "arco":
+        argv = argv[1:]
+
+    if not argv or argv[0] not in batch_commands:
+        raise ValueError(
+            f"Invalid step {entry!r}, steps start with one of {', '.join(batch_commands)}"
+        )
+
+    return {"command": argv[0], "args": argv[1:], "line": shlex.join(argv)}
+
+
+def parseSteps(text: str) -> list:
+    """
+    Parse the steps of `arco batch`
+
+    Either a JSON document (a list of steps, or a dict with `steps`) or
+    one step per line. A step is a command line like `x kubectl get pods`,
+    a JSON list of arguments or a dict with `command` and `args`. In the
+    line format, empty lines and comments (#) are ignored.
+    """
+    stripped = text.strip()
+
+    if stripped.startswith("{") or stripped.startswith("["):
+        try:
+            document = json.loads(stripped)
+        except ValueError:
+            # Not one JSON document, e.g. several lines of JSON lists
+            document = None
+
+        if isinstance(document, dict):
+            document = document.get("steps") or []
+
+        if isinstance(document, list):
+            return [_normalizeStep(entry) for entry in document]
+
+    steps = []
+
+    for number, line in enumerate(text.splitlines(), 1):
+        line = line.strip()
+
+        if not line or line.startswith("#"):
+            continue
+
+        try:
+            entry = json.loads(line) if line.startswith("[") else line
+            steps.append(_normalizeStep(entry))
+        except ValueError as e:
+            raise ValueError(f"Line {number}: {e}")
+
+    return steps
+
+
+class PrefixedStream:
+    """
+    A file-like object that prefixes every line with `prefix`
+
+    Writes of concurrent steps share `lock` so their lines don't mix.
+    """
+
+    def __init__(self, prefix: str, lock, stream=None):
+        self.prefix = prefix
+        self.lock = lock
+        self.stream = stream or sys.stdout
+        self.buffer = ""
+
+    def write(self, data: str):
+        self.buffer += data
+
+        if "\n" not in self.buffer:
+            return
+
+        lines, self.buffer = self.buffer.rsplit("\n", 1)
+
+        with self.lock:
+            for line in lines.split("\n"):
+                self.stream.write(f"{self.prefix}{line}\n")
+
+            self.stream.flush()
+
+    def flush(self):
+        if self.buffer:
+            with self.lock:
+                self.stream.write(f"{self.prefix}{self.buffer}\n")
+                self.stream.flush()
+
+            self.buffer = ""
+
+
+def runCommand(
+    context,
+    command_list,
+    stream=None,
+    env: dict = None,
+    timeout: float = None,
+    grace_period: float = None,
+):
+    """
+    Run `command_list` in `context`, passing its output through `stream`
+    (inherits stdout if None)
+
+    Returns (returncode, metrics), returncode is timeout_returncode if
+    the command was stopped after `timeout` seconds.
+    """
+    if stream is None:
+        result = context.run(
+            command_list, env=env, timeout=timeout, grace_period=grace_period
+        )
+
+        return result.returncode, result.metrics
+
+    process = context.popen(
+        command_list,
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+    )
+
+    with Supervisor(process, timeout, grace_period) as supervisor:
+        for line in process.stdout:
+            stream.write(line)
+
+        stream.flush()
+        returncode = process.wait()
+
+    if supervisor.timed_out:
+        returncode = timeout_returncode
+
+    return returncode, getMetrics(process)
+
+
+def runBatch(steps: list, runStep, jobs: int = 1, keep_going: bool = False) -> list:
+    """
+    Run `steps` with `runStep(step, stream)`, at most `jobs` at a time
+
+    With jobs > 1 the output of each step is prefixed with its number.
+    Unless `keep_going` is set, no new steps are started after a failure.
+
+    Returns one {"status", "returncode", "duration"} per step where
+    status is one of ok, failed or skipped.
+    """
+    results = [{"status": "skipped", "returncode": None, "duration": None} for _ in steps]
+    lock = threading.Lock()
+
+    def execute(index):
+        step = steps[index]
+        stream = None
+        started = time.monotonic()
+
+        if jobs > 1:
+            stream = PrefixedStream(f"[{index + 1}] ", lock)
+
+        logger.info(f"Running step {index + 1}: {step['line']}")
+
+        try:
+            returncode = runStep(step, stream)
+        except Exception as e:
+            logger.error(f"Step {index + 1} failed: {e}")
+            returncode = 1
+
+        results[index]["returncode"] = returncode
+        results[index]["duration"] = time.monotonic() - started
+        results[index]["status"] = "ok" if returncode == 0 else "failed"
+
+        if returncode != 0:
+            logger.error(f"Step {index + 1} returned exit code {returncode}")
+
+        return returncode
+
+    pending = list(range(len(steps)))
+    failed = False
+
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        running = set()
+
+        while pending or running:
+            while pending and len(running) < max(1, jobs) and not failed:
+                running.add(executor.submit(execute, pending.pop(0)))
+
+            if not running:
+                break
+
+            done, running = wait(running, return_when=FIRST_COMPLETED)
+
+            if any(future.result() != 0 for future in done) and not keep_going:
+                failed = True
+
+    return results
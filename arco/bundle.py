@@ -0,0 +1,113 @@
+"""
+Pre-resolved context bundles
+
+A bundle holds the resolved context, its rendered environment and the
+files arco mounts, so CI jobs can load a context without discovery,
+git calls or YAML parsing. The file is a header line with the format
+version and the SHA-256 of the zlib-compressed JSON payload that follows.
+
+The paths in a bundle (code_dir, context_dir, ...) are those of the job
+that created it, later jobs need the same checkout location.
+"""
+
+import os
+import json
+import zlib
+import hashlib
+import datetime
+from io import StringIO
+from .context import ArcoError, getVersion
+from .serialize import flattenEnvironment, writeYAML
+
+bundle_magic = b"ARCO-BUNDLE"
+bundle_format = 1
+
+
+def renderYAML(data) -> str:
+    stream = StringIO()
+    writeYAML(data, stream)
+
+    return stream.getvalue()
+
+
+def createBundle(context) -> dict:
+    """
+    Render everything `context` needs at runtime into a bundle
+    """
+    resolved = dict(context.resolve().items())
+
+    # The mountpoint of this process is gone once it exits
+    resolved["arco"] = dict(resolved["arco"])
+    resolved["arco"].pop("mountpoint", None)
+
+    mounts = {"context": renderYAML(resolved)}
+    inventory = (resolved.get("ansible") or {}).get("inventory")
+
+    if inventory:
+        mounts["inventory"] = renderYAML(inventory)
+
+    return {
+        "format": bundle_format,
+        "version": getVersion(),
+        "created": datetime.datetime.utcnow().isoformat(),
+        "context": resolved,
+        "dotenv": dict(context.dotenv()),
+        "env": {key: str(value) for key, value in flattenEnvironment(resolved)},
+        "mounts": mounts,
+    }
+
+
+def writeBundle(bundle: dict, path: str) -> str:
+    """
+    Write `bundle` to `path`, returns its checksum
+    """
+    payload = zlib.compress(
+        json.dumps(bundle, separators=(",", ":"), default=str).encode(), 9
+    )
+    checksum = hashlib.sha256(payload).hexdigest()
+    header = b"%s/%d sha256:%s\n" % (bundle_magic, bundle_format, checksum.encode())
+
+    with open(path, "wb") as file_:
+        file_.write(header + payload)
+
+    return checksum
+
+
+def readBundle(path: str) -> dict:
+    """
+    Load and verify a bundle written by writeBundle()
+
+    Raises ArcoError if the file is no bundle, has an unsupported format
+    or doesn't match its checksum.
+    """
+    try:
+        with open(path, "rb") as file_:
+            header = file_.readline().strip()
+            payload = file_.read()
+    except OSError as e:
+        raise ArcoError(f"Can't read bundle {path}: {e}")
+
+    try:
+        kind, checksum = header.split(b" ", 1)
+        magic, version = kind.split(b"/", 1)
+        version = int(version)
+        checksum = checksum.split(b":", 1)[1].decode()
+    except (ValueError, IndexError):
+        raise ArcoError(f"{path} is not an arco bundle")
+
+    if magic != bundle_magic:
+        raise ArcoError(f"{path} is not an arco bundle")
+
+    if version != bundle_format:
+        raise ArcoError(
+            f"Bundle {path} has format {version}, this arco reads format {bundle_format}"
+        )
+
+    if hashlib.sha256(payload).hexdigest() != checksum:
+        raise ArcoError(f"Bundle {path} is corrupt, its checksum doesn't match")
+
+    bundle = json.loads(zlib.decompress(payload))
+    bundle["checksum"] = checksum
+    bundle["path"] = os.path.abspath(path)
+
+    return bundle
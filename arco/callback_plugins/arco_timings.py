@@ -0,0 +1,96 @@
+"""
+Ansible callback that appends the duration of every task as a JSON line
+to the file in ARCO_TASK_TIMINGS
+
+arco enables it for `x ansible-playbook`, tasks are timed from their
+start to the start of the next task like profile_tasks does.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import os
+import json
+import time
+
+from ansible.plugins.callback import CallbackBase
+
+DOCUMENTATION = """
+    name: arco_timings
+    type: aggregate
+    short_description: Write task durations as JSON lines for arco
+    description:
+      - Appends one JSON object per task to the file in ARCO_TASK_TIMINGS
+    requirements:
+      - enable in configuration
+"""
+
+
+class CallbackModule(CallbackBase):
+    CALLBACK_VERSION = 2.0
+    CALLBACK_TYPE = "aggregate"
+    CALLBACK_NAME = "arco_timings"
+    CALLBACK_NEEDS_ENABLED = True
+
+    def __init__(self, *args, **kwargs):
+        super(CallbackModule, self).__init__(*args, **kwargs)
+
+        self.path = os.environ.get("ARCO_TASK_TIMINGS")
+        self.play = None
+        self.current = None
+        self.records = []
+
+    def _finishTask(self):
+        if self.current is None:
+            return
+
+        self.current["duration"] = time.time() - self.current.pop("started")
+        self.records.append(self.current)
+        self.current = None
+
+    def _countHost(self, status):
+        if self.current is not None:
+            self.current["hosts"][status] = self.current["hosts"].get(status, 0) + 1
+
+    def v2_playbook_on_play_start(self, play):
+        self._finishTask()
+        self.play = play.get_name().strip()
+
+    def v2_playbook_on_task_start(self, task, is_conditional):
+        self._finishTask()
+        self.current = {
+            "play": self.play,
+            "task": task.get_name().strip(),
+            "path": task.get_path(),
+            "pid": os.getpid(),
+            "started": time.time(),
+            "hosts": {},
+        }
+
+    def v2_playbook_on_handler_task_start(self, task):
+        self.v2_playbook_on_task_start(task, False)
+
+    def v2_runner_on_ok(self, result):
+        self._countHost("ok")
+
+    def v2_runner_on_failed(self, result, ignore_errors=False):
+        self._countHost("ignored" if ignore_errors else "failed")
+
+    def v2_runner_on_skipped(self, result):
+        self._countHost("skipped")
+
+    def v2_runner_on_unreachable(self, result):
+        self._countHost("unreachable")
+
+    def v2_playbook_on_stats(self, stats):
+        self._finishTask()
+
+        if not self.path or not self.records:
+            return
+
+        # One write for all tasks, sharded runs append to the same file
+        with open(self.path, "a") as file_:
+            file_.write("".join(json.dumps(record) + "\n" for record in self.records))
+
+        self.records = []
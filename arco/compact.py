@@ -0,0 +1,178 @@
+"""
+Compact in-memory representation of contexts
+
+Loaded layers are converted once to read-only dicts and lists with
+interned keys and short strings, and small identical subtrees (e.g. the
+same hostvars for many hosts) are stored once. mergeTrees() builds the
+resolved context by copying only the dicts on paths that several layers
+define and shares everything else, so a context is not copied per layer
+and per merge. copyTree() makes a copy that can be modified.
+"""
+
+import sys
+
+# Longer strings are rarely repeated, interning them would only grow the table
+max_intern_length = 128
+
+# Subtrees with at most this many scalar items are deduplicated
+max_shared_size = 16
+
+_scalars = (str, int, float, bool, type(None))
+
+
+def _readOnly(self, *args, **kwargs):
+    raise TypeError("The context is read-only, modify a copy (resolve(copy=True))")
+
+
+class FrozenDict(dict):
+    """
+    A dict of a compact tree, shared with others and therefore read-only
+    """
+
+    __slots__ = ()
+
+    __setitem__ = __delitem__ = __ior__ = _readOnly
+    clear = pop = popitem = setdefault = update = _readOnly
+
+    def __copy__(self):
+        return dict(self)
+
+    def __deepcopy__(self, memo):
+        return copyTree(self)
+
+    def __reduce__(self):
+        return (FrozenDict, (dict(self),))
+
+
+class FrozenList(list):
+    """
+    A list of a compact tree, shared with others and therefore read-only
+    """
+
+    __slots__ = ()
+
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _readOnly
+    append = clear = extend = insert = pop = remove = reverse = sort = _readOnly
+
+    def __copy__(self):
+        return list(self)
+
+    def __deepcopy__(self, memo):
+        return copyTree(self)
+
+    def __reduce__(self):
+        return (FrozenList, (list(self),))
+
+
+def _signature(items):
+    # Types are part of the signature, 1, 1.0 and True compare equal
+    return tuple((key, type(value), value) for key, value in items)
+
+
+def compact(data, _shared: dict = None):
+    """
+    Return a compact, read-only copy of `data` as FrozenDicts and FrozenLists
+
+    Dict subclasses like benedict are unwrapped, the result shares
+    subtrees with other compact trees.
+    """
+    shared = {} if _shared is None else _shared
+
+    if isinstance(data, str):
+        return sys.intern(data) if len(data) <= max_intern_length else data
+
+    if isinstance(data, dict):
+        result = FrozenDict(
+            ((sys.intern(key) if isinstance(key, str) else key), compact(value, shared))
+            for key, value in data.items()
+        )
+
+        if len(result) <= max_shared_size and all(
+            isinstance(value, _scalars) for value in result.values()
+        ):
+            return shared.setdefault(("dict", _signature(result.items())), result)
+
+        return result
+
+    if isinstance(data, (list, tuple)):
+        result = FrozenList(compact(value, shared) for value in data)
+
+        if len(result) <= max_shared_size and all(
+            isinstance(value, _scalars) for value in result
+        ):
+            return shared.setdefault(("list", _signature(enumerate(result))), result)
+
+        return result
+
+    return data
+
+
+def mergeTrees(base: dict, overlay: dict) -> dict:
+    """
+    Merge `overlay` into `base` without modifying either
+
+    Same semantics as benedict's merge(overwrite=True, concat=False):
+    dicts are merged recursively, any other value of `overlay` replaces
+    the one in `base`. Subtrees only one side defines are shared, the
+    merged dicts are read-only like them.
+    """
+    merged = dict(base)
+
+    for key, value in overlay.items():
+        current = merged.get(key)
+
+        if isinstance(value, dict) and isinstance(current, dict):
+            merged[key] = mergeTrees(current, value)
+        else:
+            merged[key] = value
+
+    return FrozenDict(merged)
+
+
+def copyTree(data):
+    """
+    Return a copy of `data` with plain dicts and lists of its own that
+    can be modified
+
+    Scalars are immutable and shared. Subtrees compact() stores once are
+    copied for every place they appear in.
+    """
+    if isinstance(data, dict):
+        return {key: copyTree(value) for key, value in data.items()}
+
+    if isinstance(data, (list, tuple)):
+        return [copyTree(value) for value in data]
+
+    return data
+
+
+def mapLeaves(data, function, key=None):
+    """
+    Return `data` with every scalar replaced by function(key, value)
+
+    List items are passed with their index as key. Containers are only
+    copied (read-only) if something in them changed, the result shares
+    everything else with `data`.
+    """
+    if isinstance(data, dict):
+        items = data.items()
+    elif isinstance(data, list):
+        items = enumerate(data)
+    else:
+        return function(key, data)
+
+    result = None
+
+    for item_key, value in items:
+        mapped = mapLeaves(value, function, item_key)
+
+        if mapped is not value:
+            if result is None:
+                result = dict(data) if isinstance(data, dict) else list(data)
+
+            result[item_key] = mapped
+
+    if result is None:
+        return data
+
+    return FrozenDict(result) if isinstance(result, dict) else FrozenList(result)
@@ -0,0 +1,730 @@
+"""
+In-process API for resolving and using arco contexts
+
+    from arco import ArcoContext
+
+    with ArcoContext(cwd="/srv/project", var=["stage=prod"]) as context:
+        context.resolve()["arco"]["name"]
+        context.run(["make", "deploy"])
+
+An ArcoContext never changes the working directory, os.environ or the
+global logger configuration and reports problems as ArcoError instead
+of exiting, so many contexts can be resolved side by side in threads.
+"""
+
+import os
+import re
+import pwd
+import tempfile
+import platform
+import datetime
+import threading
+import functools
+from pathlib import Path
+from typing import List
+import git
+import yaml
+import typer
+from benedict import benedict
+from dotenv import dotenv_values
+from loguru import logger
+from read_version import read_version
+from slugify import slugify
+from .kubeconfig import discoverKubeconfig, getKubeconfigFiles
+from .facts import getHostFacts
+from .factcache import getFactCacheSettings
+from .metrics import MeasuredPopen, runMeasured
+from .process import processGroupArguments
+from .serialize import flattenEnvironment, writeYAML
+from .filevalues import referenceFiles, YAMLLoader
+from .compact import FrozenDict, compact, copyTree, mergeTrees, mapLeaves
+
+APP_NAME = "arco"
+
+discovery_namespaces = [
+    "ci",
+    "platform",
+    "git",
+    "ansible",
+    "docker",
+    "kubernetes",
+    "k8s",
+    "helm",
+]
+
+# Layers in the order they are merged; --var is applied twice so it is
+# available while locating code and context and still overrides anything
+# that was loaded
+layer_order = ["default", "vars", "paths", "code", "discovered", "context", "vars"]
+
+
+class ArcoError(Exception):
+    pass
+
+
+def getAppDir() -> str:
+    return typer.get_app_dir(APP_NAME)
+
+
+@functools.lru_cache(maxsize=None)
+def getVersion() -> str:
+    return read_version(str(Path(__file__).parent / "__init__.py"))
+
+
+def normalize_name(name):
+    return re.sub(r"[^-_a-z0-9]", "", name.lower())
+
+
+def getDefaults(app_dir: str, cwd: str) -> benedict:
+    kubeconfig = os.path.join(os.path.expanduser("~"), ".kube", "config")
+
+    return benedict(
+        {
+            "arco": {
+                "app_dir": app_dir,
+                "version": getVersion(),
+                "cwd": cwd,
+                "hostname": platform.node(),
+                "user": pwd.getpwuid(os.getuid()).pw_name,
+                "verbosity": 0,
+                "context_dir": cwd,
+                "code_dir": cwd,
+                "date": datetime.datetime.utcnow().isoformat(),
+            },
+            "k8s": {
+                "kubeconfig": kubeconfig,
+                "auth": {"api_key": kubeconfig},
+            },
+            "helm": {
+                "debug": False,
+            },
+            "kubeconfig": kubeconfig,
+            "better_exceptions": 1,
+            "systemd": {"colors": 1},
+            "system_version_compat": 1,  # https://stackoverflow.com/questions/63972113/big-sur-clang-invalid-version-error-due-to-macosx-deployment-target
+        }
+    )
+
+
+def loadConfig(config_file: str = None):
+    """
+    Parse `config_file`, returns None if it is missing or invalid
+    """
+    if not config_file or not os.path.isfile(config_file):
+        return None
+
+    # Try to assess suffix
+    extension = os.path.splitext(config_file)[1][1:]
+
+    try:
+        if extension in ["yml", "yaml"]:
+            # benedict parses YAML with the pure Python loader
+            with open(config_file) as file_:
+                return benedict(yaml.load(file_, Loader=YAMLLoader) or {})
+
+        return benedict(config_file, format=extension)
+    except Exception:
+        return None
+
+
+# Parsed config files by path, reused while their stat signature is unchanged
+_config_cache = {}
+_config_lock = threading.Lock()
+
+
+def loadLayer(config_file: str, base_dir: str, paths: bool = True):
+    """
+    Load `config_file` as a compact layer, None if it is missing or invalid
+
+    @file: values (and with `paths` values of path-like keys) are made
+    absolute to `base_dir`. Layers share structure with each other and
+    the parse cache and must not be modified.
+    """
+    try:
+        stat = os.stat(config_file)
+    except OSError:
+        return None
+
+    signature = (stat.st_mtime_ns, stat.st_size)
+
+    with _config_lock:
+        cached = _config_cache.get(config_file)
+
+    if not cached or cached[0] != signature:
+        cached = (signature, compact(loadConfig(config_file)))
+
+        with _config_lock:
+            _config_cache[config_file] = cached
+
+    layer = cached[1]
+
+    if not layer:
+        return None
+
+    if paths:
+        return contextualize(layer, base_dir)
+
+    return referenceFiles(layer, base_dir)
+
+
+def getAbsolutePath(path, context_dir):
+    local_path = os.path.join(context_dir, path)
+
+    if os.path.exists(local_path):
+        return os.path.abspath(local_path)
+
+    return path
+
+
+def contextualize(data, context_dir: str):
+    """
+    Make values of keys that look like paths absolute to `context_dir`
+
+    Returns a copy of `data` that shares everything unchanged with it.
+    """
+    # If "key" contains any of the following words
+    conversion_triggers = ["path", "dir", "folder", "file"]
+
+    def contextualizeValue(key, value):
+        # List items are passed with their index as key
+        if isinstance(value, str) and isinstance(key, str):
+            # Convert the "value" (we assume it is a directory or file path) to an absolute path
+            if any(trigger in key for trigger in conversion_triggers):
+                return getAbsolutePath(value, context_dir)
+
+        return value
+
+    return referenceFiles(mapLeaves(data, contextualizeValue), context_dir)
+
+
+def getGitFacts(code_dir: str, name: str) -> dict:
+    try:
+        repo = git.Repo(code_dir, search_parent_directories=True)
+        commit = repo.head.commit
+    except (git.InvalidGitRepositoryError, git.NoSuchPathError, ValueError):
+        logger.debug(f"No git repository found in {code_dir}")
+        return {}
+
+    try:
+        ref_name = repo.head.reference.name
+    except TypeError:
+        # Detached HEAD
+        ref_name = commit.hexsha
+
+    tags = repo.tags
+
+    return {
+        "commit_sha": commit.hexsha,
+        "commit_short_sha": commit.hexsha[:8],
+        "commit_ref_name": ref_name,
+        "commit_tag": str(tags[0]) if tags else "",
+        "commit_description": commit.message.rstrip() or "",
+        "commit_message": commit.message.rstrip() or "",
+        "commit_ref_slug": slugify(ref_name.rstrip()) or "",
+        "project_name": name or "",
+    }
+
+
+def discoverContext(arc: dict, app_dir: str, environ: dict = None) -> dict:
+    namespace_context = {}
+    code_dir = arc["arco"]["code_dir"]
+
+    kubeconfig = discoverKubeconfig(
+        arc["kubeconfig"],
+        os.path.join(app_dir, "kubeconfig.cache.json"),
+        environ,
+        arc["arco"]["cwd"],
+    )
+    git_facts = getGitFacts(code_dir, arc["arco"].get("name"))
+
+    for namespace in discovery_namespaces:
+        namespace_context[namespace] = {}
+
+        if namespace in ["platform"]:
+            namespace_context[namespace].update(
+                getHostFacts(
+                    arc["arco"].get("host_facts"),
+                    os.path.join(app_dir, "facts.json"),
+                    environ,
+                )
+            )
+
+        if namespace in ["ci", "git"]:
+            namespace_context[namespace].update(git_facts)
+
+        if namespace in ["ansible"]:
+            namespace_context[namespace]["stdout_callback"] = "yaml"
+            namespace_context[namespace]["display_skipped_hosts"] = False
+            namespace_context[namespace]["gathering"] = "smart"
+            namespace_context[namespace]["diff_always"] = True
+            namespace_context[namespace]["display_args_to_stdout"] = True
+            namespace_context[namespace]["localhost_warning"] = False
+            namespace_context[namespace]["use_persistent_connections"] = True
+            namespace_context[namespace]["roles_path"] = code_dir
+            namespace_context[namespace]["pipelining"] = True
+            namespace_context[namespace]["callback_whitelist"] = "profile_tasks"
+            namespace_context[namespace]["deprecation_warnings"] = False
+            namespace_context[namespace]["force_color"] = True
+            namespace_context[namespace].update(getFactCacheSettings(arc, app_dir))
+
+        if namespace in ["docker"]:
+            namespace_context[namespace]["buildkit"] = 1
+            namespace_context[namespace]["host"] = "unix:///var/run/docker.sock"
+
+        if namespace in ["kubernetes", "k8s"]:
+            namespace_context[namespace].update(kubeconfig)
+
+        if namespace in ["helm"] and kubeconfig:
+            namespace_context[namespace]["kubecontext"] = kubeconfig["current_context"]
+            namespace_context[namespace]["namespace"] = kubeconfig["namespace"]
+
+    return namespace_context
+
+
+def loadVarsLayer(var: List[str], cwd: str):
+    _vars = benedict()
+
+    for v in var or []:
+        key, value = v.split("=", 1)
+
+        # Split key on separator (.)
+        _vars[key] = value
+
+    return referenceFiles(compact(_vars), cwd)
+
+
+class ArcoContext:
+    """
+    A resolved arco context and the means to run commands in it
+
+    The arguments mirror the global CLI options. The context is
+    resolved lazily on first use and cached until reload(). With a
+    `bundle` (see bundle.readBundle) nothing is resolved, the bundled
+    context, environment and mount files are used as they are.
+    """
+
+    def __init__(
+        self,
+        cwd: str = None,
+        context: str = None,
+        code: str = None,
+        default: bool = True,
+        discover: bool = True,
+        env_file: str = None,
+        name: str = None,
+        var: List[str] = None,
+        app_dir: str = None,
+        environ: dict = None,
+        loglevel: str = "WARNING",
+        bundle: dict = None,
+    ):
+        self.cwd = os.path.abspath(cwd or os.getcwd())
+        self.context = context
+        self.code = code
+        self.default = default
+        self.discover = discover
+        self.env_file = os.path.abspath(os.path.join(self.cwd, env_file or ".env"))
+        self.name = name or normalize_name(os.path.basename(self.cwd))
+        self.var = list(var or [])
+        self.app_dir = app_dir or getAppDir()
+        self.environ = dict(os.environ if environ is None else environ)
+        self.loglevel = loglevel.upper()
+        self.bundle = bundle
+
+        self.layers = {}
+        self._resolved = None
+        self._dotenv = None
+        self._mounted = []
+        self._mountpoint = None
+        self._lock = threading.RLock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _merge(self, names) -> benedict:
+        resolved = self.layers["base"]
+
+        for name in names:
+            if self.layers.get(name):
+                resolved = mergeTrees(resolved, self.layers[name])
+
+        # Read-only, the result shares subtrees with the layers
+        return benedict(resolved, check_keys=False)
+
+    def _locate(self, directory: str, app_dir: str, kind: str) -> str:
+        """
+        Find `directory` in the cwd, in cwd/.arco or in app_dir (last match wins)
+        """
+        found = None
+
+        for candidate in [
+            os.path.join(self.cwd, directory),
+            os.path.join(self.cwd, ".arco", directory),
+            os.path.join(app_dir, directory),
+        ]:
+            if os.path.isdir(candidate):
+                logger.debug(f"Found {kind}_dir in {candidate}")
+                found = candidate
+
+        if not found:
+            raise ArcoError(f"Can't locate {kind} in {directory}")
+
+        return found
+
+    def _loadContextLayer(self, context_dir: str):
+        return loadLayer(os.path.join(context_dir, "arco.yml"), context_dir)
+
+    def _loadCodeLayer(self, code_dir: str):
+        return loadLayer(os.path.join(code_dir, "arco.yml"), code_dir, paths=False)
+
+    def _discover(self):
+        if self.discover and self.layers.get("code"):
+            # Discover from the effective values, e.g. a kubeconfig set by the context
+            partial = self._merge([name for name in layer_order if name != "discovered"])
+            self.layers["discovered"] = compact(
+                discoverContext(partial, self.app_dir, self.environ)
+            )
+        else:
+            self.layers["discovered"] = None
+
+    def _load(self):
+        base = getDefaults(self.app_dir, self.cwd)
+        base["arco"]["name"] = self.name
+        base["arco"]["env_file"] = self.env_file
+        base["arco"]["discover"] = self.discover
+        base["arco"]["loglevel"] = self.loglevel
+
+        self.layers = {"base": compact(base)}
+
+        # Load default context from app_dir
+        if self.default:
+            _default_context = loadLayer(
+                os.path.join(self.app_dir, "arco.yml"), base["arco"]["context_dir"]
+            )
+
+            if _default_context:
+                self.layers["default"] = _default_context
+
+                logger.debug(f"Merged default context from {self.app_dir}")
+
+        self.layers["vars"] = loadVarsLayer(self.var, self.cwd)
+
+        arc = self._merge(["default", "vars"])
+        code_dir = arc["arco"]["code_dir"]
+        context_dir = arc["arco"]["context_dir"]
+
+        if self.code:
+            code_dir = self._locate(self.code, arc["arco"]["app_dir"], "code")
+
+        if self.context:
+            context_dir = self._locate(self.context, arc["arco"]["app_dir"], "context")
+
+        self.layers["paths"] = compact(
+            {"arco": {"code_dir": code_dir, "context_dir": context_dir}}
+        )
+        self.layers["context"] = self._loadContextLayer(context_dir)
+        self.layers["code"] = self._loadCodeLayer(code_dir)
+
+        self._discover()
+
+    def _resolve(self) -> benedict:
+        # Shares subtrees with the layers and the parse cache, read-only
+        with self._lock:
+            if self._resolved is None and self.bundle:
+                self._resolved = benedict(
+                    compact(self.bundle["context"]), check_keys=False
+                )
+
+            if self._resolved is None:
+                if not self.layers:
+                    self._load()
+
+                self._resolved = self._merge(layer_order)
+
+            return self._resolved
+
+    def resolve(self, copy: bool = False) -> benedict:
+        """
+        Return the resolved context
+
+        The context is shared and read-only (modifying it raises a
+        TypeError), with `copy` the caller gets a copy of its own.
+        """
+        with self._lock:
+            if copy:
+                return benedict(copyTree(self._resolve()), check_keys=False)
+
+            return self._resolve()
+
+    def reload(self, changed_files=None) -> benedict:
+        """
+        Reload the layers backed by `changed_files` (all layers if omitted)
+        and re-resolve the context
+        """
+        with self._lock:
+            if changed_files is None or not self.layers:
+                self.layers = {}
+                self._dotenv = None
+                self._resolved = None
+
+                return self.resolve()
+
+            arco = self._resolve()["arco"]
+            context_dir = arco["context_dir"]
+            code_dir = arco["code_dir"]
+
+            for changed_file in changed_files:
+                if changed_file == self.env_file:
+                    self._dotenv = None
+                    logger.info(f"Reloaded environment from {self.env_file}")
+
+                if changed_file == os.path.join(code_dir, "arco.yml"):
+                    self.layers["code"] = self._loadCodeLayer(code_dir)
+                    self._discover()
+                    logger.info(f"Reloaded code from {code_dir}")
+
+                if changed_file == os.path.join(context_dir, "arco.yml"):
+                    self.layers["context"] = self._loadContextLayer(context_dir)
+                    self._discover()
+                    logger.info(f"Reloaded context from {context_dir}")
+
+            self._resolved = None
+
+            return self.resolve()
+
+    def files(self) -> List[str]:
+        """
+        Files the resolved context depends on
+        """
+        if self.bundle:
+            return [self.bundle["path"]]
+
+        arc = self._resolve()
+        files = [
+            os.path.join(arc["arco"]["context_dir"], "arco.yml"),
+            os.path.join(arc["arco"]["code_dir"], "arco.yml"),
+            self.env_file,
+        ]
+
+        if self.default:
+            files.append(os.path.join(self.app_dir, "arco.yml"))
+
+        if self.discover:
+            # Appended to on every commit and checkout
+            files.append(os.path.join(arc["arco"]["code_dir"], ".git", "logs", "HEAD"))
+            files += getKubeconfigFiles(arc["kubeconfig"], self.environ, self.cwd)
+
+        return sorted(set(files))
+
+    def dotenv(self) -> dict:
+        """
+        The variables defined in env_file
+        """
+        with self._lock:
+            if self._dotenv is None and self.bundle:
+                self._dotenv = self.bundle["dotenv"]
+
+            if self._dotenv is None:
+                self._dotenv = {}
+
+                if os.path.exists(self.env_file):
+                    self._dotenv = {
+                        key: value
+                        for key, value in dotenv_values(self.env_file).items()
+                        if value is not None
+                    }
+
+            return self._dotenv
+
+    def env(self, environ: dict = None) -> dict:
+        """
+        Variables to add to `environ` (the context's base environment by
+        default): those from env_file that `environ` doesn't define yet
+        and the flattened context
+        """
+        environ = self.environ if environ is None else environ
+
+        env = {key: value for key, value in self.dotenv().items() if key not in environ}
+
+        if self.bundle:
+            env.update(self.bundle["env"])
+        else:
+            env.update(
+                (key, str(value)) for key, value in flattenEnvironment(self._resolve())
+            )
+
+        return env
+
+    def _mountFile(self, write) -> str:
+        fd, path = tempfile.mkstemp(prefix="arco-", suffix=".yml")
+
+        with self._lock:
+            self._mounted.append(path)
+
+        with os.fdopen(fd, "w") as file_:
+            write(file_)
+
+        return path
+
+    def mount(self, data: dict = None) -> str:
+        """
+        Write `data` (the resolved context by default) to a YAML file that
+        lives until close() and return its path
+
+        The resolved context keeps its path, mounting it again (e.g. after
+        reload()) replaces the file.
+        """
+        if data is not None:
+            return self._mountFile(lambda file_: writeYAML(data, file_))
+
+        resolved = self._resolve()
+
+        if self.bundle:
+            path = self._mountFile(
+                lambda file_: file_.write(self.bundle["mounts"]["context"])
+            )
+        else:
+            path = self._mountFile(lambda file_: writeYAML(resolved, file_))
+
+        with self._lock:
+            if self._mountpoint:
+                os.replace(path, self._mountpoint)
+                self._mounted.remove(path)
+                path = self._mountpoint
+
+            self._mountpoint = path
+
+            # The context is read-only, replace it by one with the mountpoint
+            if self._resolved is resolved:
+                tree = resolved.dict()
+                arco = FrozenDict(tree["arco"], mountpoint=path)
+                self._resolved = benedict(FrozenDict(tree, arco=arco), check_keys=False)
+
+        return path
+
+    def entrypoint(self, args: List[str] = None) -> List[str]:
+        entrypoint = self._resolve()["arco"].get("entrypoint")
+
+        # Try to get "entrypoint" from context
+        if not entrypoint:
+            raise ArcoError("No entrypoint defined")
+
+        return [entrypoint] + list(args or [])
+
+    def inventory(self) -> List[str]:
+        """
+        The -i arguments for ansible.inventory and ansible.inventory_file
+        """
+        ansible = self._resolve().get("ansible") or {}
+        arguments = []
+
+        # Create tempfile with inventory from config
+        inventory = ansible.get("inventory")
+
+        if inventory:
+            arguments.append("-i")
+
+            if self.bundle and "inventory" in self.bundle["mounts"]:
+                inventory = self.bundle["mounts"]["inventory"]
+                arguments.append(self._mountFile(lambda file_: file_.write(inventory)))
+            else:
+                arguments.append(self.mount(inventory))
+
+        inventory_file = ansible.get("inventory_file")
+
+        if inventory_file:
+            arguments.append("-i")
+            arguments.append(inventory_file)
+
+        return arguments
+
+    def command(self, command: str, args: List[str] = None) -> List[str]:
+        """
+        The command line `arco x COMMAND ARGS` runs, augmented with the context
+        """
+        arc = self._resolve()
+        args = list(args or [])
+        command_list = [command]
+
+        if command in ["ansible-playbook", "ap", "ak"]:
+            command_list += self.inventory()
+            command_list.append("--extra-vars")
+            command_list.append(f"{arc.dump()}")
+
+        if command in ["helm"]:
+            if "install" in args:
+                command_list.append("-f")
+                command_list.append(arc["arco"].get("mountpoint") or self.mount())
+
+        return command_list + args
+
+    def _popenArguments(self, command_list, cwd, env, kwargs) -> dict:
+        environ = dict(self.environ)
+        environ.update(self.env())
+        environ.update(env or {})
+
+        logger.debug(f"Running command: {' '.join(command_list)}")
+
+        arguments = {
+            "cwd": cwd or self._resolve()["arco"]["code_dir"],
+            "env": environ,
+            "universal_newlines": True,
+            "shell": False,
+        }
+        arguments.update(kwargs)
+
+        return arguments
+
+    def run(
+        self,
+        command_list: List[str],
+        cwd: str = None,
+        env: dict = None,
+        timeout: float = None,
+        grace_period: float = None,
+        **kwargs,
+    ):
+        """
+        Run `command_list` in the code dir with the context in its environment
+
+        Returns the subprocess.CompletedProcess with the child's resource
+        usage in `metrics`, keyword arguments are passed on to subprocess.run.
+        After `timeout` seconds the child's process group is stopped and
+        the result has `timed_out` set.
+        """
+        return runMeasured(
+            command_list,
+            timeout=timeout,
+            grace_period=grace_period,
+            **self._popenArguments(command_list, cwd, env, kwargs),
+        )
+
+    def popen(self, command_list: List[str], cwd: str = None, env: dict = None, **kwargs):
+        """
+        Like run(), but returns the Popen without waiting for it; its
+        resource usage is available from metrics.getMetrics() once it exited
+
+        The child leads its own process group, process.Supervisor can
+        enforce a timeout on it.
+        """
+        arguments = self._popenArguments(command_list, cwd, env, kwargs)
+        arguments.update(processGroupArguments())
+
+        return MeasuredPopen(command_list, **arguments)
+
+    def close(self):
+        """
+        Remove the files created by mount()
+        """
+        with self._lock:
+            mounted, self._mounted = self._mounted, []
+            self._mountpoint = None
+
+        for path in mounted:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
@@ -0,0 +1,123 @@
+"""
+The Ansible fact cache arco manages under app_dir
+
+Ansible is pointed to a jsonfile cache per context through the
+ANSIBLE_CACHE_PLUGIN* variables of the `ansible` namespace, so facts
+gathered by one playbook run are reused by the next (gathering: smart).
+"""
+
+import os
+import re
+import json
+import time
+import hashlib
+from slugify import slugify
+
+# Seconds until cached facts are gathered again
+default_timeout = 86400
+
+# ansible-core 2.19+ prefixes cache keys with a schema version
+_schema_prefix = re.compile(r"^s\d+_")
+
+
+def getFactCacheDir(app_dir: str, name: str, context_dir: str) -> str:
+    """
+    The cache directory of a context, contexts with the same name in
+    different directories don't share facts
+    """
+    digest = hashlib.sha1(context_dir.encode()).hexdigest()[:8]
+
+    return os.path.join(app_dir, "facts", f"{slugify(name or 'default')}-{digest}")
+
+
+def getFactCacheSettings(arc: dict, app_dir: str) -> dict:
+    """
+    Settings for the `ansible` namespace (exported as ANSIBLE_CACHE_PLUGIN*)
+
+    Values already set in `arc` are kept, e.g. ansible.cache_plugin_timeout.
+    """
+    ansible = arc.get("ansible") or {}
+    directory = getFactCacheDir(
+        app_dir, arc["arco"].get("name"), arc["arco"]["context_dir"]
+    )
+
+    return {
+        "cache_plugin": ansible.get("cache_plugin", "jsonfile"),
+        "cache_plugin_connection": ansible.get("cache_plugin_connection", directory),
+        "cache_plugin_timeout": int(ansible.get("cache_plugin_timeout", default_timeout)),
+    }
+
+
+def listCachedHosts(directory: str, timeout: int = default_timeout) -> list:
+    """
+    Return {"host", "path", "age", "expired"} for every host in the cache
+    """
+    hosts = []
+
+    try:
+        names = sorted(os.listdir(directory))
+    except OSError:
+        return hosts
+
+    now = time.time()
+
+    for name in names:
+        path = os.path.join(directory, name)
+
+        if not os.path.isfile(path) or name.startswith("."):
+            continue
+
+        age = now - os.path.getmtime(path)
+
+        hosts.append(
+            {
+                "host": _schema_prefix.sub("", name),
+                "path": path,
+                "age": age,
+                # Ansible treats a timeout of 0 as "never expires"
+                "expired": bool(timeout) and age > int(timeout),
+            }
+        )
+
+    return hosts
+
+
+def loadCachedFacts(directory: str, host: str) -> dict:
+    """
+    Raises KeyError if there are no cached facts for `host`
+    """
+    for entry in listCachedHosts(directory, timeout=0):
+        if entry["host"] != host:
+            continue
+
+        try:
+            with open(entry["path"]) as file_:
+                facts = json.load(file_)
+
+            # ansible-core 2.19+ wraps the facts
+            if isinstance(facts, dict) and "__payload__" in facts:
+                facts = json.loads(facts["__payload__"])
+
+            return facts
+        except (OSError, ValueError):
+            pass
+
+    raise KeyError(host)
+
+
+def clearCachedFacts(directory: str, hosts=None) -> list:
+    """
+    Remove the cached facts of `hosts` (all hosts if empty), returns the
+    hosts that were removed
+    """
+    cached = listCachedHosts(directory)
+    removed = []
+
+    for entry in cached:
+        if hosts and entry["host"] not in hosts:
+            continue
+
+        os.remove(entry["path"])
+        removed.append(entry["host"])
+
+    return removed
@@ -0,0 +1,189 @@
+"""
+Host facts for the `platform` namespace, cached in app_dir
+
+Facts are collected once and reused until the TTL expires, the host
+reboots (Linux boot ID) or the fact configuration changes.
+"""
+
+import os
+import json
+import time
+import hashlib
+import platform
+import threading
+import subprocess
+from loguru import logger
+
+# Seconds to reuse collected facts for
+default_ttl = 86400
+
+boot_id_file = "/proc/sys/kernel/random/boot_id"
+
+# Facts collected in this process, by cache file
+_facts_memo = {}
+_facts_lock = threading.Lock()
+
+
+def getBootId():
+    try:
+        with open(boot_id_file) as file_:
+            return file_.read().strip()
+    except OSError:
+        return None
+
+
+def getMemoryTotal():
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def getContainer(environ: dict = None) -> str:
+    """
+    The container runtime arco runs in, empty if none was detected
+    """
+    environ = os.environ if environ is None else environ
+
+    if os.path.exists("/.dockerenv"):
+        return "docker"
+
+    if os.path.exists("/run/.containerenv"):
+        return "podman"
+
+    if environ.get("KUBERNETES_SERVICE_HOST"):
+        return "kubernetes"
+
+    try:
+        with open("/proc/1/cgroup") as file_:
+            cgroup = file_.read()
+    except OSError:
+        return ""
+
+    for runtime in ["kubepods", "docker", "containerd", "lxc"]:
+        if runtime in cgroup:
+            return "kubernetes" if runtime == "kubepods" else runtime
+
+    return ""
+
+
+# Optional facts users can enable with arco.host_facts.extra, called with
+# the environment of the context
+extra_facts = {
+    "cpu_count": lambda environ: os.cpu_count(),
+    "memory_total": lambda environ: getMemoryTotal(),
+    "container": getContainer,
+}
+
+
+def normalizeFactsConfig(config) -> dict:
+    config = dict(config or {})
+    extra = config.get("extra") or []
+
+    if isinstance(extra, str):
+        extra = [extra]
+
+    return {
+        "ttl": int(config.get("ttl", default_ttl)),
+        "extra": sorted(extra),
+        "commands": dict(config.get("commands") or {}),
+    }
+
+
+def collectFacts(config: dict, environ: dict = None) -> dict:
+    facts = {
+        "name": platform.platform(),
+        "name_short": platform.platform(terse=True),
+        "system": platform.system(),
+        "version": platform.version(),
+        "release": platform.release(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "architecture": str(platform.architecture()),
+    }
+
+    for name in config["extra"]:
+        if name not in extra_facts:
+            logger.warning(f"Unknown host fact '{name}'")
+            continue
+
+        facts[name] = extra_facts[name](os.environ if environ is None else environ)
+
+    for name, command in config["commands"].items():
+        result = subprocess.run(
+            command,
+            shell=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            universal_newlines=True,
+            env=environ,
+        )
+
+        if result.returncode != 0:
+            logger.warning(f"Host fact '{name}' returned exit code {result.returncode}")
+
+        facts[name] = result.stdout.strip()
+
+    return facts
+
+
+def _isFresh(cached: dict, boot_id, signature: str, ttl: int) -> bool:
+    return (
+        cached.get("boot_id") == boot_id
+        and cached.get("signature") == signature
+        and time.time() - cached.get("collected", 0) < ttl
+    )
+
+
+def getHostFacts(config=None, cache_file: str = None, environ: dict = None) -> dict:
+    """
+    Return the host facts, collecting them only if the cache is stale
+
+    `config` is arco.host_facts: `ttl` (seconds, 0 disables caching),
+    `extra` (names from extra_facts) and `commands` ({fact: shell command}).
+    Facts are collected with `environ` (os.environ by default).
+    """
+    config = normalizeFactsConfig(config)
+    signature = hashlib.sha1(json.dumps(config, sort_keys=True).encode()).hexdigest()
+    boot_id = getBootId()
+
+    with _facts_lock:
+        cached = _facts_memo.get(cache_file)
+
+        if cached and _isFresh(cached, boot_id, signature, config["ttl"]):
+            return dict(cached["facts"])
+
+        if cache_file and config["ttl"] > 0:
+            try:
+                with open(cache_file) as file_:
+                    cached = json.load(file_)
+
+                if _isFresh(cached, boot_id, signature, config["ttl"]):
+                    logger.debug(f"Using cached host facts from {cache_file}")
+                    _facts_memo[cache_file] = cached
+
+                    return dict(cached["facts"])
+            except (OSError, ValueError):
+                pass
+
+        cached = {
+            "boot_id": boot_id,
+            "signature": signature,
+            "collected": time.time(),
+            "facts": collectFacts(config, environ),
+        }
+        _facts_memo[cache_file] = cached
+
+        if cache_file and config["ttl"] > 0:
+            try:
+                # Write atomically, concurrent arco invocations may read the cache
+                tmp_file = f"{cache_file}.{os.getpid()}.{threading.get_ident()}"
+
+                with open(tmp_file, "w") as file_:
+                    json.dump(cached, file_)
+
+                os.replace(tmp_file, cache_file)
+            except OSError as e:
+                logger.debug(f"Can't write host facts cache {cache_file}: {e}")
+
+        return dict(cached["facts"])
@@ -0,0 +1,122 @@
+"""
+Context values backed by files
+
+A value `@file:certs/ca.pem` (or `!file certs/ca.pem` in YAML) stays a
+small FileValue through loading, merging and copying. The file is read
+when the value is used as a string, i.e. when a consumer reads it or
+the context is serialized, and cached while its stat signature holds.
+"""
+
+import os
+import threading
+import yaml
+from loguru import logger
+from .compact import mapLeaves
+
+file_prefix = "@file:"
+
+# File contents by path, reused while their stat signature is unchanged
+_file_cache = {}
+_missing_files = set()
+_file_lock = threading.Lock()
+
+
+def readFile(path: str) -> str:
+    """
+    The contents of `path`, empty if it can't be read
+    """
+    try:
+        stat = os.stat(path)
+    except OSError as e:
+        with _file_lock:
+            # Warn once per missing file, not on every use
+            if path not in _missing_files:
+                _missing_files.add(path)
+                logger.warning(f"Can't read file value {path}: {e}")
+
+        return ""
+
+    signature = (stat.st_mtime_ns, stat.st_size)
+
+    with _file_lock:
+        cached = _file_cache.get(path)
+
+        if cached and cached[0] == signature:
+            return cached[1]
+
+    try:
+        with open(path) as file_:
+            contents = file_.read()
+    except (OSError, UnicodeDecodeError) as e:
+        logger.warning(f"Can't read file value {path}: {e}")
+        return ""
+
+    with _file_lock:
+        _file_cache[path] = (signature, contents)
+
+    return contents
+
+
+class FileValue:
+    """
+    A context value that is the contents of a file
+    """
+
+    __slots__ = ("path",)
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def read(self) -> str:
+        return readFile(self.path)
+
+    def __str__(self) -> str:
+        return self.read()
+
+    def __repr__(self) -> str:
+        return f"{file_prefix}{self.path}"
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, FileValue) and other.path == self.path
+
+    def __hash__(self) -> int:
+        return hash(self.path)
+
+    # Immutable, copies of a context share it
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+
+def referenceFiles(data, base_dir: str):
+    """
+    Replace `@file:` values in `data` with FileValues, relative paths
+    are relative to `base_dir`
+
+    Returns a copy of `data` that shares everything unchanged with it.
+    """
+
+    def referenceFile(key, value):
+        if isinstance(value, str) and value.startswith(file_prefix):
+            path = os.path.expanduser(value[len(file_prefix) :])
+            return FileValue(os.path.abspath(os.path.join(base_dir, path)))
+
+        return value
+
+    return mapLeaves(data, referenceFile)
+
+
+def _fileConstructor(loader, node):
+    return file_prefix + loader.construct_scalar(node)
+
+
+class YAMLLoader(getattr(yaml, "CSafeLoader", yaml.SafeLoader)):
+    """
+    The loader for context files, libyaml's if it is available, with `!file`
+    """
+
+
+# Only context files know `!file`, yaml.safe_load elsewhere is unaffected
+YAMLLoader.add_constructor("!file", _fileConstructor)
@@ -0,0 +1,202 @@
+import os
+import sys
+import glob
+import json
+import hashlib
+import datetime
+import subprocess
+from loguru import logger
+from .metrics import MeasuredPopen, getMetrics
+from .process import (
+    Supervisor,
+    processGroupArguments,
+    canTakeTerminal,
+    timeout_returncode,
+)
+
+# Values of the arco namespace that change on every invocation
+volatile_keys = ["date", "mountpoint"]
+
+
+def normalizeInputs(inputs) -> dict:
+    """
+    `inputs` is either a list of file globs or a dict with
+    `files` (globs relative to the code dir) and `context` (keypaths,
+    None if not declared to depend on the whole context)
+    """
+    if not inputs:
+        return {"files": [], "context": None}
+
+    if isinstance(inputs, (str, list)):
+        inputs = {"files": inputs}
+
+    files = inputs.get("files") or []
+    context = inputs.get("context")
+
+    return {
+        "files": [files] if isinstance(files, str) else list(files),
+        "context": [context] if isinstance(context, str) else context and list(context),
+    }
+
+
+def expandGlobs(patterns, cwd: str):
+    paths = set()
+
+    for pattern in patterns or []:
+        for path in glob.glob(os.path.join(cwd, pattern), recursive=True):
+            if os.path.isfile(path):
+                paths.add(os.path.relpath(path, cwd))
+
+    return sorted(paths)
+
+
+def hashFile(path: str) -> str:
+    digest = hashlib.sha256()
+
+    with open(path, "rb") as file_:
+        for chunk in iter(lambda: file_.read(1024 * 1024), b""):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def getFingerprint(command, inputs: dict, context, cwd: str) -> str:
+    """
+    Hash the command, the active context (name and directory), the
+    content of all input files and the values of the selected context
+    keypaths, or of the whole context if inputs don't select any
+    """
+    arco = (context or {}).get("arco") or {}
+
+    digest = hashlib.sha256()
+    digest.update(
+        json.dumps([command, cwd, arco.get("context_dir"), arco.get("name")]).encode()
+    )
+
+    for path in expandGlobs(inputs["files"], cwd):
+        digest.update(f"file:{path}:{hashFile(os.path.join(cwd, path))}\0".encode())
+
+    if inputs["context"] is None:
+        # Without the values that differ on every invocation
+        context = dict(context or {})
+        context["arco"] = {
+            key: value for key, value in arco.items() if key not in volatile_keys
+        }
+        value = json.dumps(context, sort_keys=True, default=str)
+        digest.update(f"context:{value}\0".encode())
+    else:
+        for keypath in sorted(inputs["context"]):
+            value = json.dumps(context.get(keypath), sort_keys=True, default=str)
+            digest.update(f"context:{keypath}:{value}\0".encode())
+
+    return digest.hexdigest()
+
+
+def getOutputSignature(outputs, cwd: str):
+    signature = []
+
+    for path in expandGlobs(outputs, cwd):
+        stat = os.stat(os.path.join(cwd, path))
+        signature.append([path, stat.st_mtime_ns, stat.st_size])
+
+    return signature
+
+
+def getRecordFiles(record_dir: str, fingerprint: str):
+    return (
+        os.path.join(record_dir, f"{fingerprint}.json"),
+        os.path.join(record_dir, f"{fingerprint}.log"),
+    )
+
+
+def loadRecord(record_dir: str, fingerprint: str, outputs, cwd: str):
+    """
+    Return the record of a previous successful run with the same
+    fingerprint, provided its declared outputs are still in place
+    """
+    record_file, log_file = getRecordFiles(record_dir, fingerprint)
+
+    try:
+        with open(record_file) as file_:
+            record = json.load(file_)
+    except (OSError, ValueError):
+        return None
+
+    if outputs and getOutputSignature(outputs, cwd) != record.get("outputs"):
+        logger.debug(f"Outputs of {fingerprint} changed since the recorded run")
+        return None
+
+    record["log_file"] = log_file
+
+    return record
+
+
+def saveRecord(record_dir: str, fingerprint: str, command, outputs, cwd: str, log: str):
+    os.makedirs(record_dir, exist_ok=True)
+    record_file, log_file = getRecordFiles(record_dir, fingerprint)
+
+    with open(log_file, "w") as file_:
+        file_.write(log)
+
+    record = {
+        "command": command,
+        "date": datetime.datetime.utcnow().isoformat(),
+        "outputs": getOutputSignature(outputs, cwd),
+    }
+
+    with open(record_file, "w") as file_:
+        json.dump(record, file_)
+
+
+def replayRecord(record: dict, prefix: str = "", stream=None):
+    stream = stream or sys.stdout
+
+    try:
+        with open(record["log_file"]) as file_:
+            for line in file_:
+                stream.write(f"{prefix}{line}")
+    except OSError:
+        pass
+
+    stream.flush()
+
+
+def runAndRecord(
+    command_list,
+    cwd: str,
+    stream=None,
+    timeout: float = None,
+    grace_period: float = None,
+):
+    """
+    Run a command, streaming its output (to stdout by default) while
+    keeping a copy of it
+
+    Returns (returncode, output, metrics), returncode is
+    timeout_returncode if it was stopped after `timeout` seconds.
+    """
+    stream = stream or sys.stdout
+    output = []
+
+    process = MeasuredPopen(
+        command_list,
+        cwd=cwd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        universal_newlines=True,
+        shell=False,
+        **processGroupArguments(),
+    )
+
+    with Supervisor(process, timeout, grace_period, canTakeTerminal()) as supervisor:
+        for line in process.stdout:
+            stream.write(line)
+            stream.flush()
+            output.append(line)
+
+        returncode = process.wait()
+
+    if supervisor.timed_out:
+        returncode = timeout_returncode
+
+    return returncode, "".join(output), getMetrics(process)
@@ -0,0 +1,131 @@
+import os
+import json
+import threading
+import yaml
+from loguru import logger
+
+# libyaml is an order of magnitude faster on large merged kubeconfigs
+SafeLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+def getKubeconfigFiles(default: str = None, environ: dict = None, cwd: str = None):
+    """
+    Return the kubeconfig files in the order kubectl reads them
+
+    $KUBECONFIG (from `environ`, os.environ by default) may hold a list
+    of files separated by os.pathsep. Relative paths are relative to
+    `cwd` (the current directory by default).
+    """
+    environ = os.environ if environ is None else environ
+    kubeconfig = environ.get("KUBECONFIG") or default or ""
+    cwd = cwd or os.getcwd()
+
+    return [
+        os.path.normpath(os.path.join(cwd, os.path.expanduser(path)))
+        for path in kubeconfig.split(os.pathsep)
+        if path
+    ]
+
+
+def getSignature(files):
+    signature = []
+
+    for path in files:
+        try:
+            stat = os.stat(path)
+            signature.append([path, stat.st_mtime_ns, stat.st_size])
+        except FileNotFoundError:
+            signature.append([path, None, None])
+
+    return signature
+
+
+def parseKubeconfig(path: str):
+    with open(path) as file_:
+        return yaml.load(file_, Loader=SafeLoader) or {}
+
+
+def summarizeKubeconfig(configs):
+    """
+    Merge kubeconfigs with kubectl's rules (the first file to set a
+    value or a named entry wins) and extract what we expose to the context
+    """
+    current_context = None
+    contexts = {}
+    clusters = {}
+
+    for config in configs:
+        if not current_context:
+            current_context = config.get("current-context") or None
+
+        for entry in config.get("contexts") or []:
+            contexts.setdefault(entry.get("name"), entry.get("context") or {})
+
+        for entry in config.get("clusters") or []:
+            clusters.setdefault(entry.get("name"), entry.get("cluster") or {})
+
+    context = contexts.get(current_context, {})
+    cluster = clusters.get(context.get("cluster"), {})
+
+    return {
+        "current_context": current_context or "",
+        "cluster": context.get("cluster") or "",
+        "server": cluster.get("server") or "",
+        "namespace": context.get("namespace") or "default",
+        "user": context.get("user") or "",
+        "contexts": sorted(name for name in contexts if name),
+    }
+
+
+def discoverKubeconfig(
+    default: str = None, cache_file: str = None, environ: dict = None, cwd: str = None
+):
+    """
+    Summarize the active kubeconfig(s) without contacting a cluster
+
+    The summary is cached in `cache_file` and reused as long as
+    none of the kubeconfig files changed (by mtime and size).
+    """
+    files = getKubeconfigFiles(default, environ, cwd)
+    signature = getSignature(files)
+
+    if not any(mtime is not None for _, mtime, _ in signature):
+        return {}
+
+    if cache_file and os.path.exists(cache_file):
+        try:
+            with open(cache_file) as file_:
+                cached = json.load(file_)
+
+            if cached.get("signature") == signature:
+                logger.debug(f"Using cached kubeconfig summary from {cache_file}")
+                return cached["summary"]
+        except (ValueError, KeyError, OSError):
+            pass
+
+    configs = []
+
+    for path, mtime, _ in signature:
+        if mtime is None:
+            continue
+
+        try:
+            configs.append(parseKubeconfig(path))
+        except (yaml.YAMLError, OSError) as e:
+            logger.warning(f"Can't parse kubeconfig {path}: {e}")
+
+    summary = summarizeKubeconfig(configs)
+
+    if cache_file:
+        try:
+            # Write atomically, concurrent arco invocations may read the cache
+            tmp_file = f"{cache_file}.{os.getpid()}.{threading.get_ident()}"
+
+            with open(tmp_file, "w") as file_:
+                json.dump({"signature": signature, "summary": summary}, file_)
+
+            os.replace(tmp_file, cache_file)
+        except OSError as e:
+            logger.debug(f"Can't write kubeconfig cache {cache_file}: {e}")
+
+    return summary
@@ -4,45 +4,93 @@ import typer
 import os
 import subprocess
 import sys
-import re
+import tempfile
 import anyconfig
-from pathlib import Path
-from read_version import read_version
 from typing import Optional, List
-from dotenv import load_dotenv
 import pyperclip
-import tempfile
 from loguru import logger
-import pwd
-import platform
 import zlib
 import base64
-import fsutil
 from benedict import benedict
-import git
-from slugify import slugify
-import datetime
+from .watch import getWatcher, waitForChanges
+from .process import stopProcess, parseDuration, forwardSignals
+from .serialize import writeConfig
+from .repos import (
+    normalizeRepositories,
+    cloneRepositories,
+    findRepositories,
+    getRepositoryRoot,
+    getRepositoryStatus,
+    commitRepository,
+    pushRepository,
+    mapRepositories,
+)
+from .tasks import normalizeTasks, getTaskGraph, runTaskGraph
+from .batch import parseSteps, runBatch, runCommand
+from .metrics import recordMetrics
+from .bundle import createBundle, writeBundle, readBundle
+from .timings import (
+    default_keep,
+    getTimingsFile,
+    getTimingsEnvironment,
+    readJSONL,
+    newRun,
+    saveRun,
+    findRun,
+    getTaskDurations,
+    getTaskStats,
+    getRegressions,
+)
+from .shards import (
+    getShardCount,
+    runShards,
+    mergeRecaps,
+    mergeReturncodes,
+    recap_fields,
+)
+from .factcache import (
+    getFactCacheSettings,
+    listCachedHosts,
+    loadCachedFacts,
+    clearCachedFacts,
+)
+from .incremental import (
+    normalizeInputs,
+    getFingerprint,
+    loadRecord,
+    saveRecord,
+    replayRecord,
+    runAndRecord,
+)
+from .context import (
+    ArcoContext,
+    ArcoError,
+    getDefaults,
+    getVersion,
+    normalize_name,
+)
+from .shell import (
+    getState,
+    cleanEnvironment,
+    getCacheKey,
+    getCacheFile,
+    writeCache,
+    filterEnvironment,
+    renderDiff,
+    hook as shellHook,
+)
 
 APP_NAME = "arco"
 app_dir = typer.get_app_dir(APP_NAME)
 
+# The environment as arco found it, before .env and the context were applied
+initial_environ = dict(os.environ)
+
 
 if not os.path.exists(app_dir):
     os.mkdir(app_dir)
     logger.debug(f"Created config directory at {app_dir}")
 
-
-discovery_namespaces = [
-    "ci",
-    "platform",
-    "git",
-    "ansible",
-    "docker",
-    "kubernetes",
-    "k8s",
-    "helm",
-]
-
 logger_config = {
     "handlers": [
         {
@@ -105,130 +153,16 @@ logger.configure(**logger_config)
 
 # return wrapped
 
-arc = benedict(
-    {
-        "arco": {
-            "app_dir": app_dir,
-            "version": read_version(str(Path(__file__).parent / "__init__.py")),
-            "cwd": os.getcwd(),
-            "hostname": platform.node(),
-            "user": pwd.getpwuid(os.getuid()).pw_name,
-            "verbosity": 0,
-            "context_dir": os.getcwd(),
-            "code_dir": os.getcwd(),
-            "date": datetime.datetime.utcnow().isoformat(),
-        },
-        "k8s": {
-            "kubeconfig": os.path.join(os.path.expanduser("~"), ".kube", "config"),
-            "auth": {"api_key": os.path.join(os.path.expanduser("~"), ".kube", "config")},
-        },
-        "helm": {
-            "debug": False,
-        },
-        "kubeconfig": os.path.join(os.path.expanduser("~"), ".kube", "config"),
-        "better_exceptions": 1,
-        "systemd": {"colors": 1},
-        "system_version_compat": 1,  # https://stackoverflow.com/questions/63972113/big-sur-clang-invalid-version-error-due-to-macosx-deployment-target
-    }
-)
+arc = getDefaults(app_dir, os.getcwd())
+
+# Set up by callback(), the commands below are thin wrappers around it
+arco_context = None
 
 # HELPER COMMANDS
 
 app = typer.Typer(no_args_is_help=True)
 
 
-@logger.catch
-def discoverContext():
-    namespace_context = {}
-
-    for namespace in discovery_namespaces:
-        namespace_context[namespace] = {}
-
-        if namespace in ["platform"]:
-
-            namespace_context[namespace]["name"] = platform.platform()
-            namespace_context[namespace]["name_short"] = platform.platform(terse=True)
-            namespace_context[namespace]["system"] = platform.system()
-            namespace_context[namespace]["version"] = platform.version()
-            namespace_context[namespace]["release"] = platform.release()
-            namespace_context[namespace]["machine"] = platform.machine()
-            namespace_context[namespace]["processor"] = platform.processor()
-            namespace_context[namespace]["architecture"] = str(platform.architecture())
-
-        if namespace in ["ci", "git"]:
-            repo = git.Repo(search_parent_directories=True)
-
-            if repo:
-                namespace_context[namespace]["commit_sha"] = repo.head.commit.hexsha
-                namespace_context[namespace]["commit_short_sha"] = repo.git.rev_parse(
-                    namespace_context[namespace]["commit_sha"], short=8
-                )
-                namespace_context[namespace]["commit_ref_name"] = repo.head.reference.name
-                namespace_context[namespace]["commit_tag"] = repo.tags[0]
-                namespace_context[namespace]["commit_description"] = (
-                    repo.head.commit.message.rstrip() or ""
-                )
-                namespace_context[namespace]["commit_message"] = (
-                    repo.head.commit.message.rstrip() or ""
-                )
-                namespace_context[namespace]["commit_ref_slug"] = (
-                    slugify(repo.head.reference.name.rstrip()) or ""
-                )
-                namespace_context[namespace]["project_name"] = arc["arco"]["name"] or ""
-
-        if namespace in ["ansible"]:
-            namespace_context[namespace]["stdout_callback"] = "yaml"
-            namespace_context[namespace]["display_skipped_hosts"] = False
-            namespace_context[namespace]["gathering"] = "smart"
-            namespace_context[namespace]["diff_always"] = True
-            namespace_context[namespace]["display_args_to_stdout"] = True
-            namespace_context[namespace]["localhost_warning"] = False
-            namespace_context[namespace]["use_persistent_connections"] = True
-            namespace_context[namespace]["roles_path"] = os.getcwd()
-            namespace_context[namespace]["pipelining"] = True
-            namespace_context[namespace]["callback_whitelist"] = "profile_tasks"
-            namespace_context[namespace]["deprecation_warnings"] = False
-            namespace_context[namespace]["force_color"] = True
-            namespace_context[namespace]["roles_path"] = arc["arco"]["code_dir"]
-
-        if namespace in ["docker"]:
-            namespace_context[namespace]["buildkit"] = 1
-            namespace_context[namespace]["host"] = "unix:///var/run/docker.sock"
-
-    return namespace_context
-
-
-def dict2Environment(data, prefix=None, print=False):
-    env_dict = benedict(data, keypath_separator=".")
-
-    f = env_dict
-    f.clean(strings=True, collections=True)
-    f.standardize()
-    key_paths = f.keypaths(indexes=True)
-
-    # print(key_paths)
-
-    for path in key_paths:
-        key = path
-        value = f[path]
-
-        if isinstance(value, list):
-            continue
-
-        if isinstance(value, dict):
-            continue
-
-        # Flatten key
-        key = key.replace(".", "_").upper()
-
-        if print:
-            typer.echo(f"{key}={value}")
-        else:
-            os.environ[key] = str(value)
-
-    # env_dict.traverse(traverse_item)
-
-
 def hashString(string: str) -> bytes:
     compressed_data = zlib.compress(string.encode())
     encoded_data = base64.b64encode(compressed_data)
@@ -243,34 +177,6 @@ def unhashString(encoded_data: bytes) -> str:
     return uncompressed_data.decode("utf-8")
 
 
-def normalize_name(name):
-    return re.sub(r"[^-_a-z0-9]", "", name.lower())
-
-
-def contextualizeDict(d, key, value):
-    if isinstance(value, str):
-        # If "key" contains any of the following words
-        conversion_triggers = ["path", "dir", "folder", "file"]
-
-        # Convert the "value" (we assume it is a directory or file path) to an absolute path
-        if any(trigger in key for trigger in conversion_triggers):
-            full_path = getAbsolutePath(value, arc["arco"]["context_dir"])
-            d[key] = full_path
-
-
-def getAbsolutePath(path, context_dir):
-    context_path = path
-
-    os.chdir(context_dir)
-
-    local_path = os.path.join(os.getcwd(), path)
-
-    if fsutil.exists(local_path):
-        context_path = os.path.abspath(local_path)
-
-    return context_path
-
-
 # autocomplete
 def autocomplete_code(incomplete: str):
     # return ["Camila", "Carlos", "Sebastian"]
@@ -295,55 +201,44 @@ def arc_search(pattern: str):
     return result
 
 
-def loadConfig(config_file: str = None):
-    if config_file:
-        # Try to assess suffix
-        extension = fsutil.get_file_extension(config_file)
+def filterConfig(filter: str = None):
+    # The resolved context is read-only, override cli_context in a copy
+    tree = arc.dict()
+    config = benedict(
+        dict(tree, arco=dict(tree["arco"], cli_context="")), check_keys=False
+    )
 
+    if filter:
         try:
-            arco_config = benedict(config_file, format=extension)
-            return arco_config
-        except Exception as e:
-            pass
-    return None
+            filtered_data = benedict()
+            filtered_data[filter] = config[filter]
+            config = filtered_data
+        except KeyError as e:
+            message = str(e).replace("\\", "")
+            logger.warning(f"{message}")
+            config = {}
+
+    return config
 
 
 @app.command()
 def config(
     silent: bool = False,
     copy: bool = typer.Option(False, "--copy", "-c"),
-    format: str = typer.Option("json", "--format"),
+    format: str = typer.Option("json", "--format", help="json, jsonl, yaml or env"),
     pretty: bool = typer.Option(True, "--pretty"),
     save: bool = typer.Option(False, "--save"),
     filter: str = typer.Option(None, "--filter", "-f", autocompletion=arc_search),
 ):
 
-    config = arc
-    config["arco"]["cli_context"] = ""
-
-    if filter:
-        try:
-            filtered_data = benedict()
-            filtered_data[filter] = config[filter]
-            config = filtered_data
-        except KeyError as e:
-            message = str(e).replace("\\", "")
-            logger.warning(f"{message}")
-            config = {}
+    config = filterConfig(filter)
 
     if print:
-        if format == "json":
-            if pretty:
-                typer.echo(anyconfig.dumps(config, ac_parser=format, indent=2))
-            else:
-                typer.echo(anyconfig.dumps(config, format))
-
-        elif format == "env":
-            if isinstance(config, dict):
-                dict2Environment(config, print=True)
-
-        elif format == "yaml":
-            typer.echo(anyconfig.dumps(config, ac_parser=format))
+        try:
+            writeConfig(config, sys.stdout, format=format, pretty=pretty)
+        except ValueError as e:
+            logger.error(f"{e}")
+            sys.exit(1)
 
         return arc
 
@@ -355,34 +250,373 @@ def config(
 
 
 @app.command()
-def clone(repository: str, directory: str = typer.Argument(app_dir)):
+def export(
+    shell: str = typer.Option(
+        "bash", "--shell", help="The shell to render for (bash, zsh)"
+    ),
+):
     """
-    Clone code or context
+    Print export/unset statements for variables that changed since the last prompt
+    """
+    state = getState(initial_environ)
+    environ = cleanEnvironment(state, initial_environ)
+    key = getCacheKey(arc["arco"]["cwd"], environ)
+
+    # Everything the context sets, including .env values the shell had before
+    env = dict(arco_context.dotenv())
+    env.update(arco_context.env(environ))
+    env = filterEnvironment(env)
+
+    writeCache(getCacheFile(app_dir, key), arco_context.files(), env)
+
+    lines = renderDiff(state, key, env, initial_environ)
+
+    if lines:
+        typer.echo("\n".join(lines))
+
+
+@app.command()
+def hook(shell: str = typer.Argument(..., help="The shell to hook into (bash, zsh)")):
+    """
+    Print a shell hook that loads the context whenever the prompt is shown
+    """
+    if shell not in ["bash", "zsh"]:
+        logger.error(f"Unsupported shell: {shell}")
+        sys.exit(1)
+
+    typer.echo(shellHook(shell, app_dir))
+
+
+facts_app = typer.Typer(help="Manage the Ansible fact cache of the context")
+app.add_typer(facts_app, name="facts")
+
+
+def getFactCache():
     """
+    The fact cache directory and timeout of the resolved context
+    """
+    settings = getFactCacheSettings(arc, app_dir)
 
-    command = ["git", "clone", repository]
+    return settings["cache_plugin_connection"], settings["cache_plugin_timeout"]
 
-    logger.info(f"Cloning {repository} to {directory}")
 
-    result = subprocess.run(command, cwd=directory)
+@facts_app.command(
+    context_settings={"allow_extra_args": True, "ignore_unknown_options": True},
+)
+def warm(
+    ctx: typer.Context,
+    pattern: str = typer.Argument("all", help="The hosts to gather facts for"),
+):
+    """
+    Gather facts into the cache, extra arguments are passed on to ansible
+    """
+    directory, timeout = getFactCache()
+
+    command_list = ["ansible", pattern, "-m", "ansible.builtin.setup"]
+    command_list += arco_context.inventory() + ctx.args
+
+    result = arco_context.run(
+        command_list,
+        env={
+            "ANSIBLE_CACHE_PLUGIN": "jsonfile",
+            "ANSIBLE_CACHE_PLUGIN_CONNECTION": directory,
+            "ANSIBLE_CACHE_PLUGIN_TIMEOUT": str(timeout),
+        },
+    )
+    recordRun("x", command_list, result.metrics)
 
     if result.returncode != 0:
         logger.error(
-            f"Command '{' '.join(command)}' returned exit code {result.returncode}"
+            f"Command '{' '.join(command_list)}' returned exit code {result.returncode}"
         )
         sys.exit(result.returncode)
 
-    return result
+    typer.secho(f"Cached facts in {directory}", fg=typer.colors.GREEN)
+
+
+@facts_app.command()
+def show(host: str = typer.Argument(None, help="Print the cached facts of this host")):
+    """
+    List the hosts in the fact cache or print the facts of one host
+    """
+    directory, timeout = getFactCache()
+
+    if host:
+        try:
+            writeConfig(loadCachedFacts(directory, host), sys.stdout)
+        except KeyError:
+            logger.error(f"No cached facts for {host} in {directory}")
+            sys.exit(1)
+
+        return
+
+    typer.secho(f"{directory} (timeout {timeout}s)", fg=typer.colors.BRIGHT_BLACK)
+
+    for entry in listCachedHosts(directory, timeout):
+        state = "expired" if entry["expired"] else "fresh"
+
+        typer.secho(
+            f"{entry['host']:<40}  {entry['age']:>8.0f}s  {state}",
+            fg=typer.colors.YELLOW if entry["expired"] else typer.colors.GREEN,
+        )
+
+
+@facts_app.command()
+def clear(
+    hosts: Optional[List[str]] = typer.Argument(None, help="Only clear these hosts"),
+):
+    """
+    Remove cached facts so they are gathered again on the next run
+    """
+    directory, _ = getFactCache()
+    removed = clearCachedFacts(directory, hosts)
+
+    typer.secho(f"Removed cached facts of {len(removed)} hosts from {directory}")
+
+
+def printCloneReport(results: list):
+    colors = {
+        "cloned": typer.colors.GREEN,
+        "fetched": typer.colors.GREEN,
+        "failed": typer.colors.RED,
+    }
+
+    for result in results:
+        typer.secho(
+            f"{result['action']:<8} {result['path']} ({result['duration']:.2f}s)",
+            fg=colors.get(result["action"]),
+        )
+
+        if result["error"]:
+            typer.secho(f"         {result['error']}", fg=typer.colors.BRIGHT_BLACK)
+
+
+@app.command()
+def clone(
+    repositories: Optional[List[str]] = typer.Argument(None),
+    directory: str = typer.Option(
+        app_dir, "--directory", "-d", help="Where to clone the repositories to"
+    ),
+    manifest: str = typer.Option(
+        None, "--manifest", "-m", help="A YAML/JSON file listing repositories to clone"
+    ),
+    mirror: bool = typer.Option(
+        True,
+        help="Clone via a bare mirror cached in app_dir (not with --depth/--partial)",
+    ),
+    depth: int = typer.Option(None, "--depth", help="Create a shallow clone"),
+    partial: bool = typer.Option(
+        False, "--partial", help="Create a blob-less partial clone"
+    ),
+    jobs: int = typer.Option(
+        4, "--jobs", "-j", help="How many repositories to clone in parallel"
+    ),
+):
+    """
+    Clone code or context
+    """
+    repositories = list(repositories or [])
+
+    # Backwards compatibility for `arco clone REPOSITORY DIRECTORY`
+    if (
+        len(repositories) == 2
+        and os.path.isdir(repositories[1])
+        and not os.path.exists(os.path.join(repositories[1], ".git"))
+        and not os.path.exists(os.path.join(repositories[1], "HEAD"))
+    ):
+        directory = repositories.pop()
+
+    if manifest:
+        _manifest = anyconfig.load(manifest)
+
+        if isinstance(_manifest, dict):
+            _manifest = _manifest.get("repositories")
+
+        repositories += _manifest or []
+
+    try:
+        entries = normalizeRepositories(repositories)
+    except ValueError as e:
+        logger.error(f"{e}")
+        sys.exit(1)
+
+    if not entries:
+        logger.error("No repositories to clone")
+        sys.exit(1)
+
+    logger.info(f"Cloning {len(entries)} repositories to {directory}")
+
+    results = cloneRepositories(
+        entries,
+        directory,
+        jobs=jobs,
+        mirror_dir=os.path.join(app_dir, "mirrors") if mirror else None,
+        depth=depth,
+        filter="blob:none" if partial else None,
+    )
+
+    printCloneReport(results)
+
+    failed = [result for result in results if result["returncode"] != 0]
+
+    if failed:
+        logger.error(f"{len(failed)} of {len(results)} repositories failed")
+        sys.exit(failed[0]["returncode"])
+
+    return results
+
+
+def getWorkspace() -> List[str]:
+    """
+    The repositories of the workspace: those of the context and code
+    and all in arco.workspace.roots (default: app_dir and .arco in the cwd)
+    """
+    roots = (arc["arco"].get("workspace") or {}).get("roots") or [
+        app_dir,
+        os.path.join(arc["arco"]["cwd"], ".arco"),
+    ]
+    roots = [
+        os.path.join(arc["arco"]["context_dir"], os.path.expanduser(root))
+        for root in roots
+    ]
+    repositories = set(findRepositories(roots))
+
+    for directory in [arc["arco"]["context_dir"], arc["arco"]["code_dir"]]:
+        root = getRepositoryRoot(directory)
+
+        if root:
+            repositories.add(root)
+
+    return sorted(repositories)
+
+
+def displayPath(path: str) -> str:
+    home = os.path.expanduser("~")
+
+    return "~" + path[len(home) :] if path.startswith(home + os.sep) else path
+
+
+def printRepositoryReport(results: list, verb: str):
+    colors = {
+        "committed": typer.colors.GREEN,
+        "pushed": typer.colors.GREEN,
+        "clean": typer.colors.BRIGHT_BLACK,
+        "up-to-date": typer.colors.BRIGHT_BLACK,
+        "failed": typer.colors.RED,
+    }
+
+    for result in results:
+        typer.secho(
+            f"{result['action']:<10} {displayPath(result['path'])} "
+            f"({result['duration']:.2f}s)",
+            fg=colors.get(result["action"]),
+        )
+
+        for line in result["error"].splitlines():
+            typer.secho(f"           {line}", fg=typer.colors.BRIGHT_BLACK)
+
+    counts = {}
+
+    for result in results:
+        counts[result["action"]] = counts.get(result["action"], 0) + 1
+
+    typer.secho(
+        ", ".join(f"{count} {action}" for action, count in counts.items()), bold=True
+    )
+
+    failed = [result for result in results if result["returncode"] != 0]
+
+    if failed:
+        logger.error(f"{len(failed)} of {len(results)} repositories failed to {verb}")
+        sys.exit(failed[0]["returncode"])
+
+
+def runWorkspace(function, jobs: int, **kwargs) -> list:
+    repositories = getWorkspace()
+
+    if not repositories:
+        logger.error("No repositories found in the workspace")
+        sys.exit(1)
+
+    logger.info(f"Running {function.__name__} in {len(repositories)} repositories")
+
+    return mapRepositories(function, repositories, jobs=jobs, **kwargs)
+
+
+@app.command()
+def status(
+    fetch: bool = typer.Option(
+        False, "--fetch", "-f", help="Fetch before comparing with the upstream"
+    ),
+    jobs: int = typer.Option(
+        8, "--jobs", "-j", help="How many repositories to check in parallel"
+    ),
+):
+    """
+    Show branch, ahead/behind and uncommitted changes of all repositories in the workspace
+    """
+    results = runWorkspace(getRepositoryStatus, jobs, fetch=fetch)
+    width = max(len(result["branch"] or "-") for result in results)
+
+    for result in results:
+        sync = "no upstream"
+
+        if result["upstream"]:
+            sync = f"+{result['ahead']} -{result['behind']}"
+
+        changes = []
+
+        if result["changed"]:
+            changes.append(f"{result['changed']} changed")
+
+        if result["untracked"]:
+            changes.append(f"{result['untracked']} untracked")
+
+        in_sync = result["upstream"] and not result["ahead"] and not result["behind"]
+        color = typer.colors.GREEN if in_sync and not changes else typer.colors.YELLOW
+
+        # A failed fetch still leaves the status of the last fetch
+        if result["branch"] is None:
+            sync, changes, color = "", ["error"], typer.colors.RED
+
+        typer.secho(
+            f"{result['branch'] or '-':<{width}}  {sync:<11}  "
+            f"{', '.join(changes) or 'clean':<24}  {displayPath(result['path'])}",
+            fg=color,
+        )
+
+        for line in result["error"].splitlines():
+            typer.secho(f"  {line}", fg=typer.colors.BRIGHT_BLACK)
+
+    if any(result["returncode"] != 0 for result in results):
+        sys.exit(1)
 
 
 @app.command()
-def commit(message: str):
+def commit(
+    message: str,
+    workspace: bool = typer.Option(
+        False,
+        "--workspace",
+        "-w",
+        help="Commit in all repositories of the workspace (see `arco status`)",
+    ),
+    jobs: int = typer.Option(
+        8, "--jobs", "-j", help="How many repositories to commit in parallel"
+    ),
+):
     """
     Commit configuration changes to the space (requires git)
     """
+    if workspace:
+        results = runWorkspace(commitRepository, jobs, message=message)
+        printRepositoryReport(results, "commit")
+
+        return results
+
     command = ["git", "commit", "-am", f"{message}"]
 
-    if arc["verbosity"] > 0:
+    if arc["arco"]["verbosity"] > 0:
         typer.secho(f"{command}", fg=typer.colors.BRIGHT_BLACK)
 
     commit = subprocess.run(command)
@@ -391,13 +625,29 @@ def commit(message: str):
 
 
 @app.command()
-def push():
+def push(
+    workspace: bool = typer.Option(
+        False,
+        "--workspace",
+        "-w",
+        help="Push all repositories of the workspace that are ahead (see `arco status`)",
+    ),
+    jobs: int = typer.Option(
+        8, "--jobs", "-j", help="How many repositories to push in parallel"
+    ),
+):
     """
     Push configuration changes to the space repository (requires git)
     """
+    if workspace:
+        results = runWorkspace(pushRepository, jobs)
+        printRepositoryReport(results, "push")
+
+        return results
+
     command = ["git", "push"]
 
-    if arc["verbosity"] > 0:
+    if arc["arco"]["verbosity"] > 0:
         typer.secho(f"{command}", fg=typer.colors.BRIGHT_BLACK)
 
     push = subprocess.run(command)
@@ -780,35 +1030,340 @@ def apollo_unhash(data: str = typer.Argument(None)):
 #             raise typer.Exit(code=executed.returncode)
 
 
-def mountConfig(config: dict, path: str = None):
-    tmp_file = tempfile.NamedTemporaryFile()
-    anyconfig.dump(config, tmp_file.name, ac_parser="yaml")
+def reloadContext(changed_files):
+    """
+    Reload only the layers whose files changed and re-resolve arc
+    """
+    global arc
+
+    previous = arco_context.env()
+    arco_context.reload(changed_files)
+    env = arco_context.env()
+
+    # Variables of values that are gone from the context
+    for key in set(previous) - set(env):
+        if key in initial_environ:
+            os.environ[key] = initial_environ[key]
+        else:
+            os.environ.pop(key, None)
+
+    os.environ.update(env)
+    arco_context.mount()
+
+    arc = arco_context.resolve()
+
+
+def recordRun(command: str, command_list, metrics: dict, program: str = None):
+    """
+    Log and export the resource usage of a child process
+    """
+    if isinstance(command_list, str):
+        command_list = [command_list]
+
+    labels = {
+        "context": arc["arco"]["name"],
+        "command": command,
+        "program": program or os.path.basename(str(command_list[0])),
+    }
+
+    recordMetrics(metrics, command_list, labels, arc["arco"].get("metrics"))
+
 
-    return tmp_file.name
+def getEntrypoint(args: List[str]):
+    try:
+        return arco_context.entrypoint(args)
+    except ArcoError as e:
+        logger.error(f"{e}")
+        sys.exit(1)
+
+
+def getTimeout(names: List[str], timeout: str = None):
+    """
+    The timeout and grace period in seconds of a command: `timeout` (from
+    --timeout), arco.timeouts.<name> of the first of `names` configured
+    there, or arco.timeout
+
+    Raises ValueError for invalid durations.
+    """
+    timeouts = arc["arco"].get("timeouts") or {}
+
+    if timeout is None:
+        configured = [timeouts[name] for name in names if name in timeouts]
+        timeout = configured[0] if configured else arc["arco"].get("timeout")
+
+    return parseDuration(timeout), parseDuration(arc["arco"].get("grace_period"))
+
+
+def runWatch(args: List[str], poll: bool = False, debounce: float = 0.3):
+    watched_files = sorted(
+        {
+            os.path.join(arc["arco"]["context_dir"], "arco.yml"),
+            os.path.join(arc["arco"]["code_dir"], "arco.yml"),
+            arc["arco"]["env_file"],
+        }
+    )
+    watcher = getWatcher(watched_files, polling=poll)
+
+    process = None
+    reported = False
+
+    try:
+        while True:
+            if process is None:
+                command_list = getEntrypoint(args)
+                logger.info(f"Running command: {' '.join(command_list)}")
+
+                process = subprocess.Popen(
+                    command_list,
+                    cwd=arc["arco"]["code_dir"],
+                    universal_newlines=True,
+                    shell=False,
+                    start_new_session=True,
+                )
+                reported = False
+
+            if not reported and process.poll() is not None:
+                if process.returncode != 0:
+                    logger.error(
+                        f"Command '{' '.join(process.args)}' returned exit code "
+                        f"{process.returncode}"
+                    )
+                logger.info("Waiting for changes")
+                reported = True
+
+            changed = waitForChanges(watcher, timeout=0.5, debounce=debounce)
+
+            if changed:
+                logger.info(f"Detected changes in {', '.join(sorted(changed))}")
+
+                # Cancel the in-flight run before re-resolving the context
+                stopProcess(process)
+                reloadContext(changed)
+                process = None
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # Also on SIGTERM/SIGHUP, which exit via forwardSignals()
+        stopProcess(process)
+        watcher.close()
+
+
+def runIncremental(
+    command_list: List[str],
+    force: bool = False,
+    stream=None,
+    timeout: float = None,
+    grace_period: float = None,
+) -> int:
+    """
+    Run the entrypoint unless a previous successful run had the same inputs
 
+    Returns the exit code of the run (0 if it was skipped).
+    """
+    code_dir = arc["arco"]["code_dir"]
+    record_dir = os.path.join(app_dir, "runs")
+    inputs = normalizeInputs(arc["arco"]["inputs"])
+    outputs = arc["arco"].get("outputs")
+
+    fingerprint = getFingerprint(command_list, inputs, arc, code_dir)
+
+    if not force:
+        record = loadRecord(record_dir, fingerprint, outputs, code_dir)
+
+        if record:
+            logger.info(
+                f"Inputs unchanged since {record['date']}, "
+                f"replaying output of '{' '.join(command_list)}'"
+            )
+            replayRecord(record, stream=stream)
+            return 0
+
+    logger.debug(f"Running command: {' '.join(command_list)}")
+
+    returncode, output, metrics = runAndRecord(
+        command_list,
+        code_dir,
+        stream=stream,
+        timeout=timeout,
+        grace_period=grace_period,
+    )
+    recordRun("run", command_list, metrics)
 
+    if returncode != 0:
+        logger.error(
+            f"Command '{' '.join(command_list)}' returned exit code {returncode}"
+        )
+        return returncode
+
+    saveRecord(record_dir, fingerprint, command_list, outputs, code_dir, output)
+
+    return 0
+
+
+def printTaskReport(results: dict, stream=None):
+    colors = {
+        "ok": typer.colors.GREEN,
+        "failed": typer.colors.RED,
+        "cached": typer.colors.GREEN,
+        "cancelled": typer.colors.YELLOW,
+        "skipped": typer.colors.BRIGHT_BLACK,
+    }
+    width = max(len(name) for name in results)
+
+    for name, result in results.items():
+        returncode = "-" if result["returncode"] is None else result["returncode"]
+        duration = "-" if result["duration"] is None else f"{result['duration']:.2f}s"
+
+        typer.secho(
+            f"{name:<{width}}  {result['status']:<9}  {returncode:>4}  {duration:>8}",
+            fg=colors.get(result["status"]),
+            file=stream,
+        )
+
+
+def runTasks(
+    targets: List[str],
+    jobs: int,
+    force: bool = False,
+    timeout: str = None,
+    stream=None,
+) -> int:
+    """
+    Run `targets` and their dependencies, returns the exit code of the
+    first failed task
+
+    Output goes to `stream` (stdout by default).
+    """
+    try:
+        tasks = normalizeTasks(arc["arco"].get("tasks"))
+        graph = getTaskGraph(tasks, targets)
+
+        # An explicit --timeout wins over the timeouts of the tasks
+        if timeout is not None:
+            for task in tasks.values():
+                task["timeout"] = None
+
+        timeout, grace_period = getTimeout(["run"], timeout)
+    except ValueError as e:
+        logger.error(f"{e}")
+        return 1
+
+    results = runTaskGraph(
+        tasks,
+        graph,
+        cwd=arc["arco"]["code_dir"],
+        jobs=jobs,
+        groups=arc["arco"].get("groups"),
+        context=arc,
+        record_dir=os.path.join(app_dir, "runs"),
+        force=force,
+        timeout=timeout,
+        grace_period=grace_period,
+        stream=stream,
+    )
+
+    for name, result in results.items():
+        recordRun("task", tasks[name]["command"], result["metrics"], program=name)
+
+    printTaskReport(results, stream)
+
+    failed = [
+        name
+        for name, result in results.items()
+        if result["status"] not in ["ok", "cached"]
+    ]
+
+    if failed:
+        returncodes = [
+            results[name]["returncode"]
+            for name in failed
+            if results[name]["status"] == "failed"
+        ]
+        return returncodes[0] if returncodes else 1
+
+    return 0
+
+
+# Options of run go before the arguments, everything after the first argument
+# (e.g. make's own -j) is passed on to the entrypoint
 @app.command(
-    context_settings={"allow_extra_args": True, "ignore_unknown_options": True},
+    context_settings={
+        "allow_extra_args": True,
+        "ignore_unknown_options": True,
+        "allow_interspersed_args": False,
+    },
 )
 @logger.catch
-def run(ctx: typer.Context):
+def run(
+    ctx: typer.Context,
+    watch: bool = typer.Option(
+        False,
+        "--watch",
+        help="Re-run the entrypoint whenever context, code or .env change",
+    ),
+    poll: bool = typer.Option(
+        False, "--poll", help="Poll for changes instead of using inotify"
+    ),
+    debounce: float = typer.Option(
+        0.3, "--debounce", help="Seconds to wait for further changes before re-running"
+    ),
+    jobs: int = typer.Option(
+        os.cpu_count() or 1, "--jobs", "-j", help="How many tasks to run in parallel"
+    ),
+    force: bool = typer.Option(
+        False, "--force", help="Run even if the declared inputs are unchanged"
+    ),
+    timeout: str = typer.Option(
+        None,
+        "--timeout",
+        help=(
+            "Stop the entrypoint or every task after this long, e.g. 90s, 15m or 2h "
+            "(default: the task's timeout, arco.timeouts.run or arco.timeout)"
+        ),
+    ),
+):
+    """
+    Run the entrypoint, or the given tasks from arco.tasks and their dependencies
+    """
     args = []
 
-    # Try to get "entrypoint" from context
-    if not arc["arco"]["entrypoint"]:
-        logger.error("No entrypoint defined")
-        sys.exit(1)
-
     if ctx.args:
         args = args + ctx.args
 
-    command_list = [arc["arco"]["entrypoint"]] + args
+    tasks = arc["arco"].get("tasks") or {}
 
-    logger.debug(f"Running command: {' '.join(command_list)}")
+    if args and all(arg in tasks for arg in args):
+        returncode = runTasks(args, jobs, force=force, timeout=timeout)
 
-    result = subprocess.run(
-        command_list, cwd=arc["arco"]["code_dir"], universal_newlines=True, shell=False
-    )
+        if returncode != 0:
+            sys.exit(returncode)
+
+        return
+
+    if watch:
+        runWatch(args, poll=poll, debounce=debounce)
+        return
+
+    command_list = getEntrypoint(args)
+
+    try:
+        timeout, grace_period = getTimeout(["run"], timeout)
+    except ValueError as e:
+        logger.error(f"{e}")
+        sys.exit(1)
+
+    if arc["arco"].get("inputs"):
+        returncode = runIncremental(
+            command_list, force=force, timeout=timeout, grace_period=grace_period
+        )
+
+        if returncode != 0:
+            sys.exit(returncode)
+
+        return
+
+    result = arco_context.run(command_list, timeout=timeout, grace_period=grace_period)
+    recordRun("run", command_list, result.metrics)
 
     if result.returncode != 0:
         logger.error(
@@ -817,69 +1372,491 @@ def run(ctx: typer.Context):
         sys.exit(result.returncode)
 
 
+def printShardRecap(results: list, stream=None):
+    recap = mergeRecaps(results)
+    width = max([len(host) for host in recap] + [20])
+
+    typer.secho(f"PLAY RECAP ({len(results)} shards)", bold=True, file=stream)
+
+    for host, counts in recap.items():
+        failed = counts.get("failed", 0) or counts.get("unreachable", 0)
+        changed = counts.get("changed", 0)
+        color = (
+            typer.colors.RED
+            if failed
+            else (typer.colors.YELLOW if changed else typer.colors.GREEN)
+        )
+        fields = "  ".join(
+            f"{field}={counts[field]}" for field in recap_fields if field in counts
+        )
+
+        typer.secho(f"{host:<{width}} : {fields}", fg=color, file=stream)
+
+    for index, result in enumerate(results, 1):
+        hosts = len(result["hosts"])
+
+        typer.secho(
+            f"shard {index}: {hosts} hosts, exit code {result['returncode']}",
+            fg=typer.colors.RED if result["returncode"] else typer.colors.GREEN,
+            file=stream,
+        )
+
+
+def getTimings():
+    """
+    The timings file and number of runs to keep of the resolved context
+    """
+    config = arc["arco"].get("timings") or {}
+    path = config.get("file") or getTimingsFile(
+        app_dir, arc["arco"]["name"], arc["arco"]["context_dir"]
+    )
+
+    return path, int(config.get("keep", default_keep))
+
+
+def startTimings():
+    """
+    Returns the environment that collects task timings of an
+    ansible-playbook run and the file they are written to, (None, None)
+    if arco.timings.enabled is false
+    """
+    if not (arc["arco"].get("timings") or {}).get("enabled", True):
+        return None, None
+
+    fd, timings_file = tempfile.mkstemp(prefix="arco-timings-", suffix=".jsonl")
+    os.close(fd)
+
+    return getTimingsEnvironment(arc.get("ansible") or {}, timings_file), timings_file
+
+
+def saveTimings(command_list, returncode: int, timings_file: str):
+    if not timings_file:
+        return
+
+    tasks = readJSONL(timings_file)
+    os.remove(timings_file)
+
+    if not tasks:
+        return
+
+    path, keep = getTimings()
+
+    try:
+        saveRun(path, newRun(command_list, returncode, tasks), keep)
+    except OSError as e:
+        logger.warning(f"Can't save task timings: {e}")
+
+
+bundle_app = typer.Typer(help="Pre-resolved contexts for CI jobs")
+app.add_typer(bundle_app, name="bundle")
+
+
+@bundle_app.command("create")
+def bundleCreate(
+    file: str = typer.Argument("arco.bundle", help="The file to write the bundle to")
+):
+    """
+    Write the resolved context, its environment and mount files to a bundle
+    that later jobs load with `arco --bundle FILE`
+    """
+    try:
+        checksum = writeBundle(createBundle(arco_context), file)
+    except OSError as e:
+        logger.error(f"Can't write bundle {file}: {e}")
+        sys.exit(1)
+
+    typer.secho(f"{file} sha256:{checksum}", fg=typer.colors.GREEN)
+
+
+@bundle_app.command("show")
+def bundleShow(file: str = typer.Argument("arco.bundle", help="The bundle to verify")):
+    """
+    Verify a bundle and print what it contains
+    """
+    try:
+        bundle = readBundle(file)
+    except ArcoError as e:
+        logger.error(f"{e}")
+        sys.exit(1)
+
+    typer.secho(f"{bundle['path']} sha256:{bundle['checksum']}", fg=typer.colors.GREEN)
+    typer.echo(f"format:  {bundle['format']}")
+    typer.echo(f"version: {bundle['version']}")
+    typer.echo(f"created: {bundle['created']}")
+    typer.echo(f"context: {bundle['context']['arco']['name']}")
+    typer.echo(
+        f"env:     {len(bundle['env'])} variables, {len(bundle['dotenv'])} from .env"
+    )
+    typer.echo(f"mounts:  {', '.join(bundle['mounts'])}")
+
+
+report_app = typer.Typer(help="Report on previous runs of the context")
+app.add_typer(report_app, name="report")
+
+
+@report_app.command("tasks")
+def reportTasks(
+    last: int = typer.Option(
+        20, "--last", "-n", help="How many of the latest runs to include"
+    ),
+    top: int = typer.Option(10, "--top", help="How many tasks to show per section"),
+    base: str = typer.Option(
+        "-2", "--base", help="The run to compare to, an id or index (-1 is the latest)"
+    ),
+    target: str = typer.Option("-1", "--target", help="The run to check for regressions"),
+    threshold: float = typer.Option(
+        20, "--threshold", help="How many percent slower a task must be to regress"
+    ),
+    min_delta: float = typer.Option(
+        1.0, "--min-delta", help="How many seconds slower a task must be to regress"
+    ),
+):
+    """
+    Show the slowest tasks, task durations across runs and regressions
+    between two runs of x ansible-playbook
+    """
+    path, _ = getTimings()
+    runs = readJSONL(path)
+
+    if not runs:
+        logger.error(f"No task timings recorded in {path}")
+        sys.exit(1)
+
+    try:
+        latest = findRun(runs, target)
+    except KeyError:
+        logger.error(f"No run '{target}' in {path}")
+        sys.exit(1)
+
+    typer.secho(f"{path} ({len(runs)} runs)", fg=typer.colors.BRIGHT_BLACK)
+
+    typer.secho(f"\nSlowest tasks of run {latest['id']}", bold=True)
+
+    durations = sorted(getTaskDurations(latest).items(), key=lambda item: -item[1])
+
+    for key, duration in durations[:top]:
+        typer.echo(f"{duration:>9.2f}s  {key}")
+
+    included = runs[-last:]
+    stats = sorted(getTaskStats(included), key=lambda task: -task["p95"])
+
+    typer.secho(f"\nTask durations across {len(included)} runs", bold=True)
+    typer.secho(
+        f"{'p50':>10}  {'p95':>9}  {'max':>9}  {'runs':>4}  task",
+        fg=typer.colors.BRIGHT_BLACK,
+    )
+
+    for task in stats[:top]:
+        typer.echo(
+            f"{task['p50']:>9.2f}s  {task['p95']:>8.2f}s  {task['max']:>8.2f}s  "
+            f"{task['runs']:>4}  {task['task']}"
+        )
+
+    try:
+        previous = findRun(runs, base)
+    except KeyError:
+        return
+
+    if previous is latest:
+        return
+
+    regressions = getRegressions(previous, latest, threshold, min_delta)
+
+    typer.secho(f"\nRegressions from run {previous['id']} to {latest['id']}", bold=True)
+
+    if not regressions:
+        typer.secho("None", fg=typer.colors.GREEN)
+
+    for regression in regressions[:top]:
+        typer.secho(
+            f"{regression['delta']:>+9.2f}s  "
+            f"{regression['before']:.2f}s -> {regression['after']:.2f}s  "
+            f"{regression['task']}",
+            fg=typer.colors.RED,
+        )
+
+
+def runShardedPlaybook(
+    command: str,
+    command_list,
+    shards: int,
+    env: dict = None,
+    timeout: float = None,
+    grace_period: float = None,
+    stream=None,
+):
+    """
+    Run an ansible-playbook command_list in shards, returns None if it
+    can't be sharded and should be run as is
+    """
+    results = runShards(
+        arco_context,
+        command_list,
+        shards,
+        env=env,
+        timeout=timeout,
+        grace_period=grace_period,
+        stream=stream,
+    )
+
+    if results is None:
+        return None
+
+    for index, result in enumerate(results, 1):
+        recordRun("x", command_list, result["metrics"], program=f"{command}:shard{index}")
+
+    printShardRecap(results, stream)
+
+    return mergeReturncodes(result["returncode"] for result in results)
+
+
+# Options of x go before the command, everything after it (e.g. helm's
+# own --timeout) is passed on
 @app.command(
-    context_settings={"allow_extra_args": True, "ignore_unknown_options": True},
+    context_settings={
+        "allow_extra_args": True,
+        "ignore_unknown_options": True,
+        "allow_interspersed_args": False,
+    },
 )
 @logger.catch
-def x(ctx: typer.Context, command: str = typer.Argument(...)):
-    args = []
-    command_list = [command]
+def x(
+    ctx: typer.Context,
+    command: str = typer.Argument(...),
+    shards: str = typer.Option(
+        None,
+        "--shards",
+        help=(
+            "Split the hosts of ansible-playbook into this many parallel runs, "
+            "0 or auto for one per CPU (default: ansible.shards or 1)"
+        ),
+    ),
+    timeout: str = typer.Option(
+        None,
+        "--timeout",
+        help=(
+            "Stop the command after this long, e.g. 90s, 15m or 2h "
+            "(default: arco.timeouts.<command> or arco.timeout)"
+        ),
+    ),
+):
+    command_list = arco_context.command(command, ctx.args)
+    returncode = None
+    env, timings_file = None, None
 
-    if ctx.args:
-        args = args + ctx.args
+    try:
+        timeout, grace_period = getTimeout(
+            [command, os.path.basename(command_list[0])], timeout
+        )
+    except ValueError as e:
+        logger.error(f"{e}")
+        sys.exit(1)
+
+    if shards is None:
+        shards = (arc.get("ansible") or {}).get("shards", 1)
 
     if command in ["ansible-playbook", "ap", "ak"]:
-        # Create tempfile with inventory from config
-        # arc["clusters"][cluster]["inventory"]
-        inventory = benedict(arc["ansible"]["inventory"])
+        try:
+            shards = getShardCount(shards)
+        except ValueError:
+            logger.error(f"Invalid shard count '{shards}'")
+            sys.exit(1)
 
-        if inventory:
-            # Create tempfile
-            mounted_inventory = mountConfig(inventory)
+        env, timings_file = startTimings()
+
+        if shards > 1:
+            returncode = runShardedPlaybook(
+                command,
+                command_list,
+                shards,
+                env=env,
+                timeout=timeout,
+                grace_period=grace_period,
+            )
+
+    if returncode is None:
+        result = arco_context.run(
+            command_list, env=env, timeout=timeout, grace_period=grace_period
+        )
+        recordRun("x", command_list, result.metrics)
+        returncode = result.returncode
 
-            command_list.append("-i")
-            command_list.append(mounted_inventory)
+    saveTimings(command_list, returncode, timings_file)
 
-        inventory_file = arc["ansible"].get("inventory_file")
+    if returncode != 0:
+        logger.error(
+            f"Command '{' '.join(command_list)}' returned exit code {returncode}"
+        )
+        sys.exit(returncode)
 
-        if inventory_file:
-            command_list.append("-i")
-            command_list.append(inventory_file)
 
-        command_list.append("--extra-vars")
-        command_list.append(f"{arc.dump()}")
+def runBatchStep(step: dict, stream=None) -> int:
+    """
+    Run one step of `arco batch` against the already resolved context
+    """
+    # Parse the step with the options of the command it stands for
+    command = typer.main.get_command(app).commands[step["command"]]
+
+    with command.make_context(step["command"], list(step["args"])) as ctx:
+        params = ctx.params
+        args = ctx.args
+
+    if step["command"] == "config":
+        writeConfig(
+            filterConfig(params["filter"]),
+            stream or sys.stdout,
+            format=params["format"],
+            pretty=params["pretty"],
+        )
+        return 0
 
-        pass
+    if step["command"] == "x":
+        command_list = arco_context.command(params["command"], args)
+        timeout, grace_period = getTimeout(
+            [params["command"], os.path.basename(command_list[0])], params["timeout"]
+        )
+        env, timings_file, returncode = None, None, None
+
+        if params["command"] in ["ansible-playbook", "ap", "ak"]:
+            shards = params["shards"]
+
+            if shards is None:
+                shards = (arc.get("ansible") or {}).get("shards", 1)
+
+            try:
+                shards = getShardCount(shards)
+            except ValueError:
+                raise ValueError(f"Invalid shard count '{shards}'")
+
+            env, timings_file = startTimings()
+
+            if shards > 1:
+                returncode = runShardedPlaybook(
+                    params["command"],
+                    command_list,
+                    shards,
+                    env=env,
+                    timeout=timeout,
+                    grace_period=grace_period,
+                    stream=stream,
+                )
 
-    if command in ["docker"]:
-        pass
+        if returncode is None:
+            returncode, metrics = runCommand(
+                arco_context,
+                command_list,
+                stream,
+                env=env,
+                timeout=timeout,
+                grace_period=grace_period,
+            )
+            recordRun("x", command_list, metrics)
+
+        saveTimings(command_list, returncode, timings_file)
+
+    else:
+        tasks = arc["arco"].get("tasks") or {}
+
+        if params["watch"]:
+            raise ValueError("--watch is not supported in batches")
+
+        if args and all(arg in tasks for arg in args):
+            return runTasks(
+                args,
+                params["jobs"],
+                force=params["force"],
+                timeout=params["timeout"],
+                stream=stream,
+            )
+
+        command_list = arco_context.entrypoint(args)
+        timeout, grace_period = getTimeout(["run"], params["timeout"])
+
+        if arc["arco"].get("inputs"):
+            return runIncremental(
+                command_list,
+                force=params["force"],
+                stream=stream,
+                timeout=timeout,
+                grace_period=grace_period,
+            )
+
+        returncode, metrics = runCommand(
+            arco_context, command_list, stream, timeout=timeout, grace_period=grace_period
+        )
+        recordRun("run", command_list, metrics)
 
-    if command in ["helm"]:
-        if "install" in args:
-            command_list.append("-f")
-            command_list.append(arc["arco"]["mountpoint"])
+    if returncode != 0:
+        logger.error(
+            f"Command '{' '.join(command_list)}' returned exit code {returncode}"
+        )
 
-        pass
+    return returncode
 
-    command_list = command_list + args
 
-    logger.debug(f"Running command: {' '.join(command_list)}")
+def printBatchReport(steps: list, results: list):
+    colors = {
+        "ok": typer.colors.GREEN,
+        "failed": typer.colors.RED,
+        "skipped": typer.colors.BRIGHT_BLACK,
+    }
 
-    result = subprocess.run(
-        command_list, cwd=arc["arco"]["code_dir"], universal_newlines=True, shell=False
-    )
+    for index, (step, result) in enumerate(zip(steps, results), 1):
+        returncode = "-" if result["returncode"] is None else result["returncode"]
+        duration = "-" if result["duration"] is None else f"{result['duration']:.2f}s"
 
-    if result.returncode != 0:
-        logger.error(
-            f"Command '{' '.join(command_list)}' returned exit code {result.returncode}"
+        typer.secho(
+            f"{index:>3}  {result['status']:<7}  {returncode:>4}  {duration:>8}  "
+            f"{step['line']}",
+            fg=colors.get(result["status"]),
+            err=True,
         )
-        sys.exit(result.returncode)
+
+
+@app.command()
+def batch(
+    file: str = typer.Argument(
+        "-", help="A file with one run/x/config step per line or a JSON list, - for stdin"
+    ),
+    jobs: int = typer.Option(1, "--jobs", "-j", help="How many steps to run in parallel"),
+    keep_going: bool = typer.Option(
+        False, "--keep-going", "-k", help="Don't stop at the first failed step"
+    ),
+):
+    """
+    Run several run/x/config steps against a context that is resolved only once
+    """
+    try:
+        if file == "-":
+            steps = parseSteps(sys.stdin.read())
+        else:
+            with open(file) as file_:
+                steps = parseSteps(file_.read())
+    except (OSError, ValueError) as e:
+        logger.error(f"Can't read steps from {file}: {e}")
+        sys.exit(1)
+
+    if not steps:
+        logger.error("No steps to run")
+        sys.exit(1)
+
+    results = runBatch(steps, runBatchStep, jobs=jobs, keep_going=keep_going)
+
+    printBatchReport(steps, results)
+
+    returncodes = [
+        result["returncode"] for result in results if result["status"] == "failed"
+    ]
+
+    if returncodes:
+        sys.exit(returncodes[0])
+    elif any(result["status"] != "ok" for result in results):
+        sys.exit(1)
 
 
 def version_callback(value: bool):
     if value:
-        version = read_version(str(Path(__file__).parent / "__init__.py"))
-        typer.echo(f"{version}")
+        typer.echo(f"{getVersion()}")
         raise typer.Exit()
 
 
@@ -939,171 +1916,76 @@ def callback(
         help="Add additional vars at runtime; you can use paths like '--var context.key=value' to nest values",
         autocompletion=arc_search,
     ),
+    bundle: str = typer.Option(
+        None,
+        "--bundle",
+        help=(
+            "Load a context bundle created by `arco bundle create` "
+            "instead of resolving the context"
+        ),
+        envvar=["ARCO_BUNDLE"],
+    ),
     version: Optional[bool] = typer.Option(
         None, "--version", callback=version_callback, is_eager=True
     ),
 ):
-    # Load from .env
-    load_dotenv(dotenv_path=env_file)
-
-    # conf = arc
     global arc
-    global logger
-
-    # Name
-    if name:
-        arc["arco"]["name"] = name
-
-    # Discovery
-    arc["arco"]["discover"] = discover
+    global arco_context
 
     # Loglevel
-    arc["arco"]["loglevel"] = loglevel.upper()
     logger_config["handlers"][0]["level"] = loglevel.upper()
-    logger.configure(**logger_config)
 
-    # Load default context from app_dir
-    if default:
-        _default_context_file = os.path.join(app_dir, "arco.yml")
-        _default_context = loadConfig(_default_context_file)
-
-        if _default_context:
-            _default_context.traverse(contextualizeDict)
-            arc.merge(_default_context, overwrite=True, concat=False)
-
-            logger.debug(f"Merged default context from {app_dir}")
-
-    # Populate extra vars for the first time
-    # We're doing this twice so we can inject vars to the context
-    # that can be used while pulling additional context
-    # from another endpoint (--context)
-    # Later we will run this piece of code again
-    # to make sure that the --vars overrride loaded context again
-    logger.debug(
-        f"Populating vars from --var to make them available when using --context"
-    )
-    for v in var:
-        key, value = v.split("=")
-
-        # Split key on separator (.)
-        # d = benedict(arc)
-        arc[key] = value
-
-    if code:
-        # Try to find code_dir locally
-        code_dir = os.path.join(os.getcwd(), code)
-        code_found = False
-
-        if os.path.isdir(code_dir):
-            logger.debug(f"Found code_dir in {code_dir}")
-            arc["arco"]["code_dir"] = code_dir
-            code_found = True
-
-        # Try to find code_dir .arco/ in $CWD
-        code_dir = os.path.join(os.getcwd(), ".arco", code)
-
-        if os.path.isdir(code_dir):
-            logger.debug(f"Found code_dir in {code_dir}")
-            arc["arco"]["code_dir"] = code_dir
-            code_found = True
-
-        # Try to find code_dir in app_dir
-        code_dir = os.path.join(arc["arco"]["app_dir"], code)
-
-        if os.path.isdir(code_dir):
-            logger.debug(f"Found code_dir in {code_dir}")
-            arc["arco"]["code_dir"] = code_dir
-            code_found = True
-
-        # Can't find code_dir?
-        # Exit. The user has specified to use it
-        # so we should terminate if it can't be found
-        if not code_found:
-            logger.error(f"Can't locate code in {code}")
-            sys.exit(1)
+    # Keep stdout clean for output that is meant to be eval'd by a shell
+    if ctx.invoked_subcommand in ["export", "hook"]:
+        logger_config["handlers"][0]["sink"] = sys.stderr
 
-    if context:
-        # Try to find context_dir locally
-        context_dir = os.path.join(os.getcwd(), context)
-        context_found = False
-
-        if os.path.isdir(context_dir):
-            logger.debug(f"Found context_dir in {context_dir}")
-            arc["arco"]["context_dir"] = context_dir
-            context_found = True
-
-        # Try to find context_dir .arco/ in $CWD
-        context_dir = os.path.join(os.getcwd(), ".arco", context)
-
-        if os.path.isdir(context_dir):
-            logger.debug(f"Found context_dir in {context_dir}")
-            arc["arco"]["context_dir"] = context_dir
-            context_found = True
-
-        # Try to find context_dir in app_dir
-        context_dir = os.path.join(arc["arco"]["app_dir"], context)
-
-        if os.path.isdir(context_dir):
-            logger.debug(f"Found context_dir in {context_dir}")
-            arc["arco"]["context_dir"] = context_dir
-            context_found = True
-
-        # Can't find context_dir?
-        # Exit. The user has specified to use it
-        # so we should terminate if it can't be found
-        if not context_found:
-            logger.error(f"Can't locate context in {context}")
-            sys.exit(1)
-
-    # Load context
-    _context_file = os.path.join(arc["arco"]["context_dir"], "arco.yml")
-    _context = loadConfig(_context_file)
-
-    if _context:
-        _context.traverse(contextualizeDict)
-
-    # Load code context
-    _code_file = os.path.join(arc["arco"]["code_dir"], "arco.yml")
-    _code = loadConfig(_code_file)
-
-    # Merge
-    # 1. Code
-    if _code:
-        arc.merge(_code, overwrite=True, concat=False)
-
-        logger.debug(f"Merged code from {arc['arco']['code_dir']}")
-
-        # Discover additional stuff
-        if discover:
-            current_dir = os.getcwd()
-            os.chdir(arc["arco"]["code_dir"])
-
-            discovered = discoverContext()
-
-            arc.merge(discovered, overwrite=True, concat=False)
-
-            os.chdir(current_dir)
+    logger.configure(**logger_config)
 
-    # 2. Context
-    if _context:
-        arc.merge(_context, overwrite=True, concat=False)
+    # Children run in their own process groups, pass signals on to them
+    if ctx.invoked_subcommand in ["run", "x", "batch"]:
+        forwardSignals()
 
-        logger.debug(f"Merged context from {arc['arco']['context_dir']}")
+    if bundle:
+        try:
+            bundle = readBundle(bundle)
+        except ArcoError as e:
+            logger.error(f"{e}")
+            sys.exit(1)
 
-    # Populate extra vars
-    logger.debug(f"Populating vars from --var")
-    for v in var:
-        key, value = v.split("=")
+        if bundle["version"] != getVersion():
+            logger.warning(
+                f"Bundle was created by arco {bundle['version']}, this is {getVersion()}"
+            )
+
+    arco_context = ArcoContext(
+        context=context,
+        code=code,
+        default=default,
+        discover=discover,
+        env_file=env_file,
+        name=name,
+        var=var,
+        app_dir=app_dir,
+        environ=initial_environ,
+        loglevel=loglevel,
+        bundle=bundle,
+    )
+    ctx.call_on_close(arco_context.close)
 
-        # Split key on separator (.)
-        # d = benedict(arc)
-        arc[key] = value
+    try:
+        # Flattening and mounting read every file value, so only commands whose
+        # children inherit os.environ get the context populated and mounted
+        if ctx.invoked_subcommand in ["run", "x", "batch", "commit", "push"]:
+            # Populate arc to environment
+            os.environ.update(arco_context.env())
 
-    # Populate arc to environment
-    dict2Environment(arc)
+            # Mount arc
+            arco_context.mount()
 
-    # Mount arc
-    arc["arco"]["mountpoint"] = mountConfig(arc)
+        arc = arco_context.resolve()
+    except ArcoError as e:
+        logger.error(f"{e}")
+        sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,238 @@
+"""
+Resource usage of the processes arco launches
+
+Children are reaped with wait4() so their rusage (CPU time, max RSS,
+block I/O) is available after they exit. Metrics are logged and can be
+exported to a Prometheus node-exporter textfile and a JSON lines file,
+configured via arco.metrics.textfile and arco.metrics.jsonl.
+
+On Linux the max RSS of a child includes the memory of the arco process
+it was forked from, so it is only meaningful above arco's own footprint.
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import datetime
+import subprocess
+from loguru import logger
+from .repos import fileLock
+from .timings import stripContext
+from .process import (
+    Supervisor,
+    processGroupArguments,
+    canTakeTerminal,
+    timeout_returncode,
+)
+
+metric_help = {
+    "duration_seconds": "Wall time of the last run",
+    "cpu_user_seconds": "User CPU time of the last run",
+    "cpu_system_seconds": "System CPU time of the last run",
+    "max_rss_bytes": "Maximum resident set size of the last run",
+    "io_read_blocks": "Blocks read from the filesystem by the last run",
+    "io_write_blocks": "Blocks written to the filesystem by the last run",
+    "exit_code": "Exit code of the last run",
+    "last_run_timestamp_seconds": "When the last run finished",
+}
+
+_sample = re.compile(r"^(arco_command_[a-z_]+)\{(.*)\} (\S+)$")
+
+
+class MeasuredPopen(subprocess.Popen):
+    """
+    A Popen that keeps the resource usage of its child in `rusage`
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.started = time.monotonic()
+        self.ended = None
+        self.rusage = None
+
+        super().__init__(*args, **kwargs)
+
+    def _try_wait(self, wait_flags):
+        # Same as Popen._try_wait, but with wait4() instead of waitpid()
+        try:
+            pid, sts, rusage = os.wait4(self.pid, wait_flags)
+        except ChildProcessError:
+            return (self.pid, 0)
+
+        if pid == self.pid:
+            self.ended = time.monotonic()
+            self.rusage = rusage
+
+        return (pid, sts)
+
+
+def getMetrics(process: MeasuredPopen) -> dict:
+    """
+    The resource usage of a finished MeasuredPopen, None if it is unknown
+    """
+    rusage = getattr(process, "rusage", None)
+
+    if rusage is None:
+        return None
+
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    max_rss = rusage.ru_maxrss if sys.platform == "darwin" else rusage.ru_maxrss * 1024
+
+    return {
+        "duration_seconds": process.ended - process.started,
+        "cpu_user_seconds": rusage.ru_utime,
+        "cpu_system_seconds": rusage.ru_stime,
+        "max_rss_bytes": max_rss,
+        "io_read_blocks": rusage.ru_inblock,
+        "io_write_blocks": rusage.ru_oublock,
+        "exit_code": process.returncode,
+    }
+
+
+def runMeasured(
+    command_list,
+    input=None,
+    capture_output=False,
+    timeout: float = None,
+    grace_period: float = None,
+    **kwargs,
+):
+    """
+    subprocess.run() with a MeasuredPopen, the returned CompletedProcess
+    has the resource usage of the child in `metrics`
+
+    The child runs in its own process group under a Supervisor. If it
+    is still running after `timeout` seconds its group is stopped, the
+    result then has `timed_out` set and returncode timeout_returncode.
+    """
+    if input is not None:
+        kwargs["stdin"] = subprocess.PIPE
+
+    if capture_output:
+        kwargs["stdout"] = subprocess.PIPE
+        kwargs["stderr"] = subprocess.PIPE
+
+    kwargs.update(processGroupArguments())
+    foreground = kwargs.get("stdin") is None and canTakeTerminal()
+
+    with MeasuredPopen(command_list, **kwargs) as process:
+        with Supervisor(process, timeout, grace_period, foreground) as supervisor:
+            stdout, stderr = process.communicate(input)
+
+    returncode = timeout_returncode if supervisor.timed_out else process.returncode
+
+    result = subprocess.CompletedProcess(process.args, returncode, stdout, stderr)
+    result.metrics = getMetrics(process)
+    result.timed_out = supervisor.timed_out
+
+    return result
+
+
+def formatMetrics(metrics: dict) -> str:
+    return (
+        f"wall {metrics['duration_seconds']:.2f}s, "
+        f"user {metrics['cpu_user_seconds']:.2f}s, "
+        f"system {metrics['cpu_system_seconds']:.2f}s, "
+        f"max rss {metrics['max_rss_bytes'] / 1024 / 1024:.1f} MiB, "
+        f"blocks in/out {metrics['io_read_blocks']}/{metrics['io_write_blocks']}"
+    )
+
+
+def _escapeLabel(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _formatLabels(labels: dict) -> str:
+    return ",".join(
+        f'{key}="{_escapeLabel(value)}"' for key, value in sorted(labels.items())
+    )
+
+
+def writeTextfile(path: str, metrics: dict, labels: dict):
+    """
+    Update the series for `labels` in a node-exporter textfile
+
+    Series of other commands already in the file are kept. The file is
+    replaced atomically so node-exporter never reads a partial file.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    samples = {}
+    metrics = dict(metrics, last_run_timestamp_seconds=time.time())
+    label_string = _formatLabels(labels)
+
+    with fileLock(f"{path}.lock"):
+        try:
+            with open(path) as file_:
+                for line in file_:
+                    match = _sample.match(line.strip())
+
+                    if match:
+                        samples[(match.group(1), match.group(2))] = match.group(3)
+        except OSError:
+            pass
+
+        for name, value in metrics.items():
+            samples[(f"arco_command_{name}", label_string)] = repr(float(value))
+
+        lines = []
+
+        for name, help in metric_help.items():
+            metric = f"arco_command_{name}"
+            series = sorted(key for key in samples if key[0] == metric)
+
+            if not series:
+                continue
+
+            lines.append(f"# HELP {metric} {help}")
+            lines.append(f"# TYPE {metric} gauge")
+            lines += [
+                f"{metric}{{{labels}}} {samples[(metric, labels)]}"
+                for _, labels in series
+            ]
+
+        tmp_file = f"{path}.{os.getpid()}.tmp"
+
+        with open(tmp_file, "w") as file_:
+            file_.write("\n".join(lines) + "\n")
+
+        os.replace(tmp_file, path)
+
+
+def appendJSONL(path: str, metrics: dict, labels: dict, command_list):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    record = dict(labels)
+    record.update(
+        {
+            "date": datetime.datetime.utcnow().isoformat(),
+            "args": stripContext(command_list),
+        }
+    )
+    record.update(metrics)
+
+    # One write per record, appends of concurrent runs don't interleave
+    with open(path, "a") as file_:
+        file_.write(json.dumps(record) + "\n")
+
+
+def recordMetrics(metrics: dict, command_list, labels: dict, config: dict = None):
+    """
+    Log `metrics` and export them as configured in arco.metrics
+    """
+    if not metrics:
+        return
+
+    config = config or {}
+
+    logger.info(f"{' '.join(stripContext(command_list))}: {formatMetrics(metrics)}")
+
+    try:
+        if config.get("textfile"):
+            writeTextfile(config["textfile"], metrics, labels)
+
+        if config.get("jsonl"):
+            appendJSONL(config["jsonl"], metrics, labels, command_list)
+    except OSError as e:
+        logger.warning(f"Can't export metrics: {e}")
@@ -0,0 +1,291 @@
+"""
+Process groups, timeouts and signals of the commands arco runs
+
+Children run in a process group of their own, so stopping them reaches
+everything they started (ansible forks, helm hooks, ...) and not just
+the direct child. Stopping a group sends SIGTERM and, if anything in it
+is still alive after the grace period, SIGKILL.
+
+Signals arco receives while a Supervisor watches a child are forwarded
+to the child's group, with the same escalation to SIGKILL.
+"""
+
+import os
+import re
+import sys
+import time
+import signal
+import threading
+import subprocess
+from loguru import logger
+
+default_grace_period = 5
+
+# Exit code of commands that were stopped after their timeout, as with timeout(1)
+timeout_returncode = 124
+
+forwarded_signals = [signal.SIGINT, signal.SIGTERM, signal.SIGHUP]
+
+_duration = re.compile(r"(\d+(?:\.\d+)?)\s*(s|m|h|d)?")
+_units = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+# Supervisors of running children, signals are forwarded to their groups
+_supervisors = set()
+_supervisors_lock = threading.Lock()
+
+
+def parseDuration(value) -> float:
+    """
+    Seconds of a duration like 90, "90s", "15m" or "2h"
+
+    None, empty and zero mean no limit and return None. Raises
+    ValueError for anything else that isn't a duration.
+    """
+    if value is None or value == "" or value is False:
+        return None
+
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        seconds = float(value)
+    else:
+        match = _duration.fullmatch(str(value).strip().lower())
+
+        if not match:
+            raise ValueError(f"Invalid duration '{value}'")
+
+        seconds = float(match.group(1)) * _units[match.group(2) or "s"]
+
+    if seconds < 0:
+        raise ValueError(f"Invalid duration '{value}'")
+
+    return seconds or None
+
+
+def processGroupArguments() -> dict:
+    """
+    Popen arguments that start the child in a process group of its own
+
+    Unlike start_new_session the child stays in arco's session, so it
+    can still be given the terminal.
+    """
+    # Popen(process_group=) is new in Python 3.11
+    if sys.version_info >= (3, 11):
+        return {"process_group": 0}
+
+    return {"preexec_fn": os.setpgrp}
+
+
+def signalGroup(pgid: int, signum: int) -> bool:
+    """
+    Send `signum` to a process group, False if the group is gone
+    """
+    try:
+        os.killpg(pgid, signum)
+    except (ProcessLookupError, PermissionError):
+        return False
+
+    return True
+
+
+def stopProcess(process: subprocess.Popen, grace_period: float = default_grace_period):
+    """
+    Stop `process` and everything in its process group
+
+    The process must lead its own process group (start_new_session or
+    processGroupArguments()).
+    """
+    if process is None:
+        return
+
+    # Grandchildren can outlive the child, so its group is checked too
+    if process.poll() is not None and not signalGroup(process.pid, 0):
+        return
+
+    logger.debug(f"Stopping process {process.pid}")
+
+    signalGroup(process.pid, signal.SIGTERM)
+    killGroup(process, grace_period)
+
+
+def killGroup(process: subprocess.Popen, grace_period: float = default_grace_period):
+    """
+    SIGKILL the process group of `process` if anything in it is still
+    alive after `grace_period` seconds
+    """
+    deadline = time.monotonic() + grace_period
+
+    try:
+        process.wait(timeout=grace_period)
+    except subprocess.TimeoutExpired:
+        pass
+
+    # The exited child is reaped, so the group only exists while others are alive
+    while signalGroup(process.pid, 0) and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+    if signalGroup(process.pid, 0):
+        logger.warning(
+            f"Process group {process.pid} still running after {grace_period}s, killing it"
+        )
+        signalGroup(process.pid, signal.SIGKILL)
+        process.wait()
+
+
+class Supervisor:
+    """
+    Watch a child that leads its own process group
+
+        with Supervisor(process, timeout=600) as supervisor:
+            process.wait()
+
+        supervisor.timed_out
+
+    The group is stopped once `timeout` seconds passed and when the block
+    is left with an exception (e.g. KeyboardInterrupt). With `foreground`
+    the child gets the terminal for the time it runs, so it can read from
+    it and Ctrl-C reaches its group directly.
+    """
+
+    def __init__(
+        self,
+        process: subprocess.Popen,
+        timeout: float = None,
+        grace_period: float = None,
+        foreground: bool = False,
+    ):
+        self.process = process
+        self.timeout = timeout
+        self.grace_period = default_grace_period if grace_period is None else grace_period
+        self.foreground = foreground
+        self.timed_out = False
+        self._threads = []
+        self._terminal = None
+
+    def __enter__(self):
+        with _supervisors_lock:
+            _supervisors.add(self)
+
+        if self.foreground:
+            self._takeTerminal()
+
+        if self.timeout:
+            timer = threading.Timer(self.timeout, self._expire)
+            timer.daemon = True
+            timer.start()
+            self._threads.append(timer)
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        for thread in self._threads:
+            if isinstance(thread, threading.Timer):
+                thread.cancel()
+
+        if exc_type is not None:
+            stopProcess(self.process, self.grace_period)
+
+        # Let a running escalation finish, it may still have to kill stragglers
+        for thread in list(self._threads):
+            if thread.is_alive() and thread is not threading.current_thread():
+                thread.join()
+
+        with _supervisors_lock:
+            _supervisors.discard(self)
+
+        self._restoreTerminal()
+
+    def _expire(self):
+        if self.process.poll() is not None:
+            return
+
+        self.timed_out = True
+        command = self.process.args
+
+        if not isinstance(command, str):
+            command = " ".join(map(str, command))
+
+        logger.error(
+            f"Command '{command}' timed out after {self.timeout:g}s, stopping it"
+        )
+        stopProcess(self.process, self.grace_period)
+
+    def forward(self, signum: int):
+        """
+        Send `signum` to the child's group, SIGKILL it after the grace period
+        """
+        if not signalGroup(self.process.pid, signum):
+            return
+
+        thread = threading.Thread(
+            target=killGroup, args=(self.process, self.grace_period), daemon=True
+        )
+        thread.start()
+        self._threads.append(thread)
+
+    def _takeTerminal(self):
+        try:
+            fd = sys.stdin.fileno()
+
+            if not os.isatty(fd) or os.tcgetpgrp(fd) != os.getpgrp():
+                return
+
+            os.tcsetpgrp(fd, self.process.pid)
+        except (AttributeError, ValueError, OSError):
+            return
+
+        self._terminal = fd
+
+        # The child may have tried to read before it owned the terminal
+        signalGroup(self.process.pid, signal.SIGCONT)
+
+    def _restoreTerminal(self):
+        if self._terminal is None:
+            return
+
+        # arco is in the background until it has the terminal back
+        handler = signal.signal(signal.SIGTTOU, signal.SIG_IGN)
+
+        try:
+            os.tcsetpgrp(self._terminal, os.getpgrp())
+        except OSError:
+            pass
+        finally:
+            signal.signal(signal.SIGTTOU, handler)
+            self._terminal = None
+
+
+def _forwardSignal(signum, frame):
+    with _supervisors_lock:
+        supervisors = list(_supervisors)
+
+    if not supervisors:
+        # Nothing to forward to, behave as if there was no handler
+        if signum == signal.SIGINT:
+            raise KeyboardInterrupt
+
+        sys.exit(128 + signum)
+
+    logger.warning(
+        f"Received {signal.Signals(signum).name}, "
+        f"forwarding it to {len(supervisors)} command(s)"
+    )
+
+    for supervisor in supervisors:
+        supervisor.forward(signum)
+
+
+def forwardSignals():
+    """
+    Forward SIGINT, SIGTERM and SIGHUP to the supervised children
+
+    Must be called from the main thread.
+    """
+    for signum in forwarded_signals:
+        signal.signal(signum, _forwardSignal)
+
+
+def canTakeTerminal() -> bool:
+    """
+    Whether a child started now may be given the terminal, only the
+    main thread hands it over so concurrent children don't compete
+    """
+    return threading.current_thread() is threading.main_thread()
@@ -0,0 +1,368 @@
+import os
+import time
+import fcntl
+import shutil
+import hashlib
+import subprocess
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from loguru import logger
+
+# How many levels below each root findRepositories() looks for repositories
+workspace_depth = 2
+
+
+def git(args, cwd: str = None, env: dict = None) -> subprocess.CompletedProcess:
+    command = ["git"] + args
+
+    logger.debug(f"Running command: {' '.join(command)}")
+
+    return subprocess.run(
+        command,
+        cwd=cwd,
+        env=dict(os.environ, **env) if env else None,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+
+
+def getRepositoryName(repository: str) -> str:
+    """
+    The directory name `git clone` would pick for `repository`
+    """
+    name = repository.rstrip("/").rsplit("/", 1)[-1].rsplit(":", 1)[-1]
+
+    return name[:-4] if name.endswith(".git") else name
+
+
+def normalizeRepositories(repositories) -> list:
+    """
+    Repositories are either URLs or dicts with `repository` (or `url`)
+    and optionally `directory` and `branch`
+    """
+    normalized = []
+
+    for entry in repositories or []:
+        if isinstance(entry, str):
+            entry = {"repository": entry}
+
+        repository = entry.get("repository") or entry.get("url")
+
+        if not repository:
+            raise ValueError(f"Repository entry without url: {entry}")
+
+        normalized.append(
+            {
+                "repository": repository,
+                "directory": entry.get("directory") or getRepositoryName(repository),
+                "branch": entry.get("branch"),
+            }
+        )
+
+    return normalized
+
+
+@contextmanager
+def fileLock(path: str):
+    with open(path, "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+# Mirrors already updated by this process
+_fresh_mirrors = set()
+
+
+def getMirrorPath(repository: str, mirror_dir: str) -> str:
+    digest = hashlib.sha1(repository.encode()).hexdigest()[:12]
+
+    return os.path.join(mirror_dir, f"{getRepositoryName(repository)}-{digest}.git")
+
+
+def updateMirror(repository: str, mirror_dir: str) -> str:
+    """
+    Create or refresh a bare mirror of `repository` and return its path
+
+    Concurrent arco processes serialize on a lock file per mirror in
+    mirror_dir/locks.
+    """
+    lock_dir = os.path.join(mirror_dir, "locks")
+    os.makedirs(lock_dir, exist_ok=True)
+    mirror = getMirrorPath(repository, mirror_dir)
+
+    with fileLock(os.path.join(lock_dir, f"{os.path.basename(mirror)}.lock")):
+        if mirror in _fresh_mirrors:
+            return mirror
+
+        if os.path.isdir(mirror):
+            result = git(["remote", "update", "--prune"], cwd=mirror)
+        else:
+            # Clone next to the final path so a failed clone leaves no broken mirror
+            tmp_mirror = f"{mirror}.tmp"
+            shutil.rmtree(tmp_mirror, ignore_errors=True)
+
+            result = git(["clone", "--mirror", "--quiet", repository, tmp_mirror])
+
+            if result.returncode == 0:
+                os.rename(tmp_mirror, mirror)
+
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.strip())
+
+        _fresh_mirrors.add(mirror)
+
+    return mirror
+
+
+def cloneRepository(
+    entry: dict,
+    directory: str,
+    mirror_dir: str = None,
+    depth: int = None,
+    filter: str = None,
+) -> dict:
+    """
+    Clone `entry` into `directory`, or fetch it if it was cloned before
+
+    Shallow (`depth`) and partial (`filter`) clones don't use the mirror,
+    it would hold the full history they are meant to avoid.
+    """
+    path = os.path.join(directory, entry["directory"])
+    started = time.monotonic()
+    result = {"repository": entry["repository"], "path": path, "error": ""}
+
+    try:
+        if os.path.exists(os.path.join(path, ".git")):
+            result["action"] = "fetched"
+            command = ["fetch", "--prune", "--quiet"]
+
+            if depth:
+                command += ["--depth", str(depth)]
+
+            completed = git(command, cwd=path)
+        else:
+            result["action"] = "cloned"
+            command = ["clone", "--quiet"]
+
+            if mirror_dir and not depth and not filter:
+                mirror = updateMirror(entry["repository"], mirror_dir)
+                command += ["--reference", mirror, "--dissociate"]
+
+            if depth:
+                command += ["--depth", str(depth)]
+
+            if filter:
+                command += ["--filter", filter]
+
+            if entry["branch"]:
+                command += ["--branch", entry["branch"]]
+
+            completed = git(command + [entry["repository"], path])
+
+        result["returncode"] = completed.returncode
+        result["error"] = completed.stderr.strip() if completed.returncode else ""
+    except (RuntimeError, OSError) as e:
+        result["action"] = "failed"
+        result["returncode"] = 1
+        result["error"] = str(e)
+
+    if result["returncode"] != 0:
+        result["action"] = "failed"
+
+    result["duration"] = time.monotonic() - started
+
+    return result
+
+
+def cloneRepositories(entries, directory: str, jobs: int = 4, **options) -> list:
+    """
+    Clone or fetch all `entries` concurrently, results keep the input order
+    """
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        futures = [
+            executor.submit(cloneRepository, entry, directory, **options)
+            for entry in entries
+        ]
+
+        return [future.result() for future in futures]
+
+
+def isRepository(path: str) -> bool:
+    # .git is a file in worktrees and submodules
+    return os.path.exists(os.path.join(path, ".git"))
+
+
+def getRepositoryRoot(path: str) -> str:
+    """
+    The top level directory of the repository `path` is in, None if it
+    isn't in one
+    """
+    path = os.path.realpath(path)
+
+    while True:
+        if isRepository(path):
+            return path
+
+        parent = os.path.dirname(path)
+
+        if parent == path:
+            return None
+
+        path = parent
+
+
+def findRepositories(roots, depth: int = workspace_depth) -> list:
+    """
+    Repositories in `roots` and up to `depth` levels below them
+
+    Repositories aren't searched for nested ones (e.g. submodules), except
+    for the roots themselves. Returns unique, sorted real paths.
+    """
+    found = set()
+
+    def scan(directory: str, level: int):
+        if isRepository(directory):
+            found.add(os.path.realpath(directory))
+
+            if level > 0:
+                return
+
+        if level >= depth:
+            return
+
+        try:
+            entries = list(os.scandir(directory))
+        except OSError:
+            return
+
+        for entry in entries:
+            if entry.is_dir() and not entry.name.startswith("."):
+                scan(entry.path, level + 1)
+
+    for root in roots:
+        if root and os.path.isdir(root):
+            scan(root, 0)
+
+    return sorted(found)
+
+
+def getRepositoryStatus(path: str, fetch: bool = False) -> dict:
+    """
+    Branch, upstream, commits ahead/behind and changed files of the
+    repository at `path`, from a single `git status`
+
+    Ahead/behind are relative to the last fetch unless `fetch` is set.
+    """
+    started = time.monotonic()
+    result = {
+        "path": path,
+        "branch": None,
+        "upstream": None,
+        "ahead": 0,
+        "behind": 0,
+        "changed": 0,
+        "untracked": 0,
+        "returncode": 0,
+        "error": "",
+    }
+
+    if fetch:
+        completed = git(["fetch", "--quiet"], cwd=path, env={"GIT_TERMINAL_PROMPT": "0"})
+
+        if completed.returncode != 0:
+            result["returncode"] = completed.returncode
+            result["error"] = completed.stderr.strip()
+
+    completed = git(["status", "--porcelain=v2", "--branch"], cwd=path)
+
+    if completed.returncode != 0:
+        result["returncode"] = completed.returncode
+        result["error"] = completed.stderr.strip()
+    else:
+        for line in completed.stdout.splitlines():
+            if line.startswith("# branch.head "):
+                result["branch"] = line.split(" ", 2)[2]
+            elif line.startswith("# branch.upstream "):
+                result["upstream"] = line.split(" ", 2)[2]
+            elif line.startswith("# branch.ab "):
+                ahead, behind = line.split(" ")[2:4]
+                result["ahead"], result["behind"] = int(ahead), -int(behind)
+            elif line.startswith("? "):
+                result["untracked"] += 1
+            elif line and not line.startswith("#") and not line.startswith("! "):
+                result["changed"] += 1
+
+    result["duration"] = time.monotonic() - started
+
+    return result
+
+
+def _repositoryResult(
+    path: str, action: str, started: float, returncode: int = 0, error: str = ""
+) -> dict:
+    return {
+        "path": path,
+        "action": action if returncode == 0 else "failed",
+        "returncode": returncode,
+        "error": error if returncode != 0 else "",
+        "duration": time.monotonic() - started,
+    }
+
+
+def commitRepository(path: str, message: str) -> dict:
+    """
+    `git commit -am message` in `path` if tracked files changed
+    """
+    started = time.monotonic()
+    status = getRepositoryStatus(path)
+
+    if status["returncode"] != 0 or not status["changed"]:
+        return _repositoryResult(
+            path, "clean", started, status["returncode"], status["error"]
+        )
+
+    completed = git(["commit", "--quiet", "-am", message], cwd=path)
+
+    return _repositoryResult(
+        path,
+        "committed",
+        started,
+        completed.returncode,
+        (completed.stderr or completed.stdout).strip(),
+    )
+
+
+def pushRepository(path: str) -> dict:
+    """
+    `git push` in `path` unless its upstream already has all commits
+    """
+    started = time.monotonic()
+    status = getRepositoryStatus(path)
+
+    if status["returncode"] != 0 or (status["upstream"] and not status["ahead"]):
+        return _repositoryResult(
+            path, "up-to-date", started, status["returncode"], status["error"]
+        )
+
+    # Concurrent pushes can't share the terminal for credential prompts
+    completed = git(["push", "--quiet"], cwd=path, env={"GIT_TERMINAL_PROMPT": "0"})
+
+    return _repositoryResult(
+        path, "pushed", started, completed.returncode, completed.stderr.strip()
+    )
+
+
+def mapRepositories(function, paths, jobs: int = 8, **kwargs) -> list:
+    """
+    Run function(path, **kwargs) for all `paths`, at most `jobs` at a
+    time; results keep the input order
+    """
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        futures = [executor.submit(function, path, **kwargs) for path in paths]
+
+        return [future.result() for future in futures]
@@ -0,0 +1,316 @@
+"""
+Streaming writers for `arco config`
+
+The writers walk the context and write to the stream as they go, so
+output starts immediately and memory does not grow with the size of
+the context. Small subtrees are encoded in one call, which is where
+the optional orjson backend pays off.
+"""
+
+import re
+import json
+import math
+import functools
+from slugify import slugify
+from .compact import FrozenDict, FrozenList
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_plain_scalar = re.compile(r"[A-Za-z_/][A-Za-z0-9_./-]*")
+_reserved_scalars = [
+    "true",
+    "false",
+    "yes",
+    "no",
+    "on",
+    "off",
+    "y",
+    "n",
+    "null",
+]
+
+
+# Subtrees up to this many nodes are encoded in one call
+chunk_size = 512
+
+# Containers the encoders handle like dicts and lists, the read-only
+# ones of a resolved context store their items themselves
+_plain_containers = (dict, list, tuple, FrozenDict, FrozenList)
+
+_encoders = {}
+
+
+def dumpJSON(value, indent: int = None) -> str:
+    if orjson is not None and indent in [None, 2]:
+        option = orjson.OPT_NON_STR_KEYS
+
+        if indent:
+            option |= orjson.OPT_INDENT_2
+
+        try:
+            return orjson.dumps(value, option=option, default=str).decode()
+        except TypeError:
+            # e.g. integers beyond 64 bit, let the stdlib handle those
+            pass
+
+    if indent not in _encoders:
+        _encoders[indent] = json.JSONEncoder(
+            indent=indent, separators=None if indent else (",", ":"), default=str
+        )
+
+    return _encoders[indent].encode(value)
+
+
+def _isContainer(value) -> bool:
+    return isinstance(value, (dict, list, tuple))
+
+
+def _isSmall(value, budget: int = chunk_size) -> bool:
+    """
+    Whether `value` can be encoded in one call: it has at most `budget`
+    nodes (checked without walking all of it) and only plain containers.
+
+    benedict instances are excluded, their data lives behind a pointer
+    the C encoders don't see, so they are walked through .items().
+    """
+    stack = [value]
+
+    while stack:
+        item = stack.pop()
+        budget -= 1
+
+        if budget < 0:
+            return False
+
+        if _isContainer(item) and type(item) not in _plain_containers:
+            return False
+
+        if isinstance(item, dict):
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple)):
+            stack.extend(item)
+
+    return True
+
+
+def iterJSON(data, indent: int = None, depth: int = 0):
+    """
+    Yield chunks of the JSON encoding of `data`
+    """
+    if not _isContainer(data) or _isSmall(data):
+        chunk = dumpJSON(data, indent)
+
+        if indent and depth:
+            chunk = chunk.replace("\n", "\n" + " " * indent * depth)
+
+        yield chunk
+        return
+
+    is_dict = isinstance(data, dict)
+    items = data.items() if is_dict else enumerate(data)
+    newline = "\n" + " " * indent * (depth + 1) if indent else ""
+    separator = ": " if indent else ":"
+
+    yield "{" if is_dict else "["
+
+    for index, (key, value) in enumerate(items):
+        yield ("," if index else "") + newline
+
+        if is_dict:
+            yield dumpJSON(str(key)) + separator
+
+        yield from iterJSON(value, indent, depth + 1)
+
+    yield ("\n" + " " * indent * depth if indent else "") + ("}" if is_dict else "]")
+
+
+def _yamlScalar(value) -> str:
+    if value is None:
+        return "null"
+
+    if isinstance(value, bool):
+        return "true" if value else "false"
+
+    if isinstance(value, float):
+        if math.isnan(value):
+            return ".nan"
+        if math.isinf(value):
+            return ".inf" if value > 0 else "-.inf"
+        return repr(value)
+
+    if isinstance(value, int):
+        return str(value)
+
+    value = str(value)
+
+    if _plain_scalar.fullmatch(value) and value.lower() not in _reserved_scalars:
+        return value
+
+    # JSON strings are valid YAML double-quoted scalars
+    return json.dumps(value, ensure_ascii=False)
+
+
+def iterYAML(data, indent: str = ""):
+    """
+    Yield the lines of a block-style YAML encoding of `data`
+    """
+    if isinstance(data, dict):
+        if not data:
+            yield f"{indent}{{}}"
+            return
+
+        for key, value in data.items():
+            key = _yamlScalar(key)
+
+            if _isContainer(value) and value:
+                yield f"{indent}{key}:"
+                yield from iterYAML(value, indent + "  ")
+            else:
+                yield f"{indent}{key}: {_yamlInline(value)}"
+
+    elif isinstance(data, (list, tuple)):
+        if not data:
+            yield f"{indent}[]"
+            return
+
+        for value in data:
+            if _isContainer(value) and value:
+                # Put the first line of the nested block behind the dash
+                for index, line in enumerate(iterYAML(value, indent + "  ")):
+                    yield f"{indent}- {line[len(indent) + 2:]}" if index == 0 else line
+            else:
+                yield f"{indent}- {_yamlInline(value)}"
+
+    else:
+        yield f"{indent}{_yamlScalar(data)}"
+
+
+def _yamlInline(value) -> str:
+    if isinstance(value, dict):
+        return "{}"
+
+    if isinstance(value, (list, tuple)):
+        return "[]"
+
+    return _yamlScalar(value)
+
+
+def iterLeaves(data, keypath: str = ""):
+    """
+    Yield (keypath, value) for every scalar and empty container in `data`
+
+    Keypaths use benedict's notation, e.g. `ansible.inventory.hosts[0]`.
+    """
+    if isinstance(data, dict) and data:
+        for key, value in data.items():
+            yield from iterLeaves(value, f"{keypath}.{key}" if keypath else str(key))
+    elif isinstance(data, (list, tuple)) and data:
+        for index, value in enumerate(data):
+            yield from iterLeaves(value, f"{keypath}[{index}]")
+    else:
+        yield keypath, data
+
+
+def writeJSON(data, stream, indent: int = None):
+    for chunk in iterJSON(data, indent):
+        stream.write(chunk)
+
+    stream.write("\n")
+
+
+def writeYAML(data, stream):
+    for line in iterYAML(data):
+        stream.write(line)
+        stream.write("\n")
+
+
+def writeJSONL(data, stream):
+    for keypath, value in iterLeaves(data):
+        stream.write(dumpJSON({"keypath": keypath, "value": value}))
+        stream.write("\n")
+
+
+@functools.lru_cache(maxsize=4096)
+def standardizeKey(key: str) -> str:
+    """
+    The key benedict's standardize() would rename `key` to
+    """
+    # https://stackoverflow.com/a/12867228/2096218
+    key = re.sub(r"((?<=[a-z0-9])[A-Z]|(?!^)[A-Z](?=[a-z]))", r"_\1", key)
+
+    return slugify(key, separator="_")
+
+
+def _isEmpty(value) -> bool:
+    # What benedict's clean(strings=True, collections=True) removes
+    return not value and (
+        value is None or isinstance(value, (str, dict, list, set, tuple))
+    )
+
+
+def _iterEnvironment(data, key: str):
+    if isinstance(data, dict):
+        for name, value in data.items():
+            if _isEmpty(value):
+                continue
+
+            name = standardizeKey(name) if isinstance(name, str) else str(name)
+            yield from _iterEnvironment(value, f"{key}_{name}")
+    elif isinstance(data, (list, tuple)):
+        # Empty items are skipped but keep their index, so the others
+        # keep the variable names they always had
+        for index, value in enumerate(data):
+            if not _isEmpty(value):
+                yield from _iterEnvironment(value, f"{key}[{index}]")
+    else:
+        yield key.upper(), data
+
+
+def flattenEnvironment(data):
+    """
+    Yield (VARIABLE, value) for every scalar in `data`
+
+    Equivalent to standardize() + keypaths() on a benedict that had
+    clean() applied at every level (None, empty strings and empty
+    collections are dropped), without modifying `data`.
+    """
+    for key, value in data.items():
+        if _isEmpty(value):
+            continue
+
+        key = standardizeKey(key) if isinstance(key, str) else str(key)
+
+        yield from _iterEnvironment(value, key)
+
+
+def writeEnv(data, stream):
+    for key, value in flattenEnvironment(data):
+        stream.write(f"{key}={value}\n")
+
+
+def writeConfig(data, stream, format: str = "json", pretty: bool = True):
+    """
+    Stream `data` in one of the formats `arco config` supports
+
+    Raises ValueError for unknown formats.
+    """
+    # Stream the output, large contexts would otherwise be rendered
+    # into one string before anything is written
+    if format == "json":
+        writeJSON(data, stream, indent=2 if pretty else None)
+
+    elif format == "jsonl":
+        writeJSONL(data, stream)
+
+    elif format == "env":
+        if isinstance(data, dict):
+            writeEnv(data, stream)
+
+    elif format == "yaml":
+        writeYAML(data, stream)
+
+    else:
+        raise ValueError(f"Unsupported format: {format}")
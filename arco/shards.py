@@ -0,0 +1,246 @@
+"""
+Sharded `x ansible-playbook`
+
+The hosts a playbook targets are split into shards and every shard is
+run by its own ansible-playbook process (--limit @file), so large
+inventories are not bound to a single controller process.
+"""
+
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from loguru import logger
+from .batch import PrefixedStream, runCommand
+
+_ansi = re.compile(r"\x1b\[[0-9;]*m")
+_hosts_header = re.compile(r"^(\s*)hosts \(\d+\):$")
+_recap_line = re.compile(r"^(\S+)\s+:\s+((?:\w+=\d+\s*)+)$")
+
+recap_fields = ["ok", "changed", "unreachable", "failed", "skipped", "rescued", "ignored"]
+
+
+def getShardCount(shards) -> int:
+    """
+    0 or "auto" means one shard per CPU
+    """
+    if shards in [0, "0", "auto"]:
+        return os.cpu_count() or 1
+
+    return max(1, int(shards))
+
+
+def stripLimit(args) -> list:
+    """
+    Remove --limit/-l from ansible-playbook arguments
+    """
+    stripped = []
+    skip = False
+
+    for arg in args:
+        if skip:
+            skip = False
+            continue
+
+        if arg in ["--limit", "-l"]:
+            skip = True
+            continue
+
+        if arg.startswith("--limit=") or (arg.startswith("-l") and len(arg) > 2):
+            continue
+
+        stripped.append(arg)
+
+    return stripped
+
+
+def parseHosts(output: str) -> list:
+    """
+    Parse the hosts of all plays from `ansible-playbook --list-hosts`
+    """
+    hosts = OrderedDict()
+    indent = None
+
+    for line in _ansi.sub("", output).splitlines():
+        header = _hosts_header.match(line)
+
+        if header:
+            indent = len(header.group(1))
+            continue
+
+        if indent is not None:
+            if line.strip() and len(line) - len(line.lstrip()) > indent:
+                hosts[line.strip()] = True
+            else:
+                indent = None
+
+    return list(hosts)
+
+
+def splitHosts(hosts: list, count: int) -> list:
+    """
+    Split `hosts` into `count` contiguous shards of nearly equal size
+    """
+    count = max(1, min(count, len(hosts)))
+    size, remainder = divmod(len(hosts), count)
+    shards = []
+    start = 0
+
+    for index in range(count):
+        end = start + size + (1 if index < remainder else 0)
+        shards.append(hosts[start:end])
+        start = end
+
+    return shards
+
+
+def parseRecap(output: str) -> dict:
+    """
+    Parse {host: {field: count}} from the PLAY RECAP of a playbook run
+    """
+    recap = {}
+    in_recap = False
+
+    for line in _ansi.sub("", output).splitlines():
+        if line.startswith("PLAY RECAP"):
+            in_recap = True
+            continue
+
+        if not in_recap:
+            continue
+
+        match = _recap_line.match(line.strip())
+
+        if not match:
+            continue
+
+        counts = dict(field.split("=") for field in match.group(2).split())
+        recap[match.group(1)] = {key: int(value) for key, value in counts.items()}
+
+    return recap
+
+
+def mergeReturncodes(returncodes) -> int:
+    """
+    The exit code of the sharded run: the first hard error (e.g. 1 or
+    250) wins over failed hosts (2), which win over unreachable hosts (4)
+    """
+    returncodes = list(returncodes)
+
+    for returncode in returncodes:
+        if returncode not in [0, 2, 4]:
+            return returncode
+
+    for returncode in [2, 4]:
+        if returncode in returncodes:
+            return returncode
+
+    return 0
+
+
+class _RecordingStream:
+    """
+    Passes writes through to `stream` and keeps them for the recap
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.data = []
+
+    def write(self, data: str):
+        self.data.append(data)
+        self.stream.write(data)
+
+    def flush(self):
+        self.stream.flush()
+
+
+def runShards(
+    context,
+    command_list,
+    shards: int,
+    env: dict = None,
+    timeout: float = None,
+    grace_period: float = None,
+    stream=None,
+) -> list:
+    """
+    Run the playbook `command_list` in `shards` processes with `env`,
+    each of them stopped after `timeout` seconds and its output prefixed
+    and written to `stream` (stdout by default)
+
+    Returns one {"hosts", "returncode", "recap", "metrics"} per shard,
+    None if the playbook targets less than two hosts and should just
+    be run as is.
+    """
+    listed = context.run(
+        command_list + ["--list-hosts"],
+        capture_output=True,
+        timeout=timeout,
+        grace_period=grace_period,
+    )
+
+    if listed.returncode != 0:
+        logger.warning(f"Can't list hosts for sharding: {listed.stderr.strip()}")
+        return None
+
+    hosts = parseHosts(listed.stdout)
+
+    if shards < 2 or len(hosts) < 2:
+        return None
+
+    host_shards = splitHosts(hosts, shards)
+    base = stripLimit(command_list)
+    lock = threading.Lock()
+    limit_files = []
+
+    logger.info(f"Running {len(hosts)} hosts in {len(host_shards)} shards")
+
+    def execute(index):
+        recording = _RecordingStream(
+            PrefixedStream(f"[shard {index + 1}/{len(host_shards)}] ", lock, stream)
+        )
+        limit = ["--limit", f"@{limit_files[index]}"]
+        returncode, metrics = runCommand(
+            context,
+            base + limit,
+            recording,
+            env=env,
+            timeout=timeout,
+            grace_period=grace_period,
+        )
+
+        return {
+            "hosts": host_shards[index],
+            "returncode": returncode,
+            "recap": parseRecap("".join(recording.data)),
+            "metrics": metrics,
+        }
+
+    try:
+        for shard in host_shards:
+            fd, limit_file = tempfile.mkstemp(prefix="arco-shard-", suffix=".txt")
+            limit_files.append(limit_file)
+
+            with os.fdopen(fd, "w") as file_:
+                file_.write("\n".join(shard) + "\n")
+
+        with ThreadPoolExecutor(max_workers=len(host_shards)) as executor:
+            return list(executor.map(execute, range(len(host_shards))))
+    finally:
+        for limit_file in limit_files:
+            os.remove(limit_file)
+
+
+def mergeRecaps(results: list) -> dict:
+    """
+    The recap of all shards, by host
+    """
+    recap = {}
+
+    for result in results:
+        recap.update(result["recap"])
+
+    return dict(sorted(recap.items()))
@@ -0,0 +1,268 @@
+"""
+Prompt-time environment loading for `arco hook`
+
+This module is executed on every prompt (`python -m arco.shell`), so it
+must stay cheap to import: stdlib only, no typer, benedict or git.
+The full pipeline only runs when the cached environment for the
+current directory is missing or stale.
+"""
+
+import os
+import re
+import sys
+import json
+import zlib
+import base64
+import hashlib
+import shlex
+import subprocess
+
+STATE_VARIABLE = "ARCO_EXPORT_STATE"
+
+# Variables that arco reads as CLI options or that change on every run;
+# exporting them to an interactive shell would leak into later invocations
+ignored_variables = [
+    STATE_VARIABLE,
+    "ARCO_CONTEXT_DIR",
+    "ARCO_CODE_DIR",
+    "ARCO_CONTEXT_FILE",
+    "ARCO_CONTEXT_NAME",
+    "ARCO_ENV_FILE",
+    "ARCO_LOAD_DEFAULT_CONTEXT",
+    "ARCO_DATE",
+    "ARCO_MOUNTPOINT",
+]
+
+# Options of callback() that influence the resolved context
+input_variables = [
+    "ARCO_CONTEXT_DIR",
+    "ARCO_CODE_DIR",
+    "ARCO_CONTEXT_FILE",
+    "ARCO_CONTEXT_NAME",
+    "ARCO_ENV_FILE",
+    "ARCO_LOAD_DEFAULT_CONTEXT",
+    "KUBECONFIG",
+]
+
+valid_name = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+def encodeState(state: dict) -> str:
+    return base64.b64encode(zlib.compress(json.dumps(state).encode())).decode()
+
+
+def decodeState(encoded: str) -> dict:
+    try:
+        return json.loads(zlib.decompress(base64.b64decode(encoded)))
+    except (ValueError, zlib.error):
+        return {}
+
+
+def getState(environ=os.environ) -> dict:
+    state = decodeState(environ.get(STATE_VARIABLE, ""))
+    state.setdefault("key", None)
+    state.setdefault("env", {})
+    state.setdefault("saved", {})
+
+    return state
+
+
+def cleanEnvironment(state: dict, environ=os.environ) -> dict:
+    """
+    Return `environ` as it was before arco exported anything to the shell
+    """
+    environ = dict(environ)
+
+    for key in state["env"]:
+        original = state["saved"].get(key)
+
+        if original is None:
+            environ.pop(key, None)
+        else:
+            environ[key] = original
+
+    environ.pop(STATE_VARIABLE, None)
+
+    return environ
+
+
+def getCacheKey(directory: str, environ: dict) -> str:
+    inputs = [directory] + [f"{key}={environ.get(key, '')}" for key in input_variables]
+
+    return hashlib.sha1("\0".join(inputs).encode()).hexdigest()
+
+
+def getCacheFile(app_dir: str, key: str) -> str:
+    return os.path.join(app_dir, "env", f"{key}.json")
+
+
+def getSignature(files) -> list:
+    signature = []
+
+    for path in files:
+        try:
+            stat = os.stat(path)
+            signature.append([path, stat.st_mtime_ns, stat.st_size])
+        except OSError:
+            signature.append([path, None, None])
+
+    return signature
+
+
+def readCache(cache_file: str):
+    """
+    Return the cached environment if none of its source files changed
+    """
+    try:
+        with open(cache_file) as file_:
+            cached = json.load(file_)
+    except (OSError, ValueError):
+        return None
+
+    files = [path for path, _, _ in cached.get("files", [])]
+
+    if getSignature(files) != cached.get("files"):
+        return None
+
+    return cached.get("env")
+
+
+def writeCache(cache_file: str, files, env: dict):
+    os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+    tmp_file = f"{cache_file}.{os.getpid()}"
+
+    with open(tmp_file, "w") as file_:
+        json.dump({"files": getSignature(files), "env": env}, file_)
+
+    os.replace(tmp_file, cache_file)
+
+
+def filterEnvironment(env: dict) -> dict:
+    return {
+        key: str(value)
+        for key, value in env.items()
+        if key not in ignored_variables and valid_name.match(key)
+    }
+
+
+def renderExport(key: str, value: str) -> str:
+    return f"export {key}={shlex.quote(value)};"
+
+
+def renderUnset(key: str) -> str:
+    return f"unset {key};"
+
+
+def renderDiff(state: dict, key: str, env: dict, environ=os.environ):
+    """
+    Render the statements that move the shell from `state` to `env`
+
+    Only variables whose value changed are exported. Variables that are
+    no longer part of the context are restored to their original value.
+    """
+    lines = []
+    saved = {}
+
+    for name, value in state["env"].items():
+        if name in env:
+            continue
+
+        original = state["saved"].get(name)
+
+        if original is None:
+            lines.append(renderUnset(name))
+        else:
+            lines.append(renderExport(name, original))
+
+    for name, value in env.items():
+        if name in state["env"]:
+            saved[name] = state["saved"].get(name)
+        else:
+            saved[name] = environ.get(name)
+
+        if environ.get(name) != value:
+            lines.append(renderExport(name, value))
+
+    if env:
+        new_state = {"key": key, "env": env, "saved": saved}
+        lines.append(renderExport(STATE_VARIABLE, encodeState(new_state)))
+    elif state["key"] is not None or STATE_VARIABLE in environ:
+        lines.append(renderUnset(STATE_VARIABLE))
+
+    return lines
+
+
+def isActive(directory: str) -> bool:
+    return os.path.exists(os.path.join(directory, "arco.yml"))
+
+
+def export(shell: str, app_dir: str, directory: str = None):
+    """
+    Print the export/unset statements for the current directory
+
+    Falls back to `arco export --shell` if the cache is cold or stale.
+    """
+    directory = directory or os.getcwd()
+    state = getState()
+    clean = cleanEnvironment(state)
+    key = getCacheKey(directory, clean)
+
+    if not isActive(directory):
+        lines = renderDiff(state, None, {})
+    else:
+        env = readCache(getCacheFile(app_dir, key))
+
+        if env is None:
+            result = subprocess.run(
+                [sys.executable, "-m", "arco", "export", "--shell", shell],
+                cwd=directory,
+                env=dict(clean, **{STATE_VARIABLE: os.environ.get(STATE_VARIABLE, "")}),
+            )
+            return result.returncode
+
+        if key == state["key"] and env == state["env"]:
+            return 0
+
+        lines = renderDiff(state, key, env)
+
+    if lines:
+        print("\n".join(lines))
+
+    return 0
+
+
+def hook(shell: str, app_dir: str) -> str:
+    command = (
+        f"{shlex.quote(sys.executable)} -m arco.shell {shell} {shlex.quote(app_dir)}"
+    )
+
+    if shell == "bash":
+        return f"""_arco_hook() {{
+  local previous_exit_status=$?;
+  eval "$({command})";
+  return $previous_exit_status;
+}};
+if [[ ";${{PROMPT_COMMAND[*]:-}};" != *";_arco_hook;"* ]]; then
+  PROMPT_COMMAND="_arco_hook${{PROMPT_COMMAND:+;$PROMPT_COMMAND}}"
+fi
+"""
+
+    if shell == "zsh":
+        return f"""_arco_hook() {{
+  eval "$({command})";
+}}
+typeset -ag precmd_functions;
+if (( ! ${{precmd_functions[(I)_arco_hook]}} )); then
+  precmd_functions=(_arco_hook $precmd_functions)
+fi
+typeset -ag chpwd_functions;
+if (( ! ${{chpwd_functions[(I)_arco_hook]}} )); then
+  chpwd_functions=(_arco_hook $chpwd_functions)
+fi
+"""
+
+    raise ValueError(f"Unsupported shell: {shell}")
+
+
+if __name__ == "__main__":
+    sys.exit(export(sys.argv[1], sys.argv[2]))
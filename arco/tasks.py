@@ -0,0 +1,282 @@
+import sys
+import time
+import queue
+import threading
+import subprocess
+from collections import defaultdict
+from loguru import logger
+from .process import stopProcess, parseDuration, Supervisor, timeout_returncode
+from .metrics import MeasuredPopen, getMetrics
+from .incremental import (
+    normalizeInputs,
+    getFingerprint,
+    loadRecord,
+    saveRecord,
+    replayRecord,
+)
+
+
+def normalizeTasks(tasks: dict) -> dict:
+    """
+    Bring task definitions from arco.yml into one shape
+
+    A task is either a command string or a dict with `command`,
+    `depends` (list of task names), `group` (concurrency group),
+    `timeout` (e.g. 10m) and optionally `inputs`/`outputs` to skip runs
+    whose inputs are unchanged.
+
+    Raises ValueError for invalid timeouts.
+    """
+    normalized = {}
+
+    for name, task in (tasks or {}).items():
+        if isinstance(task, (str, list)):
+            task = {"command": task}
+
+        depends = task.get("depends") or []
+
+        if isinstance(depends, str):
+            depends = [depends]
+
+        normalized[name] = {
+            "command": task.get("command"),
+            "depends": list(depends),
+            "group": task.get("group"),
+            "inputs": normalizeInputs(task["inputs"]) if task.get("inputs") else None,
+            "outputs": task.get("outputs"),
+            "timeout": parseDuration(task.get("timeout")),
+        }
+
+    return normalized
+
+
+def getTaskGraph(tasks: dict, targets) -> dict:
+    """
+    Return {task: [dependencies]} for `targets` and everything they depend on,
+    in topological order
+
+    Raises ValueError for unknown tasks and dependency cycles.
+    """
+    graph = {}
+    visiting = []
+
+    def visit(name):
+        if name in graph:
+            return
+
+        if name in visiting:
+            cycle = visiting[visiting.index(name) :] + [name]
+            raise ValueError(f"Dependency cycle: {' -> '.join(cycle)}")
+
+        if name not in tasks:
+            if visiting:
+                raise ValueError(
+                    f"Task '{visiting[-1]}' depends on unknown task '{name}'"
+                )
+            raise ValueError(f"Unknown task '{name}'")
+
+        if not tasks[name]["command"]:
+            raise ValueError(f"Task '{name}' has no command")
+
+        visiting.append(name)
+
+        for dependency in tasks[name]["depends"]:
+            visit(dependency)
+
+        visiting.pop()
+        graph[name] = tasks[name]["depends"]
+
+    for target in targets:
+        visit(target)
+
+    return graph
+
+
+def _streamOutput(name: str, process: subprocess.Popen, lock, events, supervisor, stream):
+    output = []
+
+    with supervisor:
+        for line in process.stdout:
+            output.append(line)
+
+            with lock:
+                stream.write(f"[{name}] {line}")
+                stream.flush()
+
+        returncode = process.wait()
+
+    if supervisor.timed_out:
+        returncode = timeout_returncode
+
+    events.put((name, returncode, "".join(output), getMetrics(process)))
+
+
+def runTaskGraph(
+    tasks: dict,
+    graph: dict,
+    cwd: str,
+    jobs: int = 1,
+    groups: dict = None,
+    context: dict = None,
+    record_dir: str = None,
+    force: bool = False,
+    timeout: float = None,
+    grace_period: float = None,
+    stream=None,
+) -> dict:
+    """
+    Run the tasks in `graph` with at most `jobs` tasks at a time
+
+    Tasks sharing a `group` are further limited to `groups[group]`
+    concurrent runs (default 1). The first failing task cancels all
+    running tasks and no new tasks are started.
+
+    Tasks with declared inputs are fingerprinted; if `record_dir` holds a
+    successful run with the same fingerprint, its output is replayed
+    instead (unless `force` is set).
+
+    Tasks without a timeout of their own are stopped after `timeout`
+    seconds, their exit code is then timeout_returncode. Their output is
+    prefixed with the task name and written to `stream` (stdout by default).
+
+    Returns {task: {"status", "returncode", "duration", "metrics"}} where
+    status is one of ok, cached, failed, cancelled or skipped and metrics
+    is the resource usage of the task's process (None if it didn't run).
+    """
+    groups = groups or {}
+    stream = stream or sys.stdout
+    results = {
+        name: {"status": "pending", "returncode": None, "duration": None, "metrics": None}
+        for name in graph
+    }
+    running = {}
+    started = {}
+    group_usage = defaultdict(int)
+    fingerprints = {}
+    events = queue.Queue()
+    lock = threading.Lock()
+    failed = False
+
+    def startTask(name):
+        command = tasks[name]["command"]
+
+        if record_dir and tasks[name]["inputs"]:
+            fingerprints[name] = getFingerprint(
+                command, tasks[name]["inputs"], context or {}, cwd
+            )
+
+            record = None
+
+            if not force:
+                record = loadRecord(
+                    record_dir, fingerprints[name], tasks[name]["outputs"], cwd
+                )
+
+            if record:
+                logger.info(f"Inputs of task {name} unchanged, replaying output")
+
+                with lock:
+                    replayRecord(record, prefix=f"[{name}] ", stream=stream)
+
+                results[name]["status"] = "cached"
+                results[name]["returncode"] = 0
+                return
+
+        logger.info(f"Starting task {name}: {command}")
+
+        process = MeasuredPopen(
+            command,
+            cwd=cwd,
+            shell=isinstance(command, str),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            universal_newlines=True,
+            start_new_session=True,
+        )
+
+        running[name] = process
+        started[name] = time.monotonic()
+        results[name]["status"] = "running"
+
+        if tasks[name]["group"]:
+            group_usage[tasks[name]["group"]] += 1
+
+        supervisor = Supervisor(process, tasks[name]["timeout"] or timeout, grace_period)
+
+        threading.Thread(
+            target=_streamOutput,
+            args=(name, process, lock, events, supervisor, stream),
+            daemon=True,
+        ).start()
+
+    def cancelRunning():
+        for name, process in running.items():
+            results[name]["status"] = "cancelled"
+            stopProcess(process)
+
+    try:
+        while True:
+            if not failed:
+                for name, dependencies in graph.items():
+                    if len(running) >= jobs:
+                        break
+
+                    if results[name]["status"] != "pending":
+                        continue
+
+                    if any(
+                        results[d]["status"] not in ["ok", "cached"] for d in dependencies
+                    ):
+                        continue
+
+                    group = tasks[name]["group"]
+
+                    if group and group_usage[group] >= int(groups.get(group, 1)):
+                        continue
+
+                    startTask(name)
+
+            if not running:
+                break
+
+            name, returncode, output, metrics = events.get()
+            running.pop(name)
+
+            if tasks[name]["group"]:
+                group_usage[tasks[name]["group"]] -= 1
+
+            results[name]["returncode"] = returncode
+            results[name]["duration"] = time.monotonic() - started[name]
+            results[name]["metrics"] = metrics
+
+            if results[name]["status"] == "cancelled":
+                continue
+
+            if returncode == 0:
+                results[name]["status"] = "ok"
+                logger.info(f"Task {name} finished")
+
+                if name in fingerprints:
+                    saveRecord(
+                        record_dir,
+                        fingerprints[name],
+                        tasks[name]["command"],
+                        tasks[name]["outputs"],
+                        cwd,
+                        output,
+                    )
+            else:
+                results[name]["status"] = "failed"
+                logger.error(f"Task {name} returned exit code {returncode}")
+
+                if not failed:
+                    failed = True
+                    cancelRunning()
+    except KeyboardInterrupt:
+        cancelRunning()
+
+    for result in results.values():
+        if result["status"] in ["pending", "running"]:
+            result["status"] = "skipped" if result["status"] == "pending" else "cancelled"
+
+    return results
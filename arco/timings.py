@@ -0,0 +1,228 @@
+"""
+Task timings of `x ansible-playbook` runs
+
+The bundled arco_timings callback writes the duration of every task,
+the runs are kept as JSON lines per context in app_dir/timings and
+summarized by `arco report tasks`.
+"""
+
+import os
+import json
+import math
+import hashlib
+import datetime
+from slugify import slugify
+from .repos import fileLock
+
+callback_dir = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "callback_plugins"
+)
+
+# Runs kept per context unless arco.timings.keep is set
+default_keep = 100
+
+# Ansible's callback search path, kept when the bundled plugin is added
+default_callback_plugins = (
+    "~/.ansible/plugins/callback:/usr/share/ansible/plugins/callback"
+)
+
+
+def getTimingsFile(app_dir: str, name: str, context_dir: str) -> str:
+    digest = hashlib.sha1(context_dir.encode()).hexdigest()[:8]
+
+    return os.path.join(
+        app_dir, "timings", f"{slugify(name or 'default')}-{digest}.jsonl"
+    )
+
+
+def getTimingsEnvironment(ansible: dict, timings_file: str) -> dict:
+    """
+    Environment that enables the arco_timings callback next to the
+    callbacks already configured in the `ansible` namespace
+    """
+    callback_plugins = ansible.get("callback_plugins") or default_callback_plugins
+    callbacks = [
+        callback.strip()
+        for callback in str(
+            ansible.get("callbacks_enabled") or ansible.get("callback_whitelist") or ""
+        ).split(",")
+        if callback.strip()
+    ]
+    callbacks = ",".join(callbacks + ["arco_timings"])
+
+    return {
+        "ANSIBLE_CALLBACK_PLUGINS": f"{callback_plugins}:{callback_dir}",
+        # callback_whitelist was renamed in ansible-core 2.11
+        "ANSIBLE_CALLBACK_WHITELIST": callbacks,
+        "ANSIBLE_CALLBACKS_ENABLED": callbacks,
+        "ARCO_TASK_TIMINGS": timings_file,
+    }
+
+
+def readJSONL(path: str) -> list:
+    """
+    The records of a JSON lines file, [] if it doesn't exist
+    """
+    records = []
+
+    try:
+        with open(path) as file_:
+            for line in file_:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    pass
+    except OSError:
+        pass
+
+    return records
+
+
+def saveRun(path: str, run: dict, keep: int = default_keep):
+    """
+    Append `run` to the timings file, dropping the oldest runs beyond `keep`
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    with fileLock(f"{path}.lock"):
+        runs = readJSONL(path)
+        runs.append(run)
+
+        if len(runs) > keep:
+            runs = runs[-keep:]
+
+        tmp_file = f"{path}.{os.getpid()}.tmp"
+
+        with open(tmp_file, "w") as file_:
+            file_.write("".join(json.dumps(entry) + "\n" for entry in runs))
+
+        os.replace(tmp_file, path)
+
+
+def stripContext(command_list) -> list:
+    """
+    `command_list` as strings, with the context passed as --extra-vars
+    replaced by {...} so it isn't stored or logged
+    """
+    args = []
+
+    for arg in map(str, command_list):
+        if args and args[-1] == "--extra-vars" and arg.startswith("{"):
+            arg = "{...}"
+
+        args.append(arg)
+
+    return args
+
+
+def newRun(command_list, returncode: int, tasks: list) -> dict:
+    now = datetime.datetime.utcnow()
+
+    return {
+        "id": f"{now.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}",
+        "date": now.isoformat(),
+        "args": stripContext(command_list),
+        "returncode": returncode,
+        "tasks": tasks,
+    }
+
+
+def taskKey(task: dict) -> str:
+    return f"{task.get('play') or '-'} : {task.get('task') or '-'}"
+
+
+def getTaskDurations(run: dict) -> dict:
+    """
+    {task key: seconds} of a run
+
+    Tasks that ran several times in one ansible-playbook process are
+    summed, of the shards of a sharded run the slowest one counts.
+    """
+    by_process = {}
+
+    for task in run.get("tasks") or []:
+        key = (taskKey(task), task.get("pid"))
+        by_process[key] = by_process.get(key, 0) + task.get("duration", 0)
+
+    durations = {}
+
+    for (key, _), duration in by_process.items():
+        durations[key] = max(durations.get(key, 0), duration)
+
+    return durations
+
+
+def findRun(runs: list, ref: str) -> dict:
+    """
+    A run by id (or id prefix) or by index, -1 being the latest run
+
+    Raises KeyError if there is no such run.
+    """
+    try:
+        return runs[int(ref)]
+    except IndexError:
+        raise KeyError(ref)
+    except ValueError:
+        pass
+
+    for run in reversed(runs):
+        if run["id"].startswith(ref):
+            return run
+
+    raise KeyError(ref)
+
+
+def percentile(values: list, percent: float) -> float:
+    """
+    Nearest-rank percentile of `values`
+    """
+    values = sorted(values)
+    rank = max(1, math.ceil(percent / 100 * len(values)))
+
+    return values[rank - 1]
+
+
+def getTaskStats(runs: list) -> list:
+    """
+    {"task", "runs", "p50", "p95", "max"} per task across `runs`
+    """
+    samples = {}
+
+    for run in runs:
+        for key, duration in getTaskDurations(run).items():
+            samples.setdefault(key, []).append(duration)
+
+    return [
+        {
+            "task": key,
+            "runs": len(values),
+            "p50": percentile(values, 50),
+            "p95": percentile(values, 95),
+            "max": max(values),
+        }
+        for key, values in samples.items()
+    ]
+
+
+def getRegressions(base: dict, target: dict, threshold: float, min_delta: float) -> list:
+    """
+    Tasks of `target` that are more than `threshold` percent and
+    `min_delta` seconds slower than in `base`, slowest change first
+    """
+    before = getTaskDurations(base)
+    regressions = []
+
+    for key, duration in getTaskDurations(target).items():
+        if key not in before:
+            continue
+
+        delta = duration - before[key]
+
+        if delta < min_delta or duration <= before[key] * (1 + threshold / 100):
+            continue
+
+        regressions.append(
+            {"task": key, "before": before[key], "after": duration, "delta": delta}
+        )
+
+    return sorted(regressions, key=lambda regression: -regression["delta"])
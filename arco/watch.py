@@ -0,0 +1,185 @@
+import os
+import sys
+import time
+import struct
+import select
+import ctypes
+import ctypes.util
+from loguru import logger
+
+# inotify(7) event masks
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+_event_header = struct.Struct("iIII")
+
+
+class InotifyWatcher:
+    """
+    Watch a set of files with inotify (Linux only)
+
+    We watch the parent directories instead of the files themselves
+    so that editors replacing files via rename are picked up as well.
+    """
+
+    def __init__(self, files):
+        libc_name = ctypes.util.find_library("c")
+
+        if not sys.platform.startswith("linux") or not libc_name:
+            raise OSError("inotify is not available on this platform")
+
+        self.libc = ctypes.CDLL(libc_name, use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        self.watches = {}
+        self.files = {}
+
+        mask = (
+            IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE
+        )
+
+        for path in files:
+            directory, name = os.path.split(os.path.abspath(path))
+
+            if not os.path.isdir(directory):
+                continue
+
+            if directory not in self.watches.values():
+                wd = self.libc.inotify_add_watch(self.fd, directory.encode(), mask)
+
+                if wd < 0:
+                    raise OSError(ctypes.get_errno(), f"Can't watch {directory}")
+
+                self.watches[wd] = directory
+
+            self.files.setdefault(directory, set()).add(name)
+
+    def poll(self, timeout: float):
+        changed = set()
+        deadline = time.monotonic() + timeout
+
+        # Events for unrelated files in the watched directories
+        # (e.g. editor swap files) must not end the wait early
+        while not changed:
+            remaining = deadline - time.monotonic()
+
+            if remaining <= 0:
+                break
+
+            ready, _, _ = select.select([self.fd], [], [], remaining)
+
+            if not ready:
+                break
+
+            try:
+                buffer = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                continue
+
+            changed |= self._parse(buffer)
+
+        return changed
+
+    def _parse(self, buffer: bytes):
+        changed = set()
+        offset = 0
+
+        while offset < len(buffer):
+            wd, mask, cookie, length = _event_header.unpack_from(buffer, offset)
+            offset += _event_header.size
+            name = buffer[offset : offset + length].rstrip(b"\0").decode()
+            offset += length
+
+            directory = self.watches.get(wd)
+
+            if directory and name in self.files.get(directory, ()):
+                changed.add(os.path.join(directory, name))
+
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """
+    Watch a set of files by comparing their stat() signature
+    """
+
+    def __init__(self, files, interval: float = 0.5):
+        self.interval = interval
+        self.files = [os.path.abspath(path) for path in files]
+        self.signatures = {path: self._signature(path) for path in self.files}
+
+    def _signature(self, path):
+        try:
+            stat = os.stat(path)
+            return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+        except FileNotFoundError:
+            return None
+
+    def poll(self, timeout: float):
+        changed = set()
+        deadline = time.monotonic() + timeout
+
+        while True:
+            for path in self.files:
+                signature = self._signature(path)
+
+                if signature != self.signatures[path]:
+                    self.signatures[path] = signature
+                    changed.add(path)
+
+            remaining = deadline - time.monotonic()
+
+            if changed or remaining <= 0:
+                return changed
+
+            time.sleep(min(self.interval, remaining))
+
+    def close(self):
+        pass
+
+
+def getWatcher(files, polling: bool = False):
+    if not polling:
+        try:
+            watcher = InotifyWatcher(files)
+            logger.debug(f"Watching {len(files)} files with inotify")
+            return watcher
+        except (OSError, AttributeError) as e:
+            logger.debug(f"inotify unavailable ({e}), falling back to polling")
+
+    logger.debug(f"Watching {len(files)} files by polling")
+    return PollingWatcher(files)
+
+
+def waitForChanges(watcher, timeout: float = None, debounce: float = 0.3):
+    """
+    Block until at least one watched file changed, then keep collecting
+    changes until no further event arrives for `debounce` seconds.
+
+    Returns an empty set if `timeout` expired without any change.
+    """
+
+    changed = watcher.poll(timeout if timeout is not None else 3600)
+
+    if not changed:
+        return changed
+
+    while True:
+        more = watcher.poll(debounce)
+
+        if not more:
+            return changed
+
+        changed |= more
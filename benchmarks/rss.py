@@ -0,0 +1,99 @@
+"""
+Peak memory of arco commands on a large synthetic context
+
+Generates a context with HOSTS inventory hosts (each with a few
+hostvars, some of them identical across hosts like in real inventories)
+and runs a set of arco commands against it, reporting wall time and the
+peak RSS of each.
+
+    python benchmarks/rss.py --hosts 100000
+    python benchmarks/rss.py --source /path/to/other/checkout
+"""
+
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo_dir)
+
+from arco.metrics import runMeasured  # noqa: E402
+
+commands = {
+    "config": ["config"],
+    "config yaml": ["config", "--format", "yaml"],
+    "export": ["export"],
+    "x true": ["x", "true"],
+    "bundle create": ["bundle", "create", "{tmp}/arco.bundle"],
+    "--bundle x true": ["--bundle", "{tmp}/arco.bundle", "x", "true"],
+}
+
+
+def writeContext(directory: str, hosts: int):
+    groups = ["web", "db", "cache", "worker"]
+    inventory = {
+        "all": {
+            "hosts": {
+                f"host{index:06d}": {
+                    "ansible_host": "10.{}.{}.{}".format(
+                        index // 65536 % 256, index // 256 % 256, index % 256
+                    ),
+                    "ansible_user": "deploy",
+                    "ansible_port": 22,
+                    "group": groups[index % len(groups)],
+                    "labels": {"env": "prod", "region": f"region-{index % 8}"},
+                }
+                for index in range(hosts)
+            }
+        }
+    }
+
+    # JSON is valid YAML and much faster to generate
+    with open(os.path.join(directory, "arco.yml"), "w") as file_:
+        json.dump({"ansible": {"inventory": inventory}}, file_)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--hosts", type=int, default=20000)
+    parser.add_argument("--source", default=repo_dir, help="The arco checkout to run")
+    parser.add_argument("--command", action="append", choices=list(commands))
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="arco-benchmark-")
+    env = dict(os.environ, PYTHONPATH=args.source, HOME=tmp)
+
+    try:
+        writeContext(tmp, args.hosts)
+        os.makedirs(os.path.join(tmp, ".config"))
+        size = os.path.getsize(os.path.join(tmp, "arco.yml"))
+
+        print(f"{args.hosts} hosts, arco.yml {size / 1024 / 1024:.1f} MiB, {args.source}")
+        print(f"{'command':<18} {'wall':>8} {'max rss':>12}  exit")
+
+        for name in args.command or list(commands):
+            argv = [arg.format(tmp=tmp) for arg in commands[name]]
+            result = runMeasured(
+                [sys.executable, "-m", "arco", "--no-discover"] + argv,
+                cwd=tmp,
+                env=env,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+            metrics = result.metrics
+
+            print(
+                f"{name:<18} {metrics['duration_seconds']:>7.2f}s "
+                f"{metrics['max_rss_bytes'] / 1024 / 1024:>8.1f} MiB  "
+                f"{result.returncode:>4}"
+            )
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+import os
+import sys
+import subprocess
+import pytest
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def git(*args, cwd=None) -> str:
+    return subprocess.run(
+        ["git"] + list(args), cwd=cwd, check=True, capture_output=True, text=True
+    ).stdout.strip()
+
+
+def arco(cwd, *args) -> str:
+    """
+    Run the arco CLI in `cwd` without discovery, returns its stdout
+    """
+    config = os.path.join(os.environ["HOME"], ".config")
+    os.makedirs(config, exist_ok=True)
+
+    result = subprocess.run(
+        [sys.executable, "-m", "arco", "--no-discover"] + list(args),
+        cwd=cwd,
+        env=dict(os.environ, PYTHONPATH=root, XDG_CONFIG_HOME=config),
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 0, result.stdout + result.stderr
+
+    return result.stdout
+
+
+@pytest.fixture(autouse=True)
+def git_identity(monkeypatch, tmp_path):
+    # Isolate tests from the user's git configuration
+    monkeypatch.setenv("HOME", str(tmp_path / "home"))
+    monkeypatch.setenv("GIT_CONFIG_NOSYSTEM", "1")
+
+    for kind in ["AUTHOR", "COMMITTER"]:
+        monkeypatch.setenv(f"GIT_{kind}_NAME", "arco")
+        monkeypatch.setenv(f"GIT_{kind}_EMAIL", "arco@localhost")
+
+
+@pytest.fixture
+def remote(tmp_path):
+    """
+    Create a bare repository with one commit on main, returns its path
+    """
+
+    def create(name: str) -> str:
+        path = tmp_path / "remotes" / f"{name}.git"
+        seed = tmp_path / "seeds" / name
+
+        git("init", "--quiet", "--bare", str(path))
+        git("symbolic-ref", "HEAD", "refs/heads/main", cwd=path)
+        git("init", "--quiet", str(seed))
+        (seed / "README").write_text(f"{name}\n")
+        git("add", "README", cwd=seed)
+        git("commit", "--quiet", "-m", "Initial commit", cwd=seed)
+        git("push", "--quiet", str(path), "HEAD:refs/heads/main", cwd=seed)
+
+        return str(path)
+
+    return create
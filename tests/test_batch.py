@@ -0,0 +1,108 @@
+import io
+import shutil
+import threading
+import pytest
+import yaml
+from arco.batch import parseSteps, runBatch, PrefixedStream
+from .conftest import arco
+
+
+def test_parse_lines():
+    steps = parseSteps("""
+        # Deploy
+        arco config --format json
+        x kubectl get pods  # comment
+        ["run", "build", "-j", "2"]
+        """)
+
+    assert [step["command"] for step in steps] == ["config", "x", "run"]
+    assert steps[1]["args"] == ["kubectl", "get", "pods"]
+    assert steps[2]["line"] == "run build -j 2"
+
+
+def test_parse_json():
+    document = '{"steps": ["x true", {"command": "run", "args": "build --force"}]}'
+    steps = parseSteps(document)
+
+    assert steps[1] == {
+        "command": "run",
+        "args": ["build", "--force"],
+        "line": "run build --force",
+    }
+    assert parseSteps('[["x", "echo", 1]]')[0]["args"] == ["echo", "1"]
+
+
+def test_parse_invalid_step():
+    with pytest.raises(ValueError, match="Line 2: Invalid step"):
+        parseSteps("x true\nclone foo\n")
+
+
+def test_prefixed_stream():
+    output = io.StringIO()
+    stream = PrefixedStream("[1] ", threading.Lock(), output)
+    stream.write("a\nb")
+    stream.write("c\n")
+    stream.write("d")
+    stream.flush()
+
+    assert output.getvalue() == "[1] a\n[1] bc\n[1] d\n"
+
+
+@pytest.mark.parametrize(
+    "keep_going, statuses",
+    [(False, ["ok", "failed", "skipped"]), (True, ["ok", "failed", "ok"])],
+)
+def test_fail_fast(keep_going, statuses):
+    steps = [{"line": line} for line in ["ok", "fail", "ok"]]
+    started = []
+
+    def runStep(step, stream):
+        started.append(step["line"])
+        return 0 if step["line"] == "ok" else 3
+
+    results = runBatch(steps, runStep, keep_going=keep_going)
+
+    assert [result["status"] for result in results] == statuses
+    assert results[1]["returncode"] == 3
+    assert len(started) == statuses.count("ok") + 1
+
+
+def test_parallel_steps_prefix_task_output(tmp_path):
+    (tmp_path / "arco.yml").write_text(
+        yaml.safe_dump(
+            {"arco": {"entrypoint": "true", "tasks": {"build": "echo building"}}}
+        )
+    )
+    (tmp_path / "steps.txt").write_text("run build\nx echo hello\n")
+
+    output = arco(tmp_path, "batch", "-j", "2", "steps.txt").splitlines()
+
+    assert "[1] [build] building" in output
+    assert "[2] hello" in output
+    assert not any(line.startswith("[build]") for line in output)
+
+
+@pytest.mark.skipif(
+    not shutil.which("ansible-playbook"), reason="ansible is not installed"
+)
+def test_steps_honour_ansible_shards(tmp_path):
+    hosts = {name: {"ansible_connection": "local"} for name in ["one", "two"]}
+    (tmp_path / "arco.yml").write_text(
+        yaml.safe_dump(
+            {
+                "arco": {"entrypoint": "true"},
+                "ansible": {"shards": 2, "inventory": {"all": {"hosts": hosts}}},
+            }
+        )
+    )
+    (tmp_path / "play.yml").write_text(
+        yaml.safe_dump(
+            [{"hosts": "all", "gather_facts": False, "tasks": [{"ping": None}]}]
+        )
+    )
+    (tmp_path / "steps.txt").write_text("x ansible-playbook play.yml\n")
+
+    output = arco(tmp_path, "batch", "-j", "2", "steps.txt")
+
+    assert "[1] PLAY RECAP (2 shards)" in output
+    assert "[1] [shard 2/2] " in output
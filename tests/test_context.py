@@ -0,0 +1,110 @@
+import os
+import yaml
+import pytest
+from arco.compact import compact, copyTree
+from arco.context import ArcoContext
+
+
+def test_compact_shares_equal_subtrees():
+    tree = compact(
+        {
+            "web1": {"port": 22, "user": "deploy", "tags": ["a", "b"]},
+            "web2": {"port": 22, "user": "deploy", "tags": ["a", "b"]},
+            "db1": {"port": 5432, "user": "deploy", "tags": ["a", "b"]},
+        }
+    )
+
+    assert tree["web1"] == tree["web2"]
+    assert tree["web1"]["tags"] is tree["web2"]["tags"] is tree["db1"]["tags"]
+    assert tree["web1"] is not tree["db1"]
+
+    copied = copyTree(tree)
+    copied["web1"]["tags"].append("c")
+
+    assert copied["web2"]["tags"] == ["a", "b"]
+    assert tree["web1"]["tags"] == ["a", "b"]
+
+
+def test_resolve_is_read_only_and_copies_on_request(tmp_path):
+    app_dir = tmp_path / "app"
+    app_dir.mkdir()
+    (tmp_path / "arco.yml").write_text(
+        yaml.safe_dump(
+            {
+                "ansible": {
+                    "inventory": {
+                        "all": {
+                            "hosts": {
+                                "web1": {"port": 22, "tags": ["a"]},
+                                "web2": {"port": 22, "tags": ["a"]},
+                            }
+                        }
+                    }
+                }
+            }
+        )
+    )
+
+    def resolve(copy=False):
+        context = ArcoContext(
+            cwd=str(tmp_path), app_dir=str(app_dir), discover=False, environ={}
+        )
+        return context, context.resolve(copy=copy)
+
+    context, resolved = resolve()
+    hosts = resolved["ansible"]["inventory"]["all"]["hosts"]
+
+    # Callers share one view of the context
+    assert context.resolve() is resolved
+
+    with pytest.raises(TypeError):
+        hosts["web1"]["port"] = 2222
+
+    with pytest.raises(TypeError):
+        hosts["web1"]["tags"].append("b")
+
+    with pytest.raises(TypeError):
+        resolved["arco"]["name"] = "changed"
+
+    with pytest.raises(TypeError):
+        resolved.pop("ansible")
+
+    _, copied = resolve(copy=True)
+    hosts = copied["ansible"]["inventory"]["all"]["hosts"]
+    hosts["web1"]["port"] = 2222
+    hosts["web1"]["tags"].append("b")
+    copied["arco"]["name"] = "changed"
+
+    assert hosts["web2"] == {"port": 22, "tags": ["a"]}
+
+    # Neither the context nor others sharing the parse cache see any changes
+    for other in [context.resolve(), resolve()[1]]:
+        hosts = other["ansible"]["inventory"]["all"]["hosts"]
+
+        assert hosts["web1"] == {"port": 22, "tags": ["a"]}
+        assert other["arco"]["name"] != "changed"
+
+
+def test_remount_keeps_the_mountpoint(tmp_path):
+    app_dir = tmp_path / "app"
+    app_dir.mkdir()
+    config = tmp_path / "arco.yml"
+    config.write_text(yaml.safe_dump({"stage": "dev"}))
+
+    with ArcoContext(
+        cwd=str(tmp_path), app_dir=str(app_dir), discover=False, environ={}
+    ) as context:
+        mountpoint = context.mount()
+
+        config.write_text(yaml.safe_dump({"stage": "prod", "replicas": 2}))
+        context.reload([str(config)])
+
+        assert context.mount() == mountpoint
+        assert context.resolve()["arco"]["mountpoint"] == mountpoint
+
+        with open(mountpoint) as file_:
+            assert yaml.safe_load(file_)["stage"] == "prod"
+
+        assert "STAGE" in context.env() and "REPLICAS" in context.env()
+
+    assert not os.path.exists(mountpoint)
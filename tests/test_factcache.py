@@ -0,0 +1,82 @@
+import os
+import json
+import time
+import shutil
+import subprocess
+import pytest
+from arco.factcache import (
+    getFactCacheDir,
+    getFactCacheSettings,
+    listCachedHosts,
+    loadCachedFacts,
+    clearCachedFacts,
+)
+
+
+def test_settings_keep_configured_values(tmp_path):
+    arc = {
+        "arco": {"name": "prod", "context_dir": "/srv/prod"},
+        "ansible": {"cache_plugin_timeout": "60"},
+    }
+    settings = getFactCacheSettings(arc, str(tmp_path))
+
+    assert settings["cache_plugin"] == "jsonfile"
+    assert settings["cache_plugin_connection"] == getFactCacheDir(
+        str(tmp_path), "prod", "/srv/prod"
+    )
+    assert settings["cache_plugin_timeout"] == 60
+
+    # Same name, other directory: other cache
+    assert getFactCacheDir(str(tmp_path), "prod", "/srv/other") != getFactCacheDir(
+        str(tmp_path), "prod", "/srv/prod"
+    )
+
+
+def test_list_load_and_clear(tmp_path):
+    directory = tmp_path / "facts"
+    directory.mkdir()
+    (directory / "web1").write_text(json.dumps({"ansible_hostname": "web1"}))
+    (directory / "s1_db1").write_text(
+        json.dumps({"__payload__": json.dumps({"ansible_hostname": "db1"})})
+    )
+
+    old = time.time() - 120
+    os.utime(directory / "web1", (old, old))
+
+    hosts = {entry["host"]: entry for entry in listCachedHosts(str(directory), 60)}
+
+    assert sorted(hosts) == ["db1", "web1"]
+    assert hosts["web1"]["expired"] and not hosts["db1"]["expired"]
+    assert not any(entry["expired"] for entry in listCachedHosts(str(directory), 0))
+
+    assert loadCachedFacts(str(directory), "db1") == {"ansible_hostname": "db1"}
+
+    with pytest.raises(KeyError):
+        loadCachedFacts(str(directory), "missing")
+
+    assert clearCachedFacts(str(directory), ["web1"]) == ["web1"]
+    assert [entry["host"] for entry in listCachedHosts(str(directory))] == ["db1"]
+
+
+@pytest.mark.skipif(not shutil.which("ansible"), reason="ansible is not installed")
+def test_cache_facts_of_localhost(tmp_path):
+    directory = str(tmp_path / "facts")
+    env = dict(
+        os.environ,
+        ANSIBLE_CACHE_PLUGIN="jsonfile",
+        ANSIBLE_CACHE_PLUGIN_CONNECTION=directory,
+        ANSIBLE_CACHE_PLUGIN_TIMEOUT="3600",
+        ANSIBLE_LOCALHOST_WARNING="False",
+        ANSIBLE_INVENTORY_UNPARSED_WARNING="False",
+    )
+
+    subprocess.run(
+        ["ansible", "localhost", "-c", "local", "-m", "setup", "-a", "gather_subset=min"],
+        env=env,
+        check=True,
+        capture_output=True,
+    )
+
+    assert [entry["host"] for entry in listCachedHosts(directory)] == ["localhost"]
+    assert "ansible_hostname" in loadCachedFacts(directory, "localhost")
+    assert clearCachedFacts(directory) == ["localhost"]
@@ -0,0 +1,22 @@
+import pytest
+import yaml
+from arco.filevalues import YAMLLoader, FileValue
+from arco.context import loadLayer
+
+
+def test_file_tag_is_only_known_to_context_files(tmp_path):
+    (tmp_path / "ca.pem").write_text("certificate")
+    (tmp_path / "arco.yml").write_text(
+        "tls:\n  ca: !file ca.pem\n  key: '@file:key.pem'\n"
+    )
+
+    assert yaml.load("ca: !file ca.pem", Loader=YAMLLoader) == {"ca": "@file:ca.pem"}
+
+    with pytest.raises(yaml.constructor.ConstructorError):
+        yaml.safe_load("ca: !file ca.pem")
+
+    layer = loadLayer(str(tmp_path / "arco.yml"), str(tmp_path))
+
+    assert layer["tls"]["ca"] == FileValue(str(tmp_path / "ca.pem"))
+    assert str(layer["tls"]["ca"]) == "certificate"
+    assert layer["tls"]["key"] == FileValue(str(tmp_path / "key.pem"))
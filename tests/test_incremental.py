@@ -0,0 +1,121 @@
+import pytest
+import yaml
+from arco.incremental import normalizeInputs, getFingerprint
+from arco.tasks import normalizeTasks, getTaskGraph, runTaskGraph
+from .conftest import arco
+
+
+def context(name, target="A", **arco):
+    return {"arco": dict(name=name, context_dir=f"/srv/{name}", **arco), "target": target}
+
+
+def test_normalize_inputs():
+    assert normalizeInputs(None) == {"files": [], "context": None}
+    assert normalizeInputs("*.py") == {"files": ["*.py"], "context": None}
+    assert normalizeInputs({"files": ["a"], "context": "target"}) == {
+        "files": ["a"],
+        "context": ["target"],
+    }
+    assert normalizeInputs({"context": []})["context"] == []
+
+
+def test_fingerprint(tmp_path):
+    (tmp_path / "main.tf").write_text("a")
+    inputs = normalizeInputs(["*.tf"])
+    selected = normalizeInputs({"files": ["*.tf"], "context": ["target"]})
+
+    def fingerprint(context, inputs=inputs):
+        return getFingerprint(["make"], inputs, context, str(tmp_path))
+
+    base = fingerprint(context("ctxA"))
+
+    # Values that change on every invocation don't count
+    assert fingerprint(context("ctxA", date="now", mountpoint="/tmp/x")) == base
+
+    # The active context always counts, the whole context by default
+    assert fingerprint(context("ctxB")) != base
+    assert fingerprint(context("ctxA", target="B")) != base
+    assert fingerprint(context("ctxA", target="B"), selected) == fingerprint(
+        context("ctxA", target="B", other=1), selected
+    )
+    assert fingerprint(context("ctxB"), selected) != fingerprint(
+        context("ctxA"), selected
+    )
+
+    (tmp_path / "main.tf").write_text("b")
+    assert fingerprint(context("ctxA")) != base
+
+
+@pytest.fixture
+def project(tmp_path):
+    """
+    A project whose entrypoint logs every run, with the contexts ctxA and ctxB
+    """
+    directory = tmp_path / "project"
+    directory.mkdir()
+    (directory / "deploy.sh").write_text(
+        '#!/bin/sh\necho "deploying $TARGET"\necho "$TARGET" >> runs.log\n'
+    )
+    (directory / "deploy.sh").chmod(0o755)
+    (directory / "arco.yml").write_text(
+        yaml.safe_dump({"arco": {"entrypoint": "./deploy.sh", "inputs": ["deploy.sh"]}})
+    )
+
+    for name in ["ctxA", "ctxB"]:
+        (directory / name).mkdir()
+        (directory / name / "arco.yml").write_text(yaml.safe_dump({"target": name}))
+
+    return directory
+
+
+def runs(project):
+    return (project / "runs.log").read_text().split()
+
+
+def test_run_skips_unchanged_inputs(project):
+    assert "deploying ctxA" in arco(project, "--context", "ctxA", "run")
+    assert "deploying ctxA" in arco(project, "--context", "ctxA", "run")
+    assert runs(project) == ["ctxA"]
+
+    arco(project, "--context", "ctxA", "run", "--force")
+    assert runs(project) == ["ctxA", "ctxA"]
+
+
+def test_run_reruns_for_other_context(project):
+    arco(project, "--context", "ctxA", "run")
+
+    assert "deploying ctxB" in arco(project, "--context", "ctxB", "run")
+    assert runs(project) == ["ctxA", "ctxB"]
+
+
+def test_run_reruns_when_inputs_change(project):
+    arco(project, "--context", "ctxA", "run")
+
+    with open(project / "deploy.sh", "a") as file_:
+        file_.write("true\n")
+
+    arco(project, "--context", "ctxA", "run")
+    assert runs(project) == ["ctxA", "ctxA"]
+
+
+def test_tasks_rerun_for_other_context(tmp_path, capsys):
+    tasks = normalizeTasks(
+        {"deploy": {"command": "echo deploy >> runs.log", "inputs": ["*.sh"]}}
+    )
+    graph = getTaskGraph(tasks, ["deploy"])
+
+    def run(name, force=False):
+        return runTaskGraph(
+            tasks,
+            graph,
+            str(tmp_path),
+            context=context(name),
+            record_dir=str(tmp_path / "records"),
+            force=force,
+        )["deploy"]["status"]
+
+    assert run("ctxA") == "ok"
+    assert run("ctxA") == "cached"
+    assert run("ctxB") == "ok"
+    assert run("ctxA", force=True) == "ok"
+    assert (tmp_path / "runs.log").read_text().split() == ["deploy"] * 3
@@ -0,0 +1,99 @@
+import os
+import yaml
+import arco.kubeconfig
+from arco.kubeconfig import getKubeconfigFiles, discoverKubeconfig
+from arco.context import ArcoContext
+
+
+def kubeconfig(path, current_context=None, contexts=()):
+    path.write_text(
+        yaml.safe_dump(
+            {
+                "current-context": current_context,
+                "contexts": [
+                    {"name": name, "context": {"cluster": cluster, "namespace": name}}
+                    for name, cluster in contexts
+                ],
+                "clusters": [
+                    {"name": cluster, "cluster": {"server": f"https://{cluster}"}}
+                    for _, cluster in contexts
+                ],
+            }
+        )
+    )
+
+
+def test_files_are_relative_to_cwd(tmp_path):
+    environ = {"KUBECONFIG": os.pathsep.join(["a.yml", "", "/etc/b.yml"])}
+
+    assert getKubeconfigFiles(None, environ, "/srv/project") == [
+        "/srv/project/a.yml",
+        "/etc/b.yml",
+    ]
+    assert getKubeconfigFiles("kc.yml", {}, "/srv/project") == ["/srv/project/kc.yml"]
+
+
+def test_first_file_wins(tmp_path):
+    kubeconfig(tmp_path / "a.yml", None, [("dev", "dev-cluster")])
+    kubeconfig(tmp_path / "b.yml", "dev", [("dev", "other"), ("prod", "prod-cluster")])
+    environ = {"KUBECONFIG": os.pathsep.join(["a.yml", "missing.yml", "b.yml"])}
+
+    summary = discoverKubeconfig(environ=environ, cwd=str(tmp_path))
+
+    assert summary["current_context"] == "dev"
+    assert summary["cluster"] == "dev-cluster"
+    assert summary["server"] == "https://dev-cluster"
+    assert summary["contexts"] == ["dev", "prod"]
+
+    assert (
+        discoverKubeconfig(environ={"KUBECONFIG": "missing.yml"}, cwd=str(tmp_path)) == {}
+    )
+
+
+def test_summary_is_cached_until_a_file_changes(tmp_path, monkeypatch):
+    path = tmp_path / "kc.yml"
+    cache_file = str(tmp_path / "cache.json")
+    kubeconfig(path, "dev", [("dev", "dev-cluster")])
+
+    parsed = []
+    parse = arco.kubeconfig.parseKubeconfig
+    monkeypatch.setattr(
+        arco.kubeconfig,
+        "parseKubeconfig",
+        lambda path: parsed.append(path) or parse(path),
+    )
+
+    def discover():
+        return discoverKubeconfig(str(path), cache_file, {})
+
+    assert discover()["current_context"] == "dev"
+    assert discover()["current_context"] == "dev"
+    assert len(parsed) == 1
+
+    kubeconfig(path, "prod", [("prod", "prod-cluster")])
+    os.utime(path, ns=(0, 0))
+
+    assert discover()["current_context"] == "prod"
+    assert len(parsed) == 2
+
+
+def test_context_discovers_its_own_kubeconfig(tmp_path, monkeypatch):
+    project = tmp_path / "project"
+    (project / "ctx").mkdir(parents=True)
+    (project / "arco.yml").write_text(yaml.safe_dump({"arco": {"entrypoint": "true"}}))
+    (project / "ctx" / "arco.yml").write_text(yaml.safe_dump({"kubeconfig": "kc.yml"}))
+    kubeconfig(project / "kc.yml", "ctxA", [("ctxA", "a")])
+    home_config = tmp_path / "home" / ".kube" / "config"
+    home_config.parent.mkdir(parents=True)
+    kubeconfig(home_config, "home", [("home", "h")])
+
+    monkeypatch.chdir("/")
+    context = ArcoContext(
+        cwd=str(project), context="ctx", app_dir=str(tmp_path / "app"), environ={}
+    )
+    resolved = context.resolve()
+
+    assert resolved["kubeconfig"] == "kc.yml"
+    assert resolved["helm"]["kubecontext"] == "ctxA"
+    assert resolved["kubernetes"]["namespace"] == "ctxA"
+    assert str(project / "kc.yml") in context.files()
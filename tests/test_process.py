@@ -0,0 +1,43 @@
+import sys
+import subprocess
+import pytest
+from arco.process import parseDuration, processGroupArguments, Supervisor
+
+
+@pytest.mark.parametrize(
+    "value, seconds",
+    [
+        (None, None),
+        ("", None),
+        (0, None),
+        ("0s", None),
+        (90, 90),
+        (1.5, 1.5),
+        ("90", 90),
+        ("90s", 90),
+        (" 15m ", 900),
+        ("2H", 7200),
+        ("1d", 86400),
+        ("0.5m", 30),
+    ],
+)
+def test_parse_duration(value, seconds):
+    assert parseDuration(value) == seconds
+
+
+@pytest.mark.parametrize("value", ["soon", "10 minutes", "-5", -5, "1w", True])
+def test_parse_invalid_duration(value):
+    with pytest.raises(ValueError):
+        parseDuration(value)
+
+
+def test_supervisor_stops_group_after_timeout():
+    process = subprocess.Popen(
+        [sys.executable, "-c", "import time; time.sleep(30)"], **processGroupArguments()
+    )
+
+    with Supervisor(process, timeout=0.2, grace_period=1) as supervisor:
+        process.wait(timeout=10)
+
+    assert supervisor.timed_out
+    assert process.returncode != 0
@@ -0,0 +1,71 @@
+import os
+from arco.repos import (
+    normalizeRepositories,
+    cloneRepositories,
+    getMirrorPath,
+)
+from .conftest import git
+
+
+def test_normalize_repositories():
+    entries = normalizeRepositories(
+        [
+            "https://example.com/group/code.git",
+            {"url": "git@example.com:group/context", "branch": "dev"},
+            {"repository": "file:///srv/repo.git", "directory": "other"},
+        ]
+    )
+
+    assert [entry["directory"] for entry in entries] == ["code", "context", "other"]
+    assert entries[1]["branch"] == "dev"
+
+
+def test_clone_and_fetch_via_mirror(remote, tmp_path):
+    url = remote("code")
+    directory = str(tmp_path / "clones")
+    mirror_dir = str(tmp_path / "mirrors")
+    entries = normalizeRepositories([url])
+
+    results = cloneRepositories(entries, directory, mirror_dir=mirror_dir)
+
+    assert [result["action"] for result in results] == ["cloned"]
+    assert os.path.isdir(getMirrorPath(url, mirror_dir))
+    assert os.path.isfile(os.path.join(directory, "code", "README"))
+
+    # Clones are dissociated from the mirror
+    alternates = os.path.join(directory, "code", ".git", "objects", "info", "alternates")
+    assert not os.path.exists(alternates)
+
+    results = cloneRepositories(entries, directory, mirror_dir=mirror_dir)
+
+    assert [result["action"] for result in results] == ["fetched"]
+
+    # Lock files are kept apart from the mirrors
+    assert [name for name in os.listdir(mirror_dir) if name.endswith(".lock")] == []
+    assert os.listdir(os.path.join(mirror_dir, "locks"))
+
+
+def test_shallow_clone_skips_mirror(remote, tmp_path):
+    url = f"file://{remote('code')}"
+    directory = str(tmp_path / "clones")
+    mirror_dir = str(tmp_path / "mirrors")
+
+    results = cloneRepositories(
+        normalizeRepositories([url]), directory, mirror_dir=mirror_dir, depth=1
+    )
+
+    assert results[0]["action"] == "cloned", results[0]["error"]
+    assert not os.path.exists(getMirrorPath(url, mirror_dir))
+    assert git("rev-parse", "--is-shallow-repository", cwd=results[0]["path"]) == "true"
+
+
+def test_clone_reports_failures(tmp_path):
+    results = cloneRepositories(
+        normalizeRepositories([str(tmp_path / "missing.git")]),
+        str(tmp_path / "clones"),
+        mirror_dir=str(tmp_path / "mirrors"),
+    )
+
+    assert results[0]["action"] == "failed"
+    assert results[0]["returncode"] != 0
+    assert results[0]["error"]
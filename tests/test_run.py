@@ -0,0 +1,16 @@
+import yaml
+from .conftest import arco
+
+
+def test_options_after_the_first_argument_reach_the_entrypoint(tmp_path):
+    (tmp_path / "entrypoint.sh").write_text('#!/bin/sh\necho "args: $*"\n')
+    (tmp_path / "entrypoint.sh").chmod(0o755)
+    (tmp_path / "arco.yml").write_text(
+        yaml.safe_dump({"arco": {"entrypoint": "./entrypoint.sh"}})
+    )
+
+    output = arco(tmp_path, "run", "build", "--timeout", "5", "-j", "4", "-w", "--force")
+    assert "args: build --timeout 5 -j 4 -w --force" in output
+
+    # Options before the first argument are arco's
+    assert "args: build" in arco(tmp_path, "run", "--timeout", "5", "-j", "2", "build")
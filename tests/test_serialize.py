@@ -0,0 +1,66 @@
+from benedict import benedict
+from arco.serialize import flattenEnvironment
+
+context = {
+    "foo": {
+        "bar": "",
+        "baz": None,
+        "myKey": 1,
+        "zero": 0,
+        "off": False,
+        "empty": {"nested": {}, "list": []},
+        "list": [1, None, "", [], {"a": None, "bB": 3}, [5, [None, 6]], 2],
+    },
+    "empty": {},
+    "none": None,
+    "top": [[1, 2], {"x": "y"}],
+}
+
+
+def baseline(data):
+    """
+    The environment arco exported with benedict's clean() + standardize()
+    + keypaths(), minus the empty values clean() didn't reach
+    """
+    flat = benedict(data, keypath_separator=".")
+    flat.clean(strings=True, collections=True)
+    flat.standardize()
+
+    for keypath in flat.keypaths(indexes=True):
+        value = flat[keypath]
+
+        if isinstance(value, (dict, list)) or value is None or value == "":
+            continue
+
+        yield keypath.replace(".", "_").upper(), value
+
+
+def test_flatten_environment_matches_benedict():
+    assert sorted(flattenEnvironment(context)) == sorted(baseline(context))
+
+
+def test_flatten_environment_drops_nested_empty_values():
+    environment = dict(flattenEnvironment(context))
+
+    assert "FOO_BAR" not in environment
+    assert "FOO_BAZ" not in environment
+    assert not any(key.startswith("FOO_EMPTY") for key in environment)
+    assert environment["FOO_ZERO"] == 0
+    assert environment["FOO_OFF"] is False
+
+
+def test_flatten_environment_keeps_list_indices():
+    environment = dict(flattenEnvironment(context))
+
+    assert environment["FOO_LIST[0]"] == 1
+    assert environment["FOO_LIST[4]_B_B"] == 3
+    assert environment["FOO_LIST[5][1][1]"] == 6
+    assert environment["FOO_LIST[6]"] == 2
+    assert "FOO_LIST[1]" not in environment
+
+
+def test_flatten_environment_does_not_modify_data():
+    data = {"myKey": {"a": None, "b": [1, ""]}}
+    list(flattenEnvironment(data))
+
+    assert data == {"myKey": {"a": None, "b": [1, ""]}}
@@ -0,0 +1,72 @@
+import pytest
+from arco.shards import stripLimit, parseHosts, splitHosts, parseRecap, mergeReturncodes
+
+list_hosts = """
+playbook: site.yml
+
+  play #1 (web): web\tTAGS: []
+    pattern: ['web']
+    hosts (2):
+      web1
+      web2
+
+  play #2 (all): all\tTAGS: []
+    pattern: ['all']
+    hosts (3):
+      \x1b[0;32mdb1\x1b[0m
+      web1
+      web2
+"""
+
+recap = """
+TASK [ping] ********************************************************************
+ok: [web1]
+
+PLAY RECAP *********************************************************************
+web1  : ok=2 changed=1 unreachable=0 failed=0 skipped=0 rescued=0 ignored=0
+\x1b[0;31mdb1\x1b[0m : ok=0 changed=0 unreachable=1 failed=0 skipped=0 rescued=0 ignored=0
+"""
+
+
+def test_strip_limit():
+    args = ["site.yml", "--limit", "web", "-l", "db", "--limit=x", "-lweb", "-v"]
+
+    assert stripLimit(args) == ["site.yml", "-v"]
+
+
+def test_parse_hosts():
+    assert parseHosts(list_hosts) == ["web1", "web2", "db1"]
+
+
+@pytest.mark.parametrize(
+    "count, sizes", [(1, [5]), (2, [3, 2]), (3, [2, 2, 1]), (10, [1] * 5), (0, [5])]
+)
+def test_split_hosts(count, sizes):
+    hosts = [f"host{index}" for index in range(5)]
+    shards = splitHosts(hosts, count)
+
+    assert [len(shard) for shard in shards] == sizes
+    assert sum(shards, []) == hosts
+
+
+def test_parse_recap():
+    parsed = parseRecap(recap)
+
+    assert list(parsed) == ["web1", "db1"]
+    assert parsed["web1"]["changed"] == 1
+    assert parsed["db1"]["unreachable"] == 1
+
+
+@pytest.mark.parametrize(
+    "returncodes, expected",
+    [
+        ([], 0),
+        ([0, 0], 0),
+        ([0, 4, 2], 2),
+        ([4, 0], 4),
+        ([2, 250, 1], 250),
+        ([4, 1], 1),
+    ],
+)
+def test_merge_returncodes(returncodes, expected):
+    assert mergeReturncodes(returncodes) == expected
@@ -0,0 +1,64 @@
+import pytest
+from arco.tasks import normalizeTasks, getTaskGraph
+
+
+def test_normalize_tasks():
+    tasks = normalizeTasks(
+        {
+            "lint": "flake8",
+            "build": {"command": ["make"], "depends": "lint", "timeout": "10m"},
+        }
+    )
+
+    assert tasks["lint"] == {
+        "command": "flake8",
+        "depends": [],
+        "group": None,
+        "inputs": None,
+        "outputs": None,
+        "timeout": None,
+    }
+    assert tasks["build"]["depends"] == ["lint"]
+    assert tasks["build"]["timeout"] == 600
+
+    with pytest.raises(ValueError):
+        normalizeTasks({"build": {"command": "make", "timeout": "soon"}})
+
+
+def test_graph_is_topologically_ordered():
+    tasks = normalizeTasks(
+        {
+            "deploy": {"command": "deploy", "depends": ["build", "test"]},
+            "test": {"command": "test", "depends": ["build"]},
+            "build": "build",
+            "docs": "docs",
+        }
+    )
+
+    graph = getTaskGraph(tasks, ["deploy"])
+
+    assert list(graph) == ["build", "test", "deploy"]
+    assert graph["deploy"] == ["build", "test"]
+
+
+@pytest.mark.parametrize(
+    "tasks, message",
+    [
+        (
+            {
+                "a": {"command": "a", "depends": "b"},
+                "b": {"command": "b", "depends": "a"},
+            },
+            "Dependency cycle: a -> b -> a",
+        ),
+        ({"a": {"command": "a", "depends": "a"}}, "Dependency cycle: a -> a"),
+        ({"a": {"command": "a", "depends": "b"}}, "Task 'a' depends on unknown task 'b'"),
+        ({"a": {"depends": []}}, "Task 'a' has no command"),
+    ],
+)
+def test_graph_errors(tasks, message):
+    with pytest.raises(ValueError, match=message):
+        getTaskGraph(normalizeTasks(tasks), ["a"])
+
+    with pytest.raises(ValueError, match="Unknown task 'x'"):
+        getTaskGraph(normalizeTasks(tasks), ["x"])
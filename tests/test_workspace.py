@@ -0,0 +1,132 @@
+import os
+import pytest
+from arco.repos import (
+    findRepositories,
+    getRepositoryRoot,
+    getRepositoryStatus,
+    commitRepository,
+    pushRepository,
+    mapRepositories,
+)
+from .conftest import git
+
+
+@pytest.fixture
+def workspace(remote, tmp_path):
+    """
+    Clones of three remotes: in the root, a group below it and in .arco
+    """
+    root = tmp_path / "workspace"
+    paths = {
+        "a": root / "a",
+        "b": root / "group" / "b",
+        "c": root / ".arco" / "c",
+    }
+
+    for name, path in paths.items():
+        git("clone", "--quiet", remote(name), str(path))
+
+    return {name: str(path) for name, path in paths.items()}
+
+
+def test_find_repositories(workspace, tmp_path):
+    root = str(tmp_path / "workspace")
+    nested = os.path.join(workspace["a"], "vendor", "nested")
+    git("init", "--quiet", nested)
+
+    found = findRepositories([root, os.path.join(root, ".arco")])
+
+    # Hidden directories are only searched as roots, repositories not for nested ones
+    assert found == sorted(os.path.realpath(path) for path in workspace.values())
+    assert findRepositories([root], depth=1) == [os.path.realpath(workspace["a"])]
+
+
+def test_repository_root(workspace):
+    subdir = os.path.join(workspace["a"], "sub")
+    os.makedirs(subdir)
+
+    assert getRepositoryRoot(subdir) == os.path.realpath(workspace["a"])
+    assert getRepositoryRoot("/") is None
+
+
+def test_status(workspace):
+    path = workspace["a"]
+    status = getRepositoryStatus(path)
+
+    assert status["branch"] == "main"
+    assert status["upstream"] == "origin/main"
+    assert (status["ahead"], status["behind"], status["changed"]) == (0, 0, 0)
+
+    with open(os.path.join(path, "README"), "a") as file_:
+        file_.write("changed\n")
+
+    with open(os.path.join(path, "new"), "w") as file_:
+        file_.write("untracked\n")
+
+    git("commit", "--quiet", "-m", "Local", "--allow-empty", cwd=path)
+
+    status = getRepositoryStatus(path)
+
+    assert (status["ahead"], status["changed"], status["untracked"]) == (1, 1, 1)
+
+
+def test_status_fetch(workspace, tmp_path):
+    other = str(tmp_path / "other")
+    git("clone", "--quiet", git("remote", "get-url", "origin", cwd=workspace["a"]), other)
+    git("commit", "--quiet", "--allow-empty", "-m", "Remote", cwd=other)
+    git("push", "--quiet", cwd=other)
+
+    assert getRepositoryStatus(workspace["a"])["behind"] == 0
+    assert getRepositoryStatus(workspace["a"], fetch=True)["behind"] == 1
+
+
+def test_status_error(tmp_path):
+    status = getRepositoryStatus(str(tmp_path))
+
+    assert status["returncode"] != 0
+    assert status["branch"] is None
+    assert status["error"]
+
+
+def test_commit_and_push(workspace):
+    with open(os.path.join(workspace["b"], "README"), "a") as file_:
+        file_.write("changed\n")
+
+    paths = list(workspace.values())
+    results = mapRepositories(commitRepository, paths, jobs=2, message="Sync")
+
+    assert [result["action"] for result in results] == ["clean", "committed", "clean"]
+    assert git("log", "-1", "--format=%s", cwd=workspace["b"]) == "Sync"
+
+    results = mapRepositories(pushRepository, paths, jobs=2)
+
+    assert [result["action"] for result in results] == [
+        "up-to-date",
+        "pushed",
+        "up-to-date",
+    ]
+    assert getRepositoryStatus(workspace["b"])["ahead"] == 0
+
+
+def test_push_rejected(workspace, tmp_path):
+    path = workspace["a"]
+    other = str(tmp_path / "other")
+    git("clone", "--quiet", git("remote", "get-url", "origin", cwd=path), other)
+    git("commit", "--quiet", "--allow-empty", "-m", "Remote", cwd=other)
+    git("push", "--quiet", cwd=other)
+    git("commit", "--quiet", "--allow-empty", "-m", "Local", cwd=path)
+    git("fetch", "--quiet", cwd=path)
+
+    result = pushRepository(path)
+
+    assert result["action"] == "failed"
+    assert result["returncode"] != 0
+    assert "rejected" in result["error"]
+
+
+def test_push_without_remote(tmp_path):
+    path = str(tmp_path / "local")
+    git("init", "--quiet", path)
+    git("commit", "--quiet", "--allow-empty", "-m", "Initial commit", cwd=path)
+
+    assert pushRepository(path)["action"] == "failed"